@@ -0,0 +1,514 @@
+"""
+异步执行模式 - 在同一个事件循环中完成论文过滤、下载、解析、总结和邮件发送
+
+开启方式：GENERAL_CONFIG["async_mode"] = True。
+网络I/O（LLM请求、PDF/HTML下载、SMTP）全部以协程方式并发等待；
+PDF解析等CPU密集型操作和arXiv API分页（arxiv库只提供同步接口）放到线程中执行。
+"""
+import asyncio
+import os
+from urllib.parse import urlparse
+
+import httpx
+from loguru import logger
+
+from config import GENERAL_CONFIG, USERS_CONFIG
+from paper_cache import get_paper_cache
+from resource_limits import get_limit
+from llm_client import create_async_llm_client, achat_completion
+from database import get_db
+from prefilter import prefilter_papers
+from downloader import download_file_async
+from mailer import queue_report
+import telemetry
+from main import (
+    CHUNK_SUMMARY_TEMPERATURE,
+    SUMMARY_TEMPERATURE,
+    accumulate_cache_stats,
+    add_token_stats,
+    build_batch_filter_prompt,
+    build_chunk_prompts,
+    build_filtered_papers_appendix,
+    build_full_report,
+    build_html_url,
+    build_paper_report,
+    build_reduce_text,
+    build_summary_prompt,
+    commit_fetch_progress,
+    evict_caches,
+    fetch_paper_index,
+    finalize_paper_text,
+    get_cached_paper_text,
+    interest_cache_key,
+    lookup_interest_verdict,
+    lookup_summary,
+    new_cache_stats,
+    normalize_pdf_url,
+    parse_batch_filter_answer,
+    parse_interest_answer,
+    read_html_text,
+    read_pdf_text,
+    record_user_usage,
+    save_user_report,
+    select_user_papers,
+    split_paper_chunks,
+    split_token_stats,
+    summary_cache_key,
+    token_stats_from_usage,
+    use_map_reduce,
+)
+
+
+class AsyncRunContext:
+    """一次异步运行中共享的客户端和并发限制
+
+    LLM请求由共享限流器统一限速；下载请求按目标主机分别限流，避免对同一站点并发过高。
+    多个用户同时处理同一篇论文时按缓存键加锁，只做一次下载、解析或LLM调用，其余用户等待后命中缓存。
+    """
+
+    def __init__(self):
+        self.llm_client = create_async_llm_client()
+        self.http_client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+        self._host_semaphores = {}
+        self._key_locks = {}
+
+    def host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """获取指定URL所属主机的信号量"""
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(get_limit("download"))
+        return self._host_semaphores[host]
+
+    def key_lock(self, kind: str, key):
+        """获取指定类型（text/filter/summary）缓存键的锁，键为None时返回不与其他调用方共享的锁"""
+        if key is None:
+            return asyncio.Lock()
+        if (kind, key) not in self._key_locks:
+            self._key_locks[(kind, key)] = asyncio.Lock()
+        return self._key_locks[(kind, key)]
+
+    async def aclose(self):
+        """关闭HTTP连接池"""
+        await self.http_client.aclose()
+        await self.llm_client.close()
+
+
+async def download_pdf_async(ctx, url, filename, max_retries=3):
+    """异步下载PDF文件，带有重试、断点续传和条件请求"""
+    url = normalize_pdf_url(url)
+    logger.info(f"尝试下载: {url}")
+
+    with telemetry.stage("pdf_download", url) as span:
+        downloaded = await download_file_async(ctx.http_client, url, filename, max_retries,
+                                               semaphore=ctx.host_semaphore(url))
+        if not downloaded:
+            span.outcome = "failed"
+    return downloaded
+
+
+async def download_pdf_and_extract_text_async(ctx, paper, user_dir):
+    """异步下载PDF并在线程中提取文本"""
+    arxiv_id = paper.get('arxiv_id')
+    if arxiv_id:
+        cache = get_paper_cache()
+        pdf_path = cache.pdf_path(arxiv_id)
+        if cache.has_pdf(arxiv_id):
+            logger.info(f"PDF缓存命中: {arxiv_id}")
+            telemetry.record("pdf_download", arxiv_id, outcome="cache_hit")
+            downloaded = True
+        else:
+            downloaded = await download_pdf_async(ctx, paper['pdf_url'], pdf_path)
+    else:
+        pdf_path = f"{user_dir}/{paper['title']}.pdf"
+        downloaded = await download_pdf_async(ctx, paper['pdf_url'], pdf_path)
+
+    if not downloaded:
+        logger.error(f"错误: 无法下载 {paper['title']} 的PDF")
+        return ""
+
+    text = await asyncio.to_thread(read_pdf_text, pdf_path, paper)
+    if not text:
+        logger.warning(f"警告: 无法从 {paper['title']} 提取文本")
+    return text
+
+
+async def download_html_and_extract_text_async(ctx, paper, user_dir):
+    """异步下载HTML版本并在线程中提取文本"""
+    try:
+        html_url = build_html_url(paper)
+        logger.info(f"尝试下载HTML: {html_url}")
+
+        async with ctx.host_semaphore(html_url):
+            with telemetry.stage("html_download", html_url) as span:
+                response = await ctx.http_client.get(html_url)
+                span.bytes = len(response.content)
+                if response.status_code != 200:
+                    span.outcome = "failed"
+
+        if response.status_code == 200:
+            return await asyncio.to_thread(read_html_text, response.content, paper, user_dir)
+        logger.error(f"HTML下载失败: HTTP状态码 {response.status_code}")
+        return ""
+    except Exception as e:
+        logger.error(f"HTML处理错误: {str(e)}")
+        return ""
+
+
+async def get_paper_text_async(ctx, paper, user_dir):
+    """尝试多种方式获取论文文本内容（异步版本），返回值同 get_paper_text"""
+    async with ctx.key_lock("text", paper.get('arxiv_id')):
+        cached_text = await asyncio.to_thread(get_cached_paper_text, paper)
+        if cached_text:
+            return cached_text, False
+
+        text = await download_pdf_and_extract_text_async(ctx, paper, user_dir)
+        if not text or len(text) < 1000:  # 内容太少可能是提取失败
+            logger.info(f"PDF提取失败或内容太少，尝试HTML方式")
+            text = await download_html_and_extract_text_async(ctx, paper, user_dir)
+
+        return await asyncio.to_thread(finalize_paper_text, paper, text)
+
+
+async def gpt_check_interest_async(ctx, abstract, interest_filter_prompt, cache_key=None):
+    """使用GPT判断用户是否对论文感兴趣（异步版本）
+
+    Returns:
+        tuple: (bool, dict) 第一个元素表示是否感兴趣，第二个元素为token使用统计
+    """
+    prompt = interest_filter_prompt.format(abstract=abstract)
+    try:
+        content, usage = await achat_completion(ctx.llm_client, prompt, 0.3, "filter")
+        token_stats = token_stats_from_usage(usage)
+        answer = content.strip().lower()
+        logger.info(f"兴趣判断结果: {answer}")
+        is_interested = parse_interest_answer(answer)
+        if cache_key is not None:
+            await asyncio.to_thread(
+                lambda: get_db().save_filter_verdict(*cache_key, is_interested, answer,
+                                                     token_stats['prompt_tokens'],
+                                                     token_stats['completion_tokens'])
+            )
+        return is_interested, token_stats
+    except Exception as e:
+        logger.error(f"兴趣判断失败: {str(e)}，默认为感兴趣")
+        return True, {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+
+
+async def filter_single_paper_async(ctx, paper, interest_filter_prompt):
+    """对单篇论文做兴趣过滤，优先使用跨用户共享的过滤结果缓存"""
+    cache_key = interest_cache_key(paper, interest_filter_prompt)
+    async with ctx.key_lock("filter", cache_key):
+        verdict = await asyncio.to_thread(lookup_interest_verdict, cache_key)
+        if verdict is None:
+            verdict = await gpt_check_interest_async(ctx, paper['abstract'], interest_filter_prompt, cache_key)
+        return verdict
+
+
+async def gpt_check_interest_batch_async(ctx, papers, interest_filter_prompt, cache_keys):
+    """在一次请求中判断多篇论文的兴趣度（异步版本），返回值同gpt_check_interest_batch"""
+    prompt = build_batch_filter_prompt(papers, interest_filter_prompt)
+    try:
+        content, usage = await achat_completion(ctx.llm_client, prompt, 0.3, "filter_batch")
+        token_stats = token_stats_from_usage(usage)
+    except Exception as e:
+        logger.error(f"批量兴趣判断失败: {str(e)}，改为逐篇判断")
+        return [(None, {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}) for _ in papers]
+
+    verdicts = parse_batch_filter_answer(content, len(papers))
+    shares = split_token_stats(token_stats, len(papers))
+    results = []
+    for cache_key, verdict, share in zip(cache_keys, verdicts, shares):
+        if verdict is None:
+            results.append((None, share))
+            continue
+        is_interested, answer = verdict
+        if cache_key is not None:
+            await asyncio.to_thread(
+                lambda key=cache_key, v=is_interested, a=answer, t=share: get_db().save_filter_verdict(
+                    *key, v, a, t['prompt_tokens'], t['completion_tokens'])
+            )
+        results.append((is_interested, share))
+    return results
+
+
+async def filter_paper_batch_async(ctx, batch, interest_filter_prompt):
+    """批量过滤一组论文：缓存未命中的合并为一次请求，缺失的结果逐篇重试"""
+    results = [None] * len(batch)
+    pending = []
+    claimed = []
+    deferred = []
+    # 只对没有被其他用户占用的论文发请求，同时持有多把锁时不等待，避免批次之间互相等待
+    for position, paper in enumerate(batch):
+        cache_key = interest_cache_key(paper, interest_filter_prompt)
+        lock = ctx.key_lock("filter", cache_key)
+        if lock.locked():
+            deferred.append((position, paper))
+            continue
+        await lock.acquire()
+        claimed.append(lock)
+        verdict = await asyncio.to_thread(lookup_interest_verdict, cache_key)
+        if verdict is not None:
+            results[position] = verdict
+        else:
+            pending.append((position, paper, cache_key))
+
+    try:
+        if len(pending) == 1:
+            # 只有一篇未命中时用单篇提示词，与同步模式一致
+            position, paper, cache_key = pending[0]
+            results[position] = await gpt_check_interest_async(ctx, paper['abstract'], interest_filter_prompt,
+                                                               cache_key)
+        elif pending:
+            batch_verdicts = await gpt_check_interest_batch_async(
+                ctx, [paper for _, paper, _ in pending], interest_filter_prompt,
+                [cache_key for _, _, cache_key in pending]
+            )
+            for (position, paper, cache_key), (is_interested, share) in zip(pending, batch_verdicts):
+                if is_interested is None:
+                    is_interested, token_stats = await gpt_check_interest_async(
+                        ctx, paper['abstract'], interest_filter_prompt, cache_key)
+                    share = add_token_stats(token_stats, share)
+                results[position] = (is_interested, share)
+    finally:
+        for lock in claimed:
+            lock.release()
+
+    # 其他用户正在判断的论文，等其完成后命中缓存
+    for position, paper in deferred:
+        results[position] = await filter_single_paper_async(ctx, paper, interest_filter_prompt)
+    return results
+
+
+async def gpt_summarize_async(ctx, text, custom_prompt=None, cache_key=None):
+    """使用GPT对论文进行总结（异步版本）
+
+    Returns:
+        tuple: (str, dict) 第一个元素为总结内容，第二个元素为token使用统计
+    """
+    prompt, text = await asyncio.to_thread(build_summary_prompt, text, custom_prompt)
+
+    logger.info(f"Requesting GPT to summarize: {text[:100]}...")
+    content, usage = await achat_completion(ctx.llm_client, prompt, SUMMARY_TEMPERATURE, "summary")
+    token_stats = token_stats_from_usage(usage)
+    logger.info(f"Response length: {len(content)}")
+    if cache_key is not None:
+        await asyncio.to_thread(
+            lambda: get_db().save_summary(*cache_key, content, token_stats['prompt_tokens'],
+                                          token_stats['completion_tokens'])
+        )
+    return content, token_stats
+
+
+async def gpt_summarize_chunk_async(ctx, prompt, cache_key=None):
+    """map阶段：总结单个分块（异步版本），命中分块缓存时直接返回"""
+    async with ctx.key_lock("summary", cache_key):
+        cached = await asyncio.to_thread(lookup_summary, cache_key)
+        if cached is not None:
+            return cached
+
+        content, usage = await achat_completion(ctx.llm_client, prompt, CHUNK_SUMMARY_TEMPERATURE, "chunk")
+        token_stats = token_stats_from_usage(usage)
+        if cache_key is not None:
+            await asyncio.to_thread(
+                lambda: get_db().save_summary(*cache_key, content, token_stats['prompt_tokens'],
+                                              token_stats['completion_tokens'])
+            )
+        return content, token_stats
+
+
+async def gpt_summarize_map_reduce_async(ctx, paper, text, custom_prompt=None, cache_key=None):
+    """map-reduce总结（异步版本），各分块并发总结后做一次reduce
+
+    Returns:
+        tuple: (str, dict) 总结内容和两阶段合计的token使用统计
+    """
+    chunks = await asyncio.to_thread(split_paper_chunks, text)
+    prompts, chunk_keys = build_chunk_prompts(paper, chunks)
+    if cache_key is None:
+        chunk_keys = [None] * len(chunks)
+    logger.info(f"使用map-reduce总结: {paper['title']}，共 {len(chunks)} 块")
+
+    results = await asyncio.gather(*[
+        gpt_summarize_chunk_async(ctx, prompt, chunk_key) for prompt, chunk_key in zip(prompts, chunk_keys)
+    ])
+
+    map_stats = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    for _, chunk_stats in results:
+        map_stats = add_token_stats(map_stats, chunk_stats)
+
+    summary, reduce_stats = await gpt_summarize_async(
+        ctx, build_reduce_text([content for content, _ in results]), custom_prompt, cache_key
+    )
+    return summary, add_token_stats(reduce_stats, map_stats)
+
+
+async def summarize_single_paper_async(ctx, paper, user_dir, custom_prompt=None):
+    """下载、解析并总结单篇论文（异步版本）
+
+    Returns:
+        tuple: (summary, token_stats, error)
+    """
+    with telemetry.stage("paper", paper.get('arxiv_id') or paper['title']) as span:
+        try:
+            cache_key = summary_cache_key(paper, custom_prompt)
+            async with ctx.key_lock("summary", cache_key):
+                cached = await asyncio.to_thread(lookup_summary, cache_key)
+                if cached is not None:
+                    span.outcome = "cache_hit"
+                    summary, token_stats = cached
+                    return summary, token_stats, None
+
+                text, from_abstract = await get_paper_text_async(ctx, paper, user_dir)
+                if from_abstract:
+                    cache_key = None
+                if await asyncio.to_thread(use_map_reduce, text, custom_prompt):
+                    summary, token_stats = await gpt_summarize_map_reduce_async(ctx, paper, text,
+                                                                                custom_prompt, cache_key)
+                else:
+                    summary, token_stats = await gpt_summarize_async(ctx, text, custom_prompt, cache_key)
+                return summary, token_stats, None
+        except Exception as e:
+            span.outcome = "error"
+            logger.error(f"处理论文失败: {paper['title']}，错误: {str(e)}")
+            return None, None, str(e)
+
+
+async def process_user_async(ctx, user_config, paper_index):
+    """处理单个用户的论文过滤和报告生成（异步版本）"""
+    user_name = user_config["name"]
+    user_email = user_config["email"]
+    custom_prompt = user_config.get("custom_prompt", None)
+    interest_filter_prompt = user_config.get("interest_filter_prompt", None)
+
+    logger.info(f"开始处理用户: {user_name}")
+    telemetry.set_user(user_name)
+
+    filter_input_tokens = 0
+    filter_output_tokens = 0
+    generate_input_tokens = 0
+    generate_output_tokens = 0
+    filter_cache_stats = new_cache_stats()
+    generate_cache_stats = new_cache_stats()
+
+    user_dir = f"temp/{user_name.replace(' ', '_')}"
+    os.makedirs(user_dir, exist_ok=True)
+
+    papers = select_user_papers(paper_index, user_config["arxiv_categories"])
+    papers_fetched = len(papers)
+    if not papers:
+        logger.info(f"用户 {user_name} 没有找到新论文")
+        return
+
+    filtered_out_papers = []
+
+    # 第一步：本地预过滤（CPU计算，放到线程中执行）
+    prefilter_profile = user_config.get("prefilter", None)
+    if prefilter_profile:
+        papers, prefiltered_out_papers = await asyncio.to_thread(prefilter_papers, papers, prefilter_profile)
+        filtered_out_papers.extend(prefiltered_out_papers)
+
+    # 第二步：兴趣过滤，所有请求同时发出，由LLM信号量控制实际并发
+    if interest_filter_prompt and papers:
+        logger.info(f"开始使用兴趣过滤（异步模式），共 {len(papers)} 篇论文待过滤")
+        batch_size = max(1, int(user_config.get("filter_batch_size", 1)))
+        if batch_size > 1:
+            batches = [papers[start:start + batch_size] for start in range(0, len(papers), batch_size)]
+            batch_results = await asyncio.gather(*[
+                filter_paper_batch_async(ctx, batch, interest_filter_prompt) for batch in batches
+            ])
+            verdicts = [verdict for batch in batch_results for verdict in batch]
+        else:
+            verdicts = await asyncio.gather(*[
+                filter_single_paper_async(ctx, paper, interest_filter_prompt)
+                for paper in papers
+            ])
+        filtered_papers = []
+        for paper, (is_interested, token_stats) in zip(papers, verdicts):
+            filter_input_tokens += token_stats['prompt_tokens']
+            filter_output_tokens += token_stats['completion_tokens']
+            accumulate_cache_stats(filter_cache_stats, token_stats)
+            if is_interested:
+                filtered_papers.append(paper)
+            else:
+                filtered_out_papers.append(paper)
+
+        papers = filtered_papers
+        logger.info(f"兴趣过滤完成，剩余 {len(papers)} 篇论文，过滤掉 {len(filtered_out_papers)} 篇论文")
+
+    papers_filtered_count = len(papers)
+    if not papers:
+        logger.info(f"用户 {user_name} 经过兴趣过滤后没有感兴趣的论文")
+        record_user_usage(user_config, filter_input_tokens, filter_output_tokens, 0, 0,
+                          papers_fetched, 0, 0, filter_cache_stats)
+        if filtered_out_papers:
+            filtered_appendix = build_filtered_papers_appendix(filtered_out_papers)
+            await asyncio.to_thread(queue_report, user_name, user_email, filtered_appendix)
+        return
+
+    # 第三步：硬截断
+    max_papers = GENERAL_CONFIG.get("max_papers_per_user", None)
+    if max_papers is not None and max_papers > 0:
+        papers = papers[:max_papers]
+        logger.info(f"应用硬截断，用户 {user_name} 最多处理 {max_papers} 篇论文")
+
+    # 第四步：并发下载、解析和总结，gather保证结果顺序与论文顺序一致
+    results = await asyncio.gather(*[
+        summarize_single_paper_async(ctx, paper, user_dir, custom_prompt)
+        for paper in papers
+    ])
+
+    report = []
+    papers_processed_count = 0
+    for paper, (summary, token_stats, error) in zip(papers, results):
+        if error is not None:
+            report.append(f"处理论文失败: {paper['title']}，错误: {error}")
+            continue
+        generate_input_tokens += token_stats['prompt_tokens']
+        generate_output_tokens += token_stats['completion_tokens']
+        accumulate_cache_stats(generate_cache_stats, token_stats)
+        papers_processed_count += 1
+        report.append(build_paper_report(paper, summary))
+
+    record_user_usage(user_config, filter_input_tokens, filter_output_tokens,
+                      generate_input_tokens, generate_output_tokens,
+                      papers_fetched, papers_filtered_count, papers_processed_count,
+                      filter_cache_stats, generate_cache_stats)
+
+    if report:
+        full_report = build_full_report(report, filtered_out_papers)
+        await asyncio.to_thread(queue_report, user_name, user_email, full_report)
+        report_file = save_user_report(user_dir, full_report)
+        logger.success(f"用户 {user_name} 的报告已写入发件箱并保存到 {report_file}")
+
+
+async def daily_job_async():
+    """每日任务（异步版本）：为所有配置的用户处理论文"""
+    os.makedirs('temp', exist_ok=True)
+
+    await asyncio.to_thread(evict_caches)
+
+    logger.info(f"开始每日任务（异步模式），共有 {len(USERS_CONFIG)} 个用户")
+
+    # arxiv库只提供同步接口，放到线程中执行
+    paper_index, fetch_progress = await asyncio.to_thread(fetch_paper_index, USERS_CONFIG)
+
+    # 多个用户并发处理，共享同一个上下文中的下载限流和LLM限流器
+    user_semaphore = asyncio.Semaphore(max(1, GENERAL_CONFIG.get("max_parallel_users", 4)))
+    failed_users = []
+
+    async def run_user(user_config):
+        async with user_semaphore:
+            try:
+                await process_user_async(ctx, user_config, paper_index)
+            except Exception as e:
+                failed_users.append(user_config)
+                logger.error(f"处理用户 {user_config['name']} 时发生错误: {str(e)}")
+
+    ctx = AsyncRunContext()
+    try:
+        await asyncio.gather(*[run_user(user_config) for user_config in USERS_CONFIG])
+    finally:
+        await ctx.aclose()
+
+    await asyncio.to_thread(commit_fetch_progress, fetch_progress, failed_users)
+    logger.success("所有用户处理完成")
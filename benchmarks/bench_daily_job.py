@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+端到端基准测试
+启动本地模拟的arXiv、论文下载、LLM和SMTP服务，用 N 个用户 × M 篇论文完整运行一次 daily_job，
+输出总耗时、峰值内存、各服务收到的请求数和各阶段耗时
+"""
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import tempfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 基准脚本位于 benchmarks/ 下，被测模块在上一级目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fake_servers import FakeCorpus, FakeHTTPServer, FakeSMTPServer, LLMBehavior, start_in_thread
+
+BENCH_PROMPT_TEMPLATE = """请用中文总结下列论文，输出创新点、方法、实验和结论。
+
+论文原文内容如下：
+{text}"""
+
+BENCH_FILTER_PROMPT = """请判断用户是否会对下面这篇论文感兴趣。
+
+用户研究兴趣：{interest}
+
+论文摘要：
+{{abstract}}
+
+请仅回答"是"或"否"。"""
+
+
+def build_config(args, http_base: str, smtp_port: int) -> types.ModuleType:
+    """构建指向模拟服务的配置模块，替代项目根目录下的 config.py"""
+    config = types.ModuleType("config")
+    config.AI_CONFIG = {
+        "api_key": "bench",
+        "base_url": f"{http_base}/v1",
+        "model": "bench-model",
+        "stream": not args.no_stream,
+        "max_concurrency": args.llm_concurrency,
+        "max_retries": 8,
+    }
+    config.EMAIL_SERVER_CONFIG = {
+        "sender": "bench@localhost",
+        "password": "bench",
+        "smtp_server": "127.0.0.1",
+        "smtp_port": smtp_port,
+        "use_tls": False,
+        "timeout": 10,
+    }
+    config.GENERAL_CONFIG = {
+        "days_lookback": 1,
+        "max_papers_per_user": None,
+        "async_mode": args.async_mode,
+        "max_parallel_users": args.parallel_users,
+        "summary_workers": args.summary_workers,
+        "summary_mode": args.summary_mode,
+        "pdf_extract_workers": args.extract_workers,
+        "trace_dir": "traces",
+    }
+    config.DEFAULT_PROMPT_TEMPLATE = BENCH_PROMPT_TEMPLATE
+    config.USERS_CONFIG = []
+    for index in range(args.users):
+        user = {
+            "name": f"bench-user-{index + 1}",
+            "email": f"user{index + 1}@localhost",
+            "arxiv_categories": args.categories,
+            "interest_filter_prompt": BENCH_FILTER_PROMPT.format(interest=f"方向{index + 1}"),
+            "filter_batch_size": args.filter_batch_size,
+        }
+        if not args.shared_prompt:
+            # 每个用户使用不同的总结提示词，避免总结缓存在用户之间命中
+            user["custom_prompt"] = f"（用户{index + 1}）" + BENCH_PROMPT_TEMPLATE
+        config.USERS_CONFIG.append(user)
+    return config
+
+
+def point_at_fake_servers(main_module, http_base: str):
+    """把arXiv客户端和HTML地址指向模拟服务
+
+    arXiv库的API地址是类属性，HTML地址由论文链接推导，这两处无法通过配置修改。
+    """
+    client = main_module.Client(page_size=100, delay_seconds=0, num_retries=1)
+    client.query_url_format = f"{http_base}/api/query?{{}}"
+    main_module._arxiv_client = client
+
+    def build_html_url(paper):
+        return f"{http_base}/html/{paper['arxiv_id']}"
+
+    main_module.build_html_url = build_html_url
+    if "async_pipeline" in sys.modules:
+        sys.modules["async_pipeline"].build_html_url = build_html_url
+
+
+def peak_rss_mb():
+    """本进程和已结束子进程（PDF解析进程池）的峰值常驻内存（MB）"""
+    if resource is None:
+        return None, None
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return self_rss, children_rss
+
+
+def run_benchmark(args):
+    corpus = FakeCorpus(args.papers, args.pages, args.categories)
+    llm = LLMBehavior(ttft_ms=args.llm_ttft_ms, tokens_per_sec=args.llm_tokens_per_sec,
+                      summary_tokens=args.llm_summary_tokens, rate_429=args.llm_429_rate,
+                      retry_after=args.llm_retry_after, seed=args.seed)
+    http_server = FakeHTTPServer(corpus, llm)
+    smtp_server = FakeSMTPServer(latency=args.smtp_latency_ms / 1000)
+    start_in_thread(http_server)
+    start_in_thread(smtp_server)
+
+    workdir = tempfile.mkdtemp(prefix="arxiv-pusher-bench-")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.modules["config"] = build_config(args, http_server.base_url, smtp_server.port)
+    try:
+        import main
+        if args.async_mode:
+            import async_pipeline  # noqa: F401  导入后才能替换其中引用的函数
+        from loguru import logger
+        from database import get_db
+        from mailer import get_mail_dispatcher
+        from query_usage import summarize_stages
+
+        logger.remove()
+        logger.add(os.path.join(workdir, "bench.log"), level="INFO", encoding="utf-8")
+        if args.verbose:
+            logger.add(sys.stderr, level="INFO")
+        point_at_fake_servers(main, http_server.base_url)
+
+        started = time.perf_counter()
+        main.daily_job()
+        pipeline_seconds = time.perf_counter() - started
+        get_mail_dispatcher().flush()
+        total_seconds = time.perf_counter() - started
+
+        rows = get_db().get_stage_timings("0000-00-00", "9999-99-99")
+        stages = summarize_stages(rows)
+        self_rss, children_rss = peak_rss_mb()
+        papers_done = stages.get("paper", {}).get("count", 0)
+        result = {
+            "users": args.users,
+            "papers": args.papers,
+            "async_mode": args.async_mode,
+            "pipeline_seconds": round(pipeline_seconds, 3),
+            "total_seconds": round(total_seconds, 3),
+            "papers_per_minute": round(papers_done / total_seconds * 60, 2) if total_seconds else None,
+            "peak_rss_mb": round(self_rss, 1) if self_rss is not None else None,
+            "peak_rss_children_mb": round(children_rss, 1) if children_rss is not None else None,
+            "requests": {**http_server.counters.snapshot(), **smtp_server.counters.snapshot()},
+            "outbox": get_db().get_outbox_counts(),
+            "stages": {stage: {key: (round(value, 1) if isinstance(value, float) else value)
+                               for key, value in stats.items()}
+                       for stage, stats in stages.items()},
+            "workdir": workdir if args.keep_workdir else None,
+        }
+    finally:
+        os.chdir(previous_cwd)
+        http_server.shutdown()
+        smtp_server.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def print_result(result):
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+    from query_usage import PERF_STAGES, format_duration, format_bytes, stage_sort_key
+
+    console = Console()
+    mode = "异步" if result["async_mode"] else "线程池"
+    summary = Table(show_header=False, box=box.SIMPLE_HEAVY,
+                    title=f"{result['users']} 个用户 × {result['papers']} 篇论文（{mode}模式）")
+    summary.add_column("指标", style="bold cyan", no_wrap=True)
+    summary.add_column("值", justify="right")
+    summary.add_row("daily_job 耗时", f"{result['pipeline_seconds']:.2f}s")
+    summary.add_row("含邮件发送总耗时", f"{result['total_seconds']:.2f}s")
+    summary.add_row("论文/分钟", f"{result['papers_per_minute']}")
+    summary.add_row("峰值内存（本进程）", f"{result['peak_rss_mb']} MB")
+    summary.add_row("峰值内存（解析子进程）", f"{result['peak_rss_children_mb']} MB")
+    summary.add_row("发件箱", ", ".join(f"{k}={v}" for k, v in result["outbox"].items()) or "-")
+    console.print(summary)
+
+    requests_table = Table(box=box.SIMPLE_HEAVY, title="模拟服务收到的请求")
+    requests_table.add_column("类型", style="bold cyan")
+    requests_table.add_column("次数", justify="right")
+    for key, value in sorted(result["requests"].items()):
+        requests_table.add_row(key, format_bytes(value) if key.endswith("_bytes") else f"{value}")
+    console.print(requests_table)
+
+    stages_table = Table(box=box.SIMPLE_HEAVY, title="各阶段耗时")
+    for column in ("阶段", "次数", "p50", "p95", "p99", "失败", "传输量"):
+        stages_table.add_column(column, justify="left" if column == "阶段" else "right")
+    for stage in sorted(result["stages"], key=stage_sort_key):
+        stats = result["stages"][stage]
+        stages_table.add_row(PERF_STAGES.get(stage, stage), f"{stats['count']}", format_duration(stats["p50"]),
+                             format_duration(stats["p95"]), format_duration(stats["p99"]),
+                             f"{stats['errors']}", format_bytes(stats["bytes"]))
+    console.print(stages_table)
+    if result["workdir"]:
+        console.print(f"工作目录（数据库、时间线、日志）: {result['workdir']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="ArXiv-Pusher 端到端基准测试（全部使用本地模拟服务，不访问外部网络）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 3个用户 × 20篇论文
+  python benchmarks/bench_daily_job.py --users 3 --papers 20
+
+  # 异步模式，LLM有10%的请求返回429，结果写入JSON便于对比
+  python benchmarks/bench_daily_job.py --async --llm-429-rate 0.1 --json result.json
+        """,
+    )
+    parser.add_argument("--users", type=int, default=3, help="用户数")
+    parser.add_argument("--papers", type=int, default=20, help="模拟的论文数（所有用户订阅同一组分类）")
+    parser.add_argument("--pages", type=int, default=12, help="每篇PDF的页数")
+    parser.add_argument("--categories", nargs="+", default=["cs.LG", "cs.AI"], help="模拟的arXiv分类")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="使用异步模式运行")
+    parser.add_argument("--parallel-users", type=int, default=4, help="max_parallel_users")
+    parser.add_argument("--summary-workers", type=int, default=8, help="summary_workers")
+    parser.add_argument("--summary-mode", default="single", choices=["single", "map_reduce", "auto"])
+    parser.add_argument("--extract-workers", type=int, default=2, help="pdf_extract_workers")
+    parser.add_argument("--filter-batch-size", type=int, default=1, help="每个用户的 filter_batch_size")
+    parser.add_argument("--shared-prompt", action="store_true", help="所有用户使用同一个总结提示词（测量总结缓存）")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="AI_CONFIG max_concurrency")
+    parser.add_argument("--llm-ttft-ms", type=float, default=200, help="模拟LLM的首token延迟（毫秒）")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=400, help="模拟LLM的输出速度")
+    parser.add_argument("--llm-summary-tokens", type=int, default=300, help="模拟总结回复的token数")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="模拟LLM返回429的概率")
+    parser.add_argument("--llm-retry-after", type=float, default=1, help="429响应的 Retry-After 秒数")
+    parser.add_argument("--no-stream", action="store_true", help="关闭流式LLM调用")
+    parser.add_argument("--smtp-latency-ms", type=float, default=50, help="模拟SMTP每封邮件的处理延迟（毫秒）")
+    parser.add_argument("--seed", type=int, default=0, help="429注入的随机种子")
+    parser.add_argument("--json", type=str, help="把结果写入JSON文件")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时工作目录（数据库、时间线、日志）")
+    parser.add_argument("--verbose", action="store_true", help="在终端输出运行日志")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print_result(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
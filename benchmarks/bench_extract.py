@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+PDF/HTML 文本提取微基准测试
+在 benchmarks/fixtures/ 的样本语料（以及 --corpus 指定目录中的真实论文）上，
+对比各PDF解析库和BeautifulSoup解析器的页/秒、字符/秒和峰值内存
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import importlib.util
+import tracemalloc
+
+# 基准脚本位于 benchmarks/ 下，被测模块在上一级目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fixtures import FIXTURE_DIR
+from html_extract import iter_html_text
+from pdf_extract import PDF_BACKENDS, open_pdf
+
+
+# BeautifulSoup解析器 -> 需要的模块
+HTML_PARSERS = {
+    "html.parser": None,
+    "lxml": "lxml",
+    "html5lib": "html5lib",
+}
+
+
+def available(module):
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def measure(run, repeat: int):
+    """运行多次取最短耗时，再单独运行一次统计Python堆上的峰值内存（tracemalloc会拖慢计时，不与计时混在一起）
+
+    Args:
+        run: 无参函数，返回 (页数, 字符数)
+
+    Returns:
+        dict: pages/chars/seconds/peak_mb，运行出错时包含 error
+    """
+    best = None
+    try:
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            pages, chars = run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}"}
+    return {"pages": pages, "chars": chars, "seconds": best, "peak_mb": peak / 1024 / 1024}
+
+
+def bench_pdf(path: str, backend: str, repeat: int):
+    def run():
+        chars = 0
+        with open_pdf(backend, path) as (page_count, page_text):
+            for index in range(page_count):
+                chars += len(page_text(index) or "")
+        return page_count, chars
+
+    return measure(run, repeat)
+
+
+def bench_html(path: str, parser: str, repeat: int):
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def run():
+        # HTML没有页的概念，页数一栏记为文本节点数
+        nodes = chars = 0
+        for text in iter_html_text(content, parser):
+            nodes += 1
+            chars += len(text)
+        return nodes, chars
+
+    return measure(run, repeat)
+
+
+def collect_files(corpus_dirs, pattern: str):
+    files = sorted(glob.glob(os.path.join(FIXTURE_DIR, pattern)))
+    for directory in corpus_dirs or []:
+        files.extend(sorted(glob.glob(os.path.join(directory, "**", pattern), recursive=True)))
+    return files
+
+
+def run_benchmarks(args):
+    results = []
+    pdf_backends = [name for name in (args.pdf_backends or PDF_BACKENDS) if available(PDF_BACKENDS[name][0])]
+    html_parsers = [name for name in (args.html_parsers or HTML_PARSERS) if available(HTML_PARSERS[name])]
+    if not args.html_only:
+        for path in collect_files(args.corpus, "*.pdf"):
+            for backend in pdf_backends:
+                result = bench_pdf(path, backend, args.repeat)
+                results.append({"kind": "pdf", "file": os.path.basename(path), "backend": backend,
+                                "size_kb": os.path.getsize(path) / 1024, **result})
+    if not args.pdf_only:
+        for path in collect_files(args.corpus, "*.html"):
+            for parser in html_parsers:
+                result = bench_html(path, parser, args.repeat)
+                results.append({"kind": "html", "file": os.path.basename(path), "backend": parser,
+                                "size_kb": os.path.getsize(path) / 1024, **result})
+    skipped = [name for name in PDF_BACKENDS if not available(PDF_BACKENDS[name][0])]
+    skipped += [name for name in HTML_PARSERS if not available(HTML_PARSERS[name])]
+    return results, skipped
+
+
+def print_results(results, skipped):
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+
+    console = Console()
+    for kind, title, unit in (("pdf", "PDF 文本提取", "页/秒"), ("html", "HTML 文本提取", "MB/秒")):
+        rows = [row for row in results if row["kind"] == kind]
+        if not rows:
+            continue
+        table = Table(box=box.SIMPLE_HEAVY, title=title)
+        table.add_column("文件", style="bold cyan")
+        table.add_column("后端")
+        for column in ("大小", "页数" if kind == "pdf" else "文本节点", "字符数", "字符/页" if kind == "pdf" else "",
+                       "耗时", unit, "字符/秒", "峰值内存"):
+            if column:
+                table.add_column(column, justify="right")
+        for row in rows:
+            if "error" in row:
+                table.add_row(row["file"], row["backend"], f"{row['size_kb']:.0f} KB",
+                              f"[red]{row['error']}[/red]")
+                continue
+            seconds = row["seconds"] or 1e-9
+            cells = [row["file"], row["backend"], f"{row['size_kb']:.0f} KB", f"{row['pages']}", f"{row['chars']:,}"]
+            if kind == "pdf":
+                cells.append(f"{row['chars'] / max(1, row['pages']):.0f}")
+                cells.append(f"{seconds * 1000:.0f}ms")
+                cells.append(f"{row['pages'] / seconds:.1f}")
+            else:
+                cells.append(f"{seconds * 1000:.0f}ms")
+                cells.append(f"{row['size_kb'] / 1024 / seconds:.2f}")
+            cells.append(f"{row['chars'] / seconds / 1000:.0f}K")
+            cells.append(f"{row['peak_mb']:.1f} MB")
+            table.add_row(*cells)
+        console.print(table)
+    if skipped:
+        console.print(f"未安装，已跳过: {', '.join(skipped)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="PDF/HTML 文本提取微基准测试",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 样本语料上对比所有已安装的解析库
+  python benchmarks/bench_extract.py
+
+  # 加上论文缓存中的真实PDF，每项运行5次取最快
+  python benchmarks/bench_extract.py --corpus paper_cache --repeat 5
+
+  # 只测PyPDF2和pypdf，结果写入JSON
+  python benchmarks/bench_extract.py --pdf-only --pdf-backends pypdf2 pypdf --json extract.json
+        """,
+    )
+    parser.add_argument("--corpus", nargs="+", help="额外的语料目录（递归查找 *.pdf 和 *.html）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项运行次数，取最短耗时")
+    parser.add_argument("--pdf-backends", nargs="+", choices=list(PDF_BACKENDS), help="只测指定的PDF解析库")
+    parser.add_argument("--html-parsers", nargs="+", choices=list(HTML_PARSERS), help="只测指定的HTML解析器")
+    parser.add_argument("--pdf-only", action="store_true", help="只测PDF")
+    parser.add_argument("--html-only", action="store_true", help="只测HTML")
+    parser.add_argument("--json", type=str, help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    results, skipped = run_benchmarks(args)
+    print_results(results, skipped)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "skipped": skipped}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
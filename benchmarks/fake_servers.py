@@ -0,0 +1,389 @@
+"""
+基准测试用的本地模拟服务 - arXiv Atom API、PDF/HTML下载、OpenAI兼容的对话接口（可注入延迟和429）以及SMTP，
+全部监听 127.0.0.1 的随机端口，并统计收到的请求数
+"""
+import re
+import json
+import time
+import base64
+import random
+import socketserver
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+# 模拟论文正文的章节，覆盖正文预算和章节取舍逻辑
+SECTIONS = ["Abstract", "1 Introduction", "2 Related Work", "3 Method", "4 Experiments",
+            "5 Conclusion", "References", "Appendix A"]
+FILLER = ("We study the proposed approach on standard benchmarks and report consistent improvements "
+          "over strong baselines across all settings while keeping the compute budget fixed")
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(title: str, pages: int, lines_per_page: int = 45) -> bytes:
+    """生成一份纯文本PDF：每页若干行，按页均匀插入章节标题"""
+    section_every = max(1, pages * lines_per_page // len(SECTIONS))
+    line_no = 0
+    page_streams = []
+    for page in range(pages):
+        rows = []
+        for i in range(lines_per_page):
+            if line_no % section_every == 0 and line_no // section_every < len(SECTIONS):
+                text = SECTIONS[line_no // section_every]
+            elif line_no == 1:
+                text = title
+            else:
+                text = f"{FILLER} ({page + 1}.{i})."
+            rows.append(f"BT /F1 9 Tf 36 {800 - i * 17} Td ({_pdf_string(text)}) Tj ET\n")
+            line_no += 1
+        page_streams.append("".join(rows))
+
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>"}
+    font_id = 3 + 2 * pages
+    kids = []
+    for index, content in enumerate(page_streams):
+        page_id, content_id = 3 + 2 * index, 4 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {content_id} 0 R "
+                            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        objects[content_id] = f"<< /Length {len(content)} >>\nstream\n{content}endstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    objects[font_id] = "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for object_id in range(1, font_id + 1):
+        offsets.append(len(data))
+        data += f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {font_id + 1}\n0000000000 65535 f \n".encode()
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    data += f"trailer\n<< /Size {font_id + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return data
+
+
+def make_html(title: str, paragraphs: int = 200) -> bytes:
+    """生成一份arXiv HTML版本风格的页面"""
+    body = [f"<h1>{escape(title)}</h1>"]
+    for index, section in enumerate(SECTIONS):
+        body.append(f"<h2>{section}</h2>")
+        body.extend(f"<p>{FILLER} ({index}.{i}).</p>" for i in range(paragraphs // len(SECTIONS)))
+    return (f"<html><head><title>{escape(title)}</title><style>p{{margin:0}}</style>"
+            f"<script>var x = 1;</script></head><body>{''.join(body)}</body></html>").encode()
+
+
+class FakeCorpus:
+    """模拟的论文集合：ID、提交时间（按时间倒序）、标题摘要，以及按需生成并缓存的PDF/HTML"""
+
+    def __init__(self, papers: int, pages: int, categories: List[str]):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.pages = pages
+        self.papers = []
+        for index in range(papers):
+            category = categories[index % len(categories)]
+            self.papers.append({
+                "id": f"2501.{index + 1:05d}v1",
+                "title": f"Benchmark Paper {index + 1}: Scaling Study of Method {index % 7}",
+                "summary": f"We present benchmark paper {index + 1}. {FILLER}.",
+                "published": now - timedelta(minutes=10 * (index + 1)),
+                "category": category,
+            })
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def pdf(self, paper_id: str) -> bytes:
+        with self._lock:
+            key = ("pdf", paper_id)
+            if key not in self._files:
+                self._files[key] = make_pdf(f"Benchmark paper {paper_id}", self.pages)
+            return self._files[key]
+
+    def html(self, paper_id: str) -> bytes:
+        with self._lock:
+            key = ("html", paper_id)
+            if key not in self._files:
+                self._files[key] = make_html(f"Benchmark paper {paper_id}")
+            return self._files[key]
+
+    def feed(self, base_url: str, query: str, start: int, max_results: int) -> bytes:
+        """按查询中的分类过滤论文，返回一页Atom结果"""
+        categories = set(re.findall(r"cat:([\w.\-]+)", query))
+        matched = [paper for paper in self.papers if not categories or paper["category"] in categories]
+        page = matched[start:start + max_results]
+        entries = []
+        for paper in page:
+            published = paper["published"].strftime("%Y-%m-%dT%H:%M:%SZ")
+            entries.append(f"""<entry>
+<id>http://arxiv.org/abs/{paper['id']}</id>
+<updated>{published}</updated>
+<published>{published}</published>
+<title>{escape(paper['title'])}</title>
+<summary>{escape(paper['summary'])}</summary>
+<author><name>Bench Author</name></author>
+<link href="http://arxiv.org/abs/{paper['id']}" rel="alternate" type="text/html"/>
+<link title="pdf" href="{base_url}/pdf/{paper['id']}.pdf" rel="related" type="application/pdf"/>
+<arxiv:primary_category term="{paper['category']}"/>
+<category term="{paper['category']}"/>
+</entry>""")
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+<title>ArXiv Query</title>
+<opensearch:totalResults>{len(matched)}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+<opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>
+{''.join(entries)}
+</feed>""".encode()
+
+
+class LLMBehavior:
+    """模拟LLM的响应特性
+
+    Args:
+        ttft_ms: 首token延迟（毫秒）
+        tokens_per_sec: 输出速度
+        summary_tokens: 总结回复的token数
+        rate_429: 返回429的概率
+        retry_after: 429响应的 Retry-After 秒数
+        seed: 随机种子，保证多次运行注入的429一致
+    """
+
+    def __init__(self, ttft_ms: float = 200, tokens_per_sec: float = 200, summary_tokens: int = 400,
+                 rate_429: float = 0.0, retry_after: float = 1, seed: int = 0):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.summary_tokens = summary_tokens
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_throttle(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.rate_429
+
+    def reply(self, prompt: str) -> List[str]:
+        """根据提示词类型生成回复，按token切分"""
+        if "键为论文编号" in prompt:
+            count = len(re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE))
+            return [json.dumps({str(i + 1): "是" for i in range(count)}, ensure_ascii=False)]
+        if "请仅回答" in prompt:
+            return ["是"]
+        if "相邻部分之间有少量重叠" in prompt:
+            return ["- 要点"] + [f" {i}" for i in range(self.summary_tokens // 4)]
+        return ["## 总结\n"] + [f"内容{i} " for i in range(self.summary_tokens)]
+
+
+class Counters:
+    """线程安全的请求计数"""
+
+    def __init__(self):
+        self._counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counter[key] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counter)
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        if parsed.path == "/api/query":
+            server.counters.add("arxiv_api")
+            args = parse_qs(parsed.query)
+            body = server.corpus.feed(server.base_url, args.get("search_query", [""])[0],
+                                      int(args.get("start", ["0"])[0]), int(args.get("max_results", ["100"])[0]))
+            self._send(200, body, "application/atom+xml")
+        elif parsed.path.startswith("/pdf/"):
+            paper_id = parsed.path[len("/pdf/"):].removesuffix(".pdf")
+            etag = f'"{paper_id}"'
+            if self.headers.get("If-None-Match") == etag:
+                server.counters.add("pdf_not_modified")
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            server.counters.add("pdf")
+            body = server.corpus.pdf(paper_id)
+            server.counters.add("pdf_bytes", len(body))
+            self._send(200, body, "application/pdf", {"ETag": etag})
+        elif parsed.path.startswith("/html/"):
+            server.counters.add("html")
+            self._send(200, server.corpus.html(parsed.path[len("/html/"):]), "text/html")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, b"not found", "text/plain")
+            return
+
+        behavior = server.llm
+        if behavior.should_throttle():
+            server.counters.add("llm_429")
+            error = {"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit"}}
+            self._send(429, json.dumps(error).encode(), "application/json",
+                       {"Retry-After": str(behavior.retry_after)})
+            return
+        server.counters.add("llm")
+
+        prompt = request["messages"][-1]["content"]
+        tokens = behavior.reply(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(tokens),
+                 "total_tokens": len(prompt) // 4 + len(tokens)}
+        time.sleep(behavior.ttft_ms / 1000)
+        created = int(time.time())
+        if not request.get("stream"):
+            time.sleep(len(tokens) / behavior.tokens_per_sec)
+            body = {
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": usage,
+            }
+            self._send(200, json.dumps(body, ensure_ascii=False).encode(), "application/json")
+            return
+
+        # 流式响应：以分块传输编码逐个发送SSE事件，保持连接可复用
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1 / behavior.tokens_per_sec
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(interval)
+            self._write_event({
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created,
+                "model": request["model"],
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            })
+        self._write_event({
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created,
+            "model": request["model"], "choices": [], "usage": usage,
+        })
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, payload: Dict):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode())
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    """模拟arXiv API、论文下载和LLM接口的HTTP服务"""
+
+    daemon_threads = True
+
+    def __init__(self, corpus: FakeCorpus, llm: LLMBehavior):
+        super().__init__(("127.0.0.1", 0), _HTTPHandler)
+        self.corpus = corpus
+        self.llm = llm
+        self.counters = Counters()
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """最小的SMTP服务端：支持EHLO、AUTH PLAIN/LOGIN、MAIL/RCPT/DATA、RSET、NOOP、QUIT，不支持STARTTLS"""
+
+    def _reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        counters = self.server.counters
+        counters.add("smtp_sessions")
+        self._reply("220 localhost fake SMTP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-localhost")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 localhost")
+            elif verb == "AUTH":
+                if command.upper().startswith("AUTH LOGIN"):
+                    self._reply("334 " + base64.b64encode(b"Username:").decode())
+                    self.rfile.readline()
+                    self._reply("334 " + base64.b64encode(b"Password:").decode())
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                if verb == "RCPT":
+                    counters.add("smtp_recipients")
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    size += len(data_line)
+                time.sleep(self.server.latency)
+                counters.add("smtp_messages")
+                counters.add("smtp_bytes", size)
+                self._reply("250 OK queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """模拟SMTP服务，latency 为每封邮件的处理延迟（秒）"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.05):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.latency = latency
+        self.counters = Counters()
+        self.port = self.server_address[1]
+
+
+def start_in_thread(server) -> threading.Thread:
+    """在后台线程中运行服务"""
+    thread = threading.Thread(target=server.serve_forever, name=type(server).__name__, daemon=True)
+    thread.start()
+    return thread
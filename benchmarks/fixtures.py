@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+解析基准测试的样本语料 - 生成几类有代表性的arXiv论文PDF和HTML页面，写入 benchmarks/fixtures/
+
+生成结果是确定的（固定随机种子），已提交到仓库；修改生成逻辑后重新运行本脚本即可更新：
+    python benchmarks/fixtures.py
+"""
+import os
+import zlib
+import random
+from typing import Dict, List, Tuple
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SECTIONS = ["Abstract", "1 Introduction", "2 Related Work", "3 Method", "4 Experiments",
+            "5 Conclusion", "References", "Appendix A Proofs"]
+WORDS = ("model training data loss gradient network layer attention token sequence optimal bound "
+         "theorem lemma proof convergence sample estimator variance bias regularization kernel "
+         "distribution posterior prior inference benchmark baseline accuracy ablation dataset "
+         "representation embedding objective stochastic parameter scaling robust efficient").split()
+# Symbol字体中的希腊字母和运算符（alpha, beta, sigma, sum, integral, partial, infinity, <=）
+SYMBOLS = ["a", "b", "s", "\\345", "\\362", "\\266", "\\245", "\\243", "l", "q", "m", "S"]
+
+
+def _pdf_string(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _section_at(page: int, pages: int):
+    """按页均匀分布章节标题，返回本页开头的章节名或None"""
+    per_section = max(1, pages // len(SECTIONS))
+    if page % per_section == 0 and page // per_section < len(SECTIONS):
+        return SECTIONS[page // per_section]
+    return None
+
+
+def build_pdf(page_streams: List[bytes], fonts: Dict[str, str], images: Dict[int, Tuple[int, int, bytes]] = None,
+              compress: bool = True) -> bytes:
+    """把各页内容流组装为PDF
+
+    Args:
+        page_streams: 每页的内容流
+        fonts: 资源名到标准Type1字体名的映射
+        images: 页序号到1位灰度扫描图像（宽, 高, FlateDecode前的原始数据）的映射，图像资源名为 /Im0
+        compress: 内容流是否用FlateDecode压缩（真实论文PDF基本都压缩）
+    """
+    images = images or {}
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>"}
+    next_id = 3
+    font_refs = []
+    for name, base_font in fonts.items():
+        objects[next_id] = f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} >>".encode()
+        font_refs.append(f"/{name} {next_id} 0 R")
+        next_id += 1
+    kids = []
+    for index, content in enumerate(page_streams):
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        xobject = ""
+        if index in images:
+            width, height, raw = images[index]
+            data = zlib.compress(raw, 9)
+            objects[next_id] = (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode "
+                                f"/Length {len(data)} >>\nstream\n").encode() + data + b"\nendstream"
+            xobject = f" /XObject << /Im0 {next_id} 0 R >>"
+            next_id += 1
+        kids.append(f"{page_id} 0 R")
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+                            f"/Resources << /Font << {' '.join(font_refs)} >>{xobject} >> >>").encode()
+        if compress:
+            data = zlib.compress(content, 6)
+            header = f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n"
+        else:
+            data = content
+            header = f"<< /Length {len(data)} >>\nstream\n"
+        objects[content_id] = header.encode() + data + b"\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for object_id in range(1, next_id):
+        offsets.append(len(out))
+        out += f"{object_id} 0 obj\n".encode() + objects[object_id] + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {next_id}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def long_pdf(pages: int = 60) -> bytes:
+    """长论文：双栏排版，每栏约55行正文，内容流压缩"""
+    rng = random.Random(1)
+    streams = []
+    for page in range(pages):
+        rows = []
+        section = _section_at(page, pages)
+        for column, x in enumerate((54, 316)):
+            for i in range(55):
+                if section and column == 0 and i == 0:
+                    rows.append(f"BT /F2 11 Tf {x} 740 Td ({_pdf_string(section)}) Tj ET\n")
+                    continue
+                text = _sentence(rng, 7)
+                rows.append(f"BT /F1 8 Tf {x} {740 - i * 12.5:.1f} Td ({_pdf_string(text)}) Tj ET\n")
+        rows.append(f"BT /F1 8 Tf 300 30 Td ({page + 1}) Tj ET\n")
+        streams.append("".join(rows).encode("latin-1"))
+    return build_pdf(streams, {"F1": "Times-Roman", "F2": "Times-Bold"})
+
+
+def math_pdf(pages: int = 20) -> bytes:
+    """公式密集的论文：正文与公式交替，公式中每个符号、上下标单独定位并切换字体，
+    文本操作数远多于普通正文，是解析器最耗时的情形"""
+    rng = random.Random(2)
+    streams = []
+    for page in range(pages):
+        rows = []
+        section = _section_at(page, pages)
+        y = 740.0
+        if section:
+            rows.append(f"BT /F2 11 Tf 54 {y} Td ({_pdf_string(section)}) Tj ET\n")
+            y -= 20
+        while y > 60:
+            if rng.random() < 0.5:
+                rows.append(f"BT /F1 10 Tf 54 {y:.1f} Td ({_pdf_string(_sentence(rng, 12))}) Tj ET\n")
+                y -= 14
+                continue
+            # 一行公式：符号、变量、下标逐个定位
+            ops = [f"BT 90 {y:.1f} Td"]
+            for _ in range(rng.randint(12, 24)):
+                kind = rng.random()
+                if kind < 0.35:
+                    ops.append(f"/F3 11 Tf ({rng.choice(SYMBOLS)}) Tj 7 0 Td")
+                elif kind < 0.7:
+                    ops.append(f"/F4 11 Tf ({rng.choice('xyzwnkij')}) Tj 6 0 Td")
+                    ops.append(f"/F1 7 Tf 0 -3 Td ({rng.randint(0, 9)}) Tj 4 3 Td")
+                else:
+                    ops.append(f"/F1 11 Tf ({_pdf_string(rng.choice('+-=()'))}) Tj 8 0 Td")
+            ops.append(f"/F1 10 Tf 20 0 Td (\\({rng.randint(1, 99)}\\)) Tj ET\n")
+            rows.append(" ".join(ops))
+            y -= 22
+        streams.append("".join(rows).encode("latin-1"))
+    return build_pdf(streams, {"F1": "Times-Roman", "F2": "Times-Bold", "F3": "Symbol", "F4": "Times-Italic"})
+
+
+def scanned_pdf(pages: int = 8) -> bytes:
+    """扫描版论文：每页一张1位灰度扫描图像，只有稀疏的不可见OCR文字层（3 Tr），每页字符很少"""
+    rng = random.Random(3)
+    width, height = 1275, 1650  # 150dpi 的 Letter 页面
+    row_bytes = (width + 7) // 8
+    streams = []
+    images = {}
+    for page in range(pages):
+        # 模拟文字行：白底上按行分布的墨迹块
+        raw = bytearray(b"\xff" * row_bytes * height)
+        for line_top in range(120, height - 120, 28):
+            for y in range(line_top, line_top + 14):
+                offset = y * row_bytes
+                for x in range(12, row_bytes - 12):
+                    if rng.random() < 0.35:
+                        raw[offset + x] = rng.getrandbits(8)
+        images[page] = (width, height, bytes(raw))
+        rows = ["q 612 0 0 792 0 0 cm /Im0 Do Q\n"]
+        for i in range(rng.randint(2, 6)):
+            rows.append(f"BT 3 Tr /F1 10 Tf 54 {700 - i * 40} Td ({_pdf_string(_sentence(rng, 5))}) Tj ET\n")
+        streams.append("".join(rows).encode("latin-1"))
+    return build_pdf(streams, {"F1": "Times-Roman"}, images)
+
+
+def long_html(paragraphs: int = 600) -> str:
+    """arXiv HTML（LaTeXML）风格的长页面：ltx_ 类名、嵌套div、导航、脚本和样式"""
+    rng = random.Random(4)
+    body = ['<nav class="ltx_page_navbar"><ul>' +
+            "".join(f'<li><a href="#S{i}">{s}</a></li>' for i, s in enumerate(SECTIONS)) + "</ul></nav>",
+            '<article class="ltx_document"><h1 class="ltx_title ltx_title_document">Benchmark Long Paper</h1>']
+    per_section = paragraphs // len(SECTIONS)
+    for index, section in enumerate(SECTIONS):
+        body.append(f'<section id="S{index}" class="ltx_section"><h2 class="ltx_title ltx_title_section">'
+                    f'<span class="ltx_tag ltx_tag_section">{index}</span>{section}</h2>')
+        for i in range(per_section):
+            body.append(f'<div id="S{index}.p{i}" class="ltx_para"><p class="ltx_p">'
+                        f'{" ".join(_sentence(rng, 10) for _ in range(4))} '
+                        f'<cite class="ltx_cite"><a href="#bib.bib{i}" class="ltx_ref">[{i + 1}]</a></cite></p></div>')
+        body.append("</section>")
+    body.append("</article>")
+    return ("<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>Benchmark Long Paper</title>"
+            "<style>" + ".ltx_p{margin:0}" * 200 + "</style>"
+            "<script>" + "window.x = 1;" * 500 + "</script></head><body>" + "".join(body) + "</body></html>")
+
+
+def _mathml(rng: random.Random) -> str:
+    """一个带TeX注释的MathML公式（LaTeXML的输出格式）"""
+    terms = []
+    tex = []
+    for _ in range(rng.randint(4, 10)):
+        var, sub = rng.choice("xyzwnk"), rng.randint(0, 9)
+        terms.append(f"<msub><mi>{var}</mi><mn>{sub}</mn></msub><mo>+</mo>")
+        tex.append(f"{var}_{{{sub}}}+")
+    return ('<math xmlns="http://www.w3.org/1998/Math/MathML" class="ltx_Math" display="inline">'
+            f'<semantics><mrow>{"".join(terms)}<mn>0</mn></mrow>'
+            f'<annotation encoding="application/x-tex">{"".join(tex)}0</annotation></semantics></math>')
+
+
+def math_html(paragraphs: int = 300) -> str:
+    """公式密集的arXiv HTML页面：每段穿插多个MathML公式，DOM节点数远多于普通页面"""
+    rng = random.Random(5)
+    body = ['<article class="ltx_document"><h1 class="ltx_title">Benchmark Math Paper</h1>']
+    for index, section in enumerate(SECTIONS):
+        body.append(f'<section class="ltx_section"><h2 class="ltx_title">{section}</h2>')
+        for _ in range(paragraphs // len(SECTIONS)):
+            parts = []
+            for _ in range(3):
+                parts.append(_sentence(rng, 8))
+                parts.append(_mathml(rng))
+            body.append(f'<div class="ltx_para"><p class="ltx_p">{" ".join(parts)}</p></div>')
+        body.append("</section>")
+    body.append("</article>")
+    return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Benchmark Math Paper</title></head><body>"
+            + "".join(body) + "</body></html>")
+
+
+FIXTURES = {
+    "long.pdf": long_pdf,
+    "math.pdf": math_pdf,
+    "scanned.pdf": scanned_pdf,
+    "long.html": long_html,
+    "math.html": math_html,
+}
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name, build in FIXTURES.items():
+        data = build()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        path = os.path.join(FIXTURE_DIR, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"{path}: {len(data) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
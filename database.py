@@ -3,6 +3,7 @@
 """
 import sqlite3
 import json
+import hashlib
 import threading
 from datetime import datetime
 from loguru import logger
@@ -25,7 +26,9 @@ class TokenUsageDB:
     def _init_db(self):
         """初始化数据库连接和表结构"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            # 多个用户并行处理时各线程同时写入，等待锁而不是立即报 database is locked
+            self.conn = sqlite3.connect(self.db_path, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
             self.conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
             self._create_tables()
             logger.info(f"数据库初始化成功: {self.db_path}")
@@ -88,9 +91,158 @@ class TokenUsageDB:
             ON user_token_usage(date)
         """)
 
+        # 兴趣过滤结果缓存表：相同提示词、相同论文版本、相同模型的判断结果可以跨用户、跨运行复用
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS interest_filter_cache (
+                prompt_hash TEXT NOT NULL,
+                arxiv_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                is_interested INTEGER NOT NULL,
+                answer TEXT,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (prompt_hash, arxiv_id, model)
+            )
+        """)
+
+        # 论文总结缓存表：相同总结提示词、相同论文版本、相同模型和温度的总结结果可以复用
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                prompt_hash TEXT NOT NULL,
+                arxiv_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                temperature REAL NOT NULL,
+                summary TEXT NOT NULL,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                size_bytes INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (prompt_hash, arxiv_id, model, temperature)
+            )
+        """)
+
+        # 增量抓取：每个分类已抓取到的最新提交时间（高水位）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fetch_watermarks (
+                category TEXT PRIMARY KEY,
+                last_published TIMESTAMP NOT NULL,
+                last_arxiv_id TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # 增量抓取：每个分类已经处理过的论文（不含版本号的arXiv ID）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS seen_papers (
+                arxiv_id TEXT NOT NULL,
+                category TEXT NOT NULL,
+                published TIMESTAMP,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (arxiv_id, category)
+            )
+        """)
+
+        # 每次LLM调用的性能指标，用于根据服务商的实际吞吐调整并发
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_call_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                model TEXT NOT NULL,
+                stream INTEGER NOT NULL,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                ttft_ms REAL,
+                latency_ms REAL NOT NULL,
+                tokens_per_sec REAL,
+                status TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_llm_call_metrics_date
+            ON llm_call_metrics(date)
+        """)
+
+        # 待发送的邮件报告：生成后先落库，由发送线程投递，同一用户同一天只发一份
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mail_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_name TEXT NOT NULL,
+                report_date DATE NOT NULL,
+                receiver TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                content TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP,
+                UNIQUE (user_name, report_date)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_mail_outbox_status
+            ON mail_outbox(status, next_attempt_at)
+        """)
+
+        # 各阶段（抓取、下载、解析、LLM、发送）每次调用的耗时，用于分析每次运行的时间分布
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stage_timings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                date TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                user_name TEXT,
+                item TEXT,
+                started_at REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                bytes INTEGER DEFAULT 0,
+                outcome TEXT NOT NULL,
+                thread TEXT
+            )
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stage_timings_date
+            ON stage_timings(date, stage)
+        """)
+
+        self._add_missing_columns(cursor, "user_token_usage", {
+            # 兴趣过滤缓存命中统计（lookups 为送入兴趣过滤的论文数）
+            "filter_cache_lookups": "INTEGER DEFAULT 0",
+            "filter_cache_hits": "INTEGER DEFAULT 0",
+            "filter_cache_saved_input_tokens": "INTEGER DEFAULT 0",
+            "filter_cache_saved_output_tokens": "INTEGER DEFAULT 0",
+            # 论文总结缓存命中统计
+            "generate_cache_hits": "INTEGER DEFAULT 0",
+            "generate_cache_saved_input_tokens": "INTEGER DEFAULT 0",
+            "generate_cache_saved_output_tokens": "INTEGER DEFAULT 0",
+        })
+
         self.conn.commit()
         logger.info("数据库表创建成功")
 
+    @staticmethod
+    def _add_missing_columns(cursor, table: str, columns: Dict[str, str]):
+        """为已存在的旧表补充新增的列
+
+        Args:
+            cursor: 数据库游标
+            table: 表名
+            columns: 列名到列定义的映射
+        """
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
     def record_usage(
         self,
         user_name: str,
@@ -105,7 +257,14 @@ class TokenUsageDB:
         papers_fetched: int,
         papers_filtered: int,
         papers_processed: int,
-        date: Optional[str] = None
+        date: Optional[str] = None,
+        filter_cache_lookups: int = 0,
+        filter_cache_hits: int = 0,
+        filter_cache_saved_input_tokens: int = 0,
+        filter_cache_saved_output_tokens: int = 0,
+        generate_cache_hits: int = 0,
+        generate_cache_saved_input_tokens: int = 0,
+        generate_cache_saved_output_tokens: int = 0
     ):
         """记录用户的token使用情况
 
@@ -123,6 +282,13 @@ class TokenUsageDB:
             papers_filtered: 兴趣过滤后保留的论文数
             papers_processed: 实际处理的论文数
             date: 记录日期，默认为今天
+            filter_cache_lookups: 送入兴趣过滤的论文数（缓存命中数加LLM调用数）
+            filter_cache_hits: 兴趣过滤缓存命中次数
+            filter_cache_saved_input_tokens: 缓存命中节省的过滤阶段输入token数
+            filter_cache_saved_output_tokens: 缓存命中节省的过滤阶段输出token数
+            generate_cache_hits: 论文总结缓存命中次数
+            generate_cache_saved_input_tokens: 缓存命中节省的生成阶段输入token数
+            generate_cache_saved_output_tokens: 缓存命中节省的生成阶段输出token数
         """
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
@@ -148,14 +314,20 @@ class TokenUsageDB:
                     filter_input_tokens, filter_output_tokens, filter_total_tokens, filter_cost,
                     generate_input_tokens, generate_output_tokens, generate_total_tokens, generate_cost,
                     total_input_tokens, total_output_tokens, total_tokens, total_cost,
-                    papers_fetched, papers_filtered, papers_processed
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    papers_fetched, papers_filtered, papers_processed,
+                    filter_cache_lookups, filter_cache_hits,
+                    filter_cache_saved_input_tokens, filter_cache_saved_output_tokens,
+                    generate_cache_hits, generate_cache_saved_input_tokens, generate_cache_saved_output_tokens
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 user_name, user_email, date, categories_json,
                 filter_input_tokens, filter_output_tokens, filter_total_tokens, filter_cost,
                 generate_input_tokens, generate_output_tokens, generate_total_tokens, generate_cost,
                 total_input_tokens, total_output_tokens, total_tokens, total_cost,
-                papers_fetched, papers_filtered, papers_processed
+                papers_fetched, papers_filtered, papers_processed,
+                filter_cache_lookups, filter_cache_hits,
+                filter_cache_saved_input_tokens, filter_cache_saved_output_tokens,
+                generate_cache_hits, generate_cache_saved_input_tokens, generate_cache_saved_output_tokens
             ))
 
             self.conn.commit()
@@ -373,6 +545,524 @@ class TokenUsageDB:
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
+    def get_filter_verdict(self, prompt_hash: str, arxiv_id: str, model: str) -> Optional[Dict]:
+        """查询缓存的兴趣过滤结果
+
+        Args:
+            prompt_hash: 规范化后的兴趣过滤提示词哈希
+            arxiv_id: 带版本号的arXiv ID
+            model: 模型名称
+
+        Returns:
+            包含判断结果和token统计的字典，未命中时返回None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM interest_filter_cache
+            WHERE prompt_hash = ? AND arxiv_id = ? AND model = ?
+        """, (prompt_hash, arxiv_id, model))
+
+        row = cursor.fetchone()
+        if row:
+            result = dict(row)
+            result['is_interested'] = bool(result['is_interested'])
+            return result
+        return None
+
+    def save_filter_verdict(
+        self,
+        prompt_hash: str,
+        arxiv_id: str,
+        model: str,
+        is_interested: bool,
+        answer: str,
+        prompt_tokens: int,
+        completion_tokens: int
+    ):
+        """保存兴趣过滤结果到缓存
+
+        Args:
+            prompt_hash: 规范化后的兴趣过滤提示词哈希
+            arxiv_id: 带版本号的arXiv ID
+            model: 模型名称
+            is_interested: 是否感兴趣
+            answer: AI原始回复
+            prompt_tokens: 本次判断的输入token数
+            completion_tokens: 本次判断的输出token数
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT OR REPLACE INTO interest_filter_cache (
+                    prompt_hash, arxiv_id, model, is_interested, answer,
+                    prompt_tokens, completion_tokens
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (prompt_hash, arxiv_id, model, int(is_interested), answer,
+                  prompt_tokens, completion_tokens))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"保存兴趣过滤缓存失败: {str(e)}")
+
+    def get_cached_summary(
+        self,
+        prompt_hash: str,
+        arxiv_id: str,
+        model: str,
+        temperature: float,
+        ttl_days: float
+    ) -> Optional[Dict]:
+        """查询缓存的论文总结，命中时刷新最近访问时间
+
+        Args:
+            prompt_hash: 规范化后的总结提示词哈希
+            arxiv_id: 带版本号的arXiv ID
+            model: 模型名称
+            temperature: 生成温度
+            ttl_days: 缓存有效天数，超过则视为未命中
+
+        Returns:
+            包含总结内容和token统计的字典，未命中时返回None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM summary_cache
+            WHERE prompt_hash = ? AND arxiv_id = ? AND model = ? AND temperature = ?
+              AND created_at >= datetime('now', ?)
+        """, (prompt_hash, arxiv_id, model, temperature, f"-{ttl_days} days"))
+
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        try:
+            cursor.execute("""
+                UPDATE summary_cache SET last_accessed = CURRENT_TIMESTAMP
+                WHERE prompt_hash = ? AND arxiv_id = ? AND model = ? AND temperature = ?
+            """, (prompt_hash, arxiv_id, model, temperature))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.warning(f"更新总结缓存访问时间失败: {str(e)}")
+        return dict(row)
+
+    def save_summary(
+        self,
+        prompt_hash: str,
+        arxiv_id: str,
+        model: str,
+        temperature: float,
+        summary: str,
+        prompt_tokens: int,
+        completion_tokens: int
+    ):
+        """保存论文总结到缓存
+
+        Args:
+            prompt_hash: 规范化后的总结提示词哈希
+            arxiv_id: 带版本号的arXiv ID
+            model: 模型名称
+            temperature: 生成温度
+            summary: 总结内容
+            prompt_tokens: 本次总结的输入token数
+            completion_tokens: 本次总结的输出token数
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT OR REPLACE INTO summary_cache (
+                    prompt_hash, arxiv_id, model, temperature, summary,
+                    prompt_tokens, completion_tokens, size_bytes
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (prompt_hash, arxiv_id, model, temperature, summary,
+                  prompt_tokens, completion_tokens, len(summary.encode("utf-8"))))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"保存总结缓存失败: {str(e)}")
+
+    def evict_summary_cache(self, ttl_days: float, max_size_mb: float):
+        """淘汰过期的总结缓存，并在总大小超限时按最近访问时间淘汰
+
+        Args:
+            ttl_days: 缓存有效天数
+            max_size_mb: 缓存总大小上限（MB）
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                DELETE FROM summary_cache WHERE created_at < datetime('now', ?)
+            """, (f"-{ttl_days} days",))
+            expired = cursor.rowcount
+
+            # 按最近访问时间从新到旧累计大小，超出上限的部分全部删除
+            cursor.execute("""
+                DELETE FROM summary_cache WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, SUM(size_bytes) OVER (
+                            ORDER BY last_accessed DESC, rowid DESC
+                        ) AS running_size
+                        FROM summary_cache
+                    ) WHERE running_size > ?
+                )
+            """, (int(max_size_mb * 1024 * 1024),))
+            evicted = cursor.rowcount
+
+            self.conn.commit()
+            if expired or evicted:
+                logger.info(f"总结缓存淘汰了 {expired} 条过期记录和 {evicted} 条超容量记录")
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"淘汰总结缓存失败: {str(e)}")
+
+    def record_llm_call(
+        self,
+        stage: str,
+        model: str,
+        stream: bool,
+        prompt_tokens: int,
+        completion_tokens: int,
+        ttft_ms: Optional[float],
+        latency_ms: float,
+        tokens_per_sec: Optional[float],
+        status: str,
+        date: Optional[str] = None
+    ):
+        """记录单次LLM调用的性能指标
+
+        Args:
+            stage: 调用阶段（filter/filter_batch/summary/chunk）
+            model: 模型名称
+            stream: 是否流式请求
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            ttft_ms: 首token时间（毫秒），非流式请求为None
+            latency_ms: 总耗时（毫秒）
+            tokens_per_sec: 输出速度（token/秒）
+            status: 调用结果（ok/timeout/error）
+            date: 日期（YYYY-MM-DD格式），默认为今天
+        """
+        if date is None:
+            date = datetime.now().strftime("%Y-%m-%d")
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            INSERT INTO llm_call_metrics
+            (date, stage, model, stream, prompt_tokens, completion_tokens,
+             ttft_ms, latency_ms, tokens_per_sec, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (date, stage, model, int(stream), prompt_tokens, completion_tokens,
+              ttft_ms, latency_ms, tokens_per_sec, status))
+        self.conn.commit()
+
+    def record_stage_timings(self, rows: List[tuple]):
+        """批量写入阶段耗时记录
+
+        Args:
+            rows: 每项为 (run_id, date, stage, user_name, item, started_at, duration_ms, bytes, outcome, thread)
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany("""
+                INSERT INTO stage_timings
+                (run_id, date, stage, user_name, item, started_at, duration_ms, bytes, outcome, thread)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def get_stage_timings(
+        self,
+        start_date: str,
+        end_date: str,
+        user_name: Optional[str] = None
+    ) -> List[Dict]:
+        """查询日期范围内的阶段耗时记录
+
+        Args:
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+            user_name: 只查询指定用户，默认不限
+
+        Returns:
+            按开始时间排序的记录列表
+        """
+        query = """
+            SELECT run_id, date, stage, user_name, item, started_at, duration_ms, bytes, outcome
+            FROM stage_timings
+            WHERE date BETWEEN ? AND ?
+        """
+        params = [start_date, end_date]
+        if user_name:
+            query += " AND user_name = ?"
+            params.append(user_name)
+        query += " ORDER BY started_at"
+
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_llm_call_metrics(self, start_date: str, end_date: str) -> List[Dict]:
+        """查询日期范围内每次LLM调用的性能指标
+
+        Args:
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Returns:
+            记录列表
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT date, stage, model, stream, prompt_tokens, completion_tokens,
+                   ttft_ms, latency_ms, tokens_per_sec, status
+            FROM llm_call_metrics
+            WHERE date BETWEEN ? AND ?
+            ORDER BY id
+        """, (start_date, end_date))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_fetch_watermark(self, category: str) -> Optional[Dict]:
+        """查询指定分类的抓取高水位
+
+        Args:
+            category: arXiv分类
+
+        Returns:
+            包含 last_published（ISO格式字符串）和 last_arxiv_id 的字典，首次抓取时返回None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM fetch_watermarks WHERE category = ?
+        """, (category,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_seen_paper_ids(self, category: str, arxiv_ids: List[str]) -> set:
+        """查询给定论文中已经在该分类下处理过的论文
+
+        Args:
+            category: arXiv分类
+            arxiv_ids: 不含版本号的arXiv ID列表
+
+        Returns:
+            已处理过的arXiv ID集合
+        """
+        seen = set()
+        cursor = self.conn.cursor()
+        # SQLite对参数数量有限制，分批查询
+        for start in range(0, len(arxiv_ids), 500):
+            chunk = arxiv_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(f"""
+                SELECT arxiv_id FROM seen_papers
+                WHERE category = ? AND arxiv_id IN ({placeholders})
+            """, (category, *chunk))
+            seen.update(row[0] for row in cursor.fetchall())
+        return seen
+
+    def commit_fetch_progress(
+        self,
+        category: str,
+        papers: List[Dict],
+        last_published: str,
+        last_arxiv_id: str,
+        retention_days: int = 90
+    ):
+        """记录已处理的论文并推进分类的高水位（在一次运行成功结束后调用）
+
+        Args:
+            category: arXiv分类
+            papers: 本次新处理的论文列表，每项包含 arxiv_id（不含版本号）和 published（ISO格式字符串）
+            last_published: 本次看到的最新提交时间（ISO格式字符串）
+            last_arxiv_id: 最新提交论文的arXiv ID
+            retention_days: seen_papers 记录的保留天数，早于高水位窗口的记录不再需要
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany("""
+                INSERT OR IGNORE INTO seen_papers (arxiv_id, category, published)
+                VALUES (?, ?, ?)
+            """, [(paper['arxiv_id'], category, paper['published']) for paper in papers])
+
+            # 高水位只前进不后退
+            cursor.execute("""
+                INSERT INTO fetch_watermarks (category, last_published, last_arxiv_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(category) DO UPDATE SET
+                    last_published = excluded.last_published,
+                    last_arxiv_id = excluded.last_arxiv_id,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE excluded.last_published > fetch_watermarks.last_published
+            """, (category, last_published, last_arxiv_id))
+
+            cursor.execute("""
+                DELETE FROM seen_papers WHERE first_seen < datetime('now', ?)
+            """, (f"-{retention_days} days",))
+
+            self.conn.commit()
+            logger.info(f"分类 {category} 抓取进度已提交，记录 {len(papers)} 篇新论文")
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"更新分类 {category} 抓取进度失败: {str(e)}")
+
+    def enqueue_outbox(
+        self,
+        user_name: str,
+        receiver: str,
+        subject: str,
+        content: str,
+        report_date: Optional[str] = None
+    ) -> bool:
+        """把渲染好的报告写入发件箱
+
+        同一用户同一天只保留一份：尚未发出时用新报告覆盖旧报告并重置重试次数，已经发出的不再重复发送。
+
+        Args:
+            user_name: 用户名称
+            receiver: 收件人邮箱（可用逗号分隔多个）
+            subject: 邮件主题
+            content: Markdown格式的报告内容
+            report_date: 报告日期（YYYY-MM-DD格式），默认为今天
+
+        Returns:
+            是否加入了待发送队列（当天报告已发送过时返回False）
+        """
+        if report_date is None:
+            report_date = datetime.now().strftime("%Y-%m-%d")
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO mail_outbox (user_name, report_date, receiver, subject, content)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_name, report_date) DO UPDATE SET
+                    receiver = excluded.receiver,
+                    subject = excluded.subject,
+                    content = excluded.content,
+                    status = 'pending',
+                    attempts = 0,
+                    next_attempt_at = CURRENT_TIMESTAMP,
+                    last_error = NULL
+                WHERE mail_outbox.status != 'sent'
+            """, (user_name, report_date, receiver, subject, content))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"写入发件箱失败: {str(e)}")
+            raise
+        if cursor.rowcount == 0:
+            logger.info(f"用户 {user_name} {report_date} 的报告已发送过，不再重复发送")
+            return False
+        return True
+
+    def get_due_outbox(self, limit: int = 100) -> List[Dict]:
+        """查询已到重试时间的待发送邮件
+
+        Args:
+            limit: 最多返回的条数
+
+        Returns:
+            按创建顺序排列的待发送邮件列表
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM mail_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY id
+            LIMIT ?
+        """, (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_next_outbox_attempt(self) -> Optional[float]:
+        """距离下一封待发送邮件可以重试还有多少秒，没有待发送邮件时返回None"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT MAX(0, (julianday(MIN(next_attempt_at)) - julianday('now')) * 86400)
+            FROM mail_outbox WHERE status = 'pending'
+        """)
+        row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def mark_outbox_sent(self, outbox_id: int):
+        """标记邮件已发送"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE mail_outbox
+            SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ?
+        """, (outbox_id,))
+        self.conn.commit()
+
+    def mark_outbox_failed(self, outbox_id: int, error: str, retry_delay: float, max_attempts: int) -> bool:
+        """记录一次发送失败，安排下次重试；达到最大尝试次数后标记为失败
+
+        Args:
+            outbox_id: 发件箱记录ID
+            error: 错误信息
+            retry_delay: 距下次重试的秒数
+            max_attempts: 最大尝试次数
+
+        Returns:
+            是否还会继续重试
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE mail_outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                next_attempt_at = datetime('now', ?),
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+            WHERE id = ?
+        """, (error, f"+{int(retry_delay)} seconds", max_attempts, outbox_id))
+        self.conn.commit()
+        cursor.execute("SELECT status FROM mail_outbox WHERE id = ?", (outbox_id,))
+        row = cursor.fetchone()
+        return bool(row) and row[0] == 'pending'
+
+    def reset_outbox(
+        self,
+        report_date: Optional[str] = None,
+        user_name: Optional[str] = None,
+        include_sent: bool = False
+    ) -> int:
+        """把发件箱中的邮件重新置为立即待发送
+
+        Args:
+            report_date: 只处理指定日期的报告，默认不限
+            user_name: 只处理指定用户的报告，默认不限
+            include_sent: 是否包括已经发送过的报告（用于重新投递）
+
+        Returns:
+            被重置的邮件数量
+        """
+        conditions = ["status != 'sent'"] if not include_sent else []
+        params = []
+        if report_date:
+            conditions.append("report_date = ?")
+            params.append(report_date)
+        if user_name:
+            conditions.append("user_name = ?")
+            params.append(user_name)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            UPDATE mail_outbox
+            SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+            {where}
+        """, params)
+        self.conn.commit()
+        return cursor.rowcount
+
+    def get_outbox_counts(self) -> Dict[str, int]:
+        """统计发件箱中各状态的邮件数量"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM mail_outbox GROUP BY status")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
     def close(self):
         """关闭数据库连接"""
         if self.conn:
@@ -388,6 +1078,21 @@ class TokenUsageDB:
         self.close()
 
 
+def prompt_hash(prompt: str) -> str:
+    """计算规范化后的提示词哈希
+
+    合并连续空白后再计算SHA-256，仅空白不同的提示词视为同一个。
+
+    Args:
+        prompt: 提示词模板
+
+    Returns:
+        十六进制哈希字符串
+    """
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
 # 全局数据库实例（线程安全）
 _db_instances = {}
 _db_lock = threading.Lock()
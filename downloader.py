@@ -0,0 +1,256 @@
+"""
+下载模块 - 基于共享连接池的流式下载：分块写入临时文件，失败后用Range续传，
+并用 ETag / Last-Modified 条件请求跳过未变化的文件
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import weakref
+import contextlib
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+from telemetry import add_bytes
+
+PART_SUFFIX = ".part"
+META_SUFFIX = ".meta.json"
+CHUNK_SIZE = 64 * 1024
+
+
+# 全局会话实例
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """获取进程内共享的requests会话（线程安全），复用到同一主机的TCP/TLS连接"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            from resource_limits import get_limit
+
+            pool_size = get_limit("download") * 2
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers["User-Agent"] = "ArXiv-Pusher"
+        return _session
+
+
+# 同一目标文件同时只允许一个下载，避免并发写同一个临时文件
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+def _path_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _load_meta(path: str) -> Dict:
+    """读取下载元数据（ETag、Last-Modified、URL等），不存在或损坏时返回空字典"""
+    try:
+        with open(path + META_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_meta(path: str, meta: Dict):
+    try:
+        with open(path + META_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    except OSError as e:
+        logger.warning(f"写入下载元数据失败 {path}: {str(e)}")
+
+
+def build_request_headers(url: str, path: str) -> Tuple[Dict, int]:
+    """根据已有文件和元数据构建条件请求/续传请求头
+
+    - 目标文件已存在：带上 If-None-Match / If-Modified-Since，未变化时服务端返回304
+    - 存在未完成的临时文件：带上 Range 和 If-Range，从断点继续；文件已变化时服务端返回完整内容
+
+    Returns:
+        tuple: (请求头, 续传起始字节；0表示从头下载)
+    """
+    meta = _load_meta(path)
+    if meta.get("url") != url:
+        meta = {}
+    headers = {}
+    if os.path.exists(path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers, 0
+
+    part_path = path + PART_SUFFIX
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = meta.get("etag") or meta.get("last_modified")
+    if resume_from and validator:
+        headers["Range"] = f"bytes={resume_from}-"
+        headers["If-Range"] = validator
+        return headers, resume_from
+    return headers, 0
+
+
+def begin_body(url: str, path: str, status_code: int, response_headers, resume_from: int) -> Optional[str]:
+    """根据响应状态准备写入临时文件
+
+    Returns:
+        临时文件的打开模式（"ab" 续传 / "wb" 从头写），无法处理的状态返回None
+    """
+    if status_code == 206 and resume_from:
+        logger.info(f"从第 {resume_from} 字节继续下载: {url}")
+        return "ab"
+    if status_code == 200:
+        # 记录校验信息，供下载中断后续传或下次条件请求使用
+        _save_meta(path, {
+            "url": url,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+        })
+        return "wb"
+    return None
+
+
+def finish_download(path: str, min_size: int) -> bool:
+    """校验临时文件大小后原子替换为目标文件"""
+    part_path = path + PART_SUFFIX
+    file_size = os.path.getsize(part_path)
+    if file_size < min_size:  # 过小的文件可能是错误页面
+        logger.warning(f"下载的文件过小 ({file_size} 字节)")
+        os.remove(part_path)
+        return False
+    with open(part_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(part_path, path)
+    return True
+
+
+def _backoff(attempt: int) -> float:
+    """指数退避加随机抖动"""
+    return min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def download_file(url: str, path: str, max_retries: int = 3, min_size: int = 1000) -> bool:
+    """流式下载文件到指定路径
+
+    使用共享会话的连接池，按块写入 path.part，完成后原子重命名；
+    中途失败保留临时文件，重试（包括下次运行）时用Range续传；
+    目标文件已存在时发条件请求，服务端返回304则直接复用。
+
+    Args:
+        url: 下载地址
+        path: 目标文件路径
+        max_retries: 最大尝试次数
+        min_size: 最小有效文件大小（字节）
+
+    Returns:
+        是否得到了有效文件
+    """
+    from resource_limits import get_limiter
+
+    session = get_http_session()
+    with _path_lock(path):
+        for attempt in range(max_retries):
+            try:
+                headers, resume_from = build_request_headers(url, path)
+                with get_limiter("download"):
+                    with session.get(url, headers=headers, stream=True, timeout=30) as response:
+                        if response.status_code == 304:
+                            logger.info(f"文件未变化，跳过下载: {url}")
+                            os.utime(path, None)
+                            return True
+                        mode = begin_body(url, path, response.status_code, response.headers, resume_from)
+                        if mode is None:
+                            logger.error(f"下载失败: HTTP状态码 {response.status_code}")
+                            if response.status_code == 416:
+                                # 续传位置无效，丢弃临时文件后从头下载
+                                os.remove(path + PART_SUFFIX)
+                        else:
+                            content_type = response.headers.get('Content-Type', '')
+                            if 'pdf' not in content_type.lower():
+                                logger.warning(f"响应可能不是PDF文件 (Content-Type: {content_type})")
+                            with open(path + PART_SUFFIX, mode) as f:
+                                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                                    f.write(chunk)
+                                    add_bytes(len(chunk))
+                            if finish_download(path, min_size):
+                                return True
+            except Exception as e:
+                logger.warning(f"尝试 {attempt+1}/{max_retries} 失败: {str(e)}")
+
+            # 如果不是最后一次尝试，则等待一段时间再重试
+            if attempt < max_retries - 1:
+                time.sleep(_backoff(attempt))
+
+    return False
+
+
+# 异步模式下正在进行的下载：事件循环 -> {目标文件: 下载任务}；每次运行新建事件循环，按循环区分
+_async_downloads = weakref.WeakKeyDictionary()
+
+
+async def download_file_async(client, url: str, path: str, max_retries: int = 3,
+                              min_size: int = 1000, semaphore=None) -> bool:
+    """流式下载文件（异步版本，基于共享的 httpx.AsyncClient），行为同 download_file
+
+    同一目标文件同时只有一个下载，其他协程等待该下载的结果，不会并发写同一个临时文件。
+
+    Args:
+        client: httpx.AsyncClient
+        semaphore: 可选的并发限制（如按主机的信号量）
+    """
+    in_flight = _async_downloads.setdefault(asyncio.get_running_loop(), {})
+    key = os.path.abspath(path)
+    task = in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_download_file_async(client, url, path, max_retries, min_size, semaphore))
+        in_flight[key] = task
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    else:
+        logger.info(f"等待正在进行的下载: {url}")
+    # 某个等待方被取消时不取消共享的下载
+    return await asyncio.shield(task)
+
+
+async def _download_file_async(client, url: str, path: str, max_retries: int,
+                               min_size: int, semaphore) -> bool:
+    for attempt in range(max_retries):
+        try:
+            headers, resume_from = build_request_headers(url, path)
+            async with semaphore or contextlib.nullcontext():
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304:
+                        logger.info(f"文件未变化，跳过下载: {url}")
+                        os.utime(path, None)
+                        return True
+                    mode = begin_body(url, path, response.status_code, response.headers, resume_from)
+                    if mode is None:
+                        logger.error(f"下载失败: HTTP状态码 {response.status_code}")
+                        if response.status_code == 416:
+                            os.remove(path + PART_SUFFIX)
+                    else:
+                        content_type = response.headers.get('Content-Type', '')
+                        if 'pdf' not in content_type.lower():
+                            logger.warning(f"响应可能不是PDF文件 (Content-Type: {content_type})")
+                        with open(path + PART_SUFFIX, mode) as f:
+                            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                f.write(chunk)
+                                add_bytes(len(chunk))
+                        if await asyncio.to_thread(finish_download, path, min_size):
+                            return True
+        except Exception as e:
+            logger.warning(f"尝试 {attempt+1}/{max_retries} 失败: {str(e)}")
+
+        if attempt < max_retries - 1:
+            await asyncio.sleep(_backoff(attempt))
+
+    return False
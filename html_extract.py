@@ -0,0 +1,31 @@
+"""
+HTML文本提取模块 - 用BeautifulSoup解析arXiv HTML页面，去掉脚本和样式后逐段产出清理过的文本
+"""
+from typing import Iterator
+
+from bs4 import BeautifulSoup
+
+
+def iter_html_text(html_content, parser: str = "html.parser") -> Iterator[str]:
+    """逐个文本节点产出HTML中的文本
+
+    Args:
+        html_content: HTML内容（bytes或str）
+        parser: BeautifulSoup解析器，如 html.parser、lxml（需安装lxml）
+
+    Yields:
+        每个文本节点清理空白后的文本（以换行结尾），空白节点跳过
+    """
+    soup = BeautifulSoup(html_content, parser)
+
+    # 移除脚本和样式元素
+    for script in soup(["script", "style"]):
+        script.extract()
+
+    # 逐个文本节点处理空白字符，等价于 get_text(separator="\n", strip=True) 后逐行清理
+    for string in soup.stripped_strings:
+        lines = (line.strip() for line in string.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = '\n'.join(chunk for chunk in chunks if chunk)
+        if text:
+            yield text + "\n"
@@ -0,0 +1,318 @@
+"""
+LLM客户端模块 - 进程内共享的OpenAI客户端，复用HTTP连接池和TLS会话；
+以流式方式发起对话请求，记录首token时间、生成速度和总耗时，经共享限流器限速和重试
+"""
+import time
+import asyncio
+import threading
+
+import httpx
+import openai
+from loguru import logger
+from openai.types import CompletionUsage
+
+from config import AI_CONFIG
+from database import get_db
+from rate_limiter import get_rate_limiter, classify_error
+from telemetry import stage as timed_stage
+
+# 预留TPM配额时对输出token数的估计，请求完成后按实际用量修正
+ESTIMATED_OUTPUT_TOKENS = 1024
+
+
+def _build_limits() -> httpx.Limits:
+    """根据AI_CONFIG构建连接池限制"""
+    max_connections = AI_CONFIG.get("max_connections", 20)
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=AI_CONFIG.get("max_keepalive_connections", max_connections),
+        keepalive_expiry=AI_CONFIG.get("keepalive_expiry", 60),
+    )
+
+
+def _build_timeout() -> httpx.Timeout:
+    """根据AI_CONFIG构建请求超时（总结请求的输出较长，默认读超时放宽到10分钟）"""
+    return httpx.Timeout(
+        AI_CONFIG.get("timeout", 600),
+        connect=AI_CONFIG.get("connect_timeout", 10),
+    )
+
+
+def _build_stream_timeout() -> httpx.Timeout:
+    """流式请求的超时：读超时即两次收到数据之间的最长间隔，超过则视为连接停滞并中止"""
+    return httpx.Timeout(
+        AI_CONFIG.get("timeout", 600),
+        connect=AI_CONFIG.get("connect_timeout", 10),
+        read=AI_CONFIG.get("stream_inactivity_timeout", 60),
+    )
+
+
+# 全局客户端实例
+_client = None
+_client_lock = threading.Lock()
+
+def get_llm_client() -> openai.OpenAI:
+    """获取进程内共享的OpenAI客户端（线程安全）
+
+    底层httpx连接池是线程安全的，过滤和总结的线程池可以直接共用同一个客户端。
+
+    Returns:
+        openai.OpenAI实例
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = openai.OpenAI(
+                base_url=AI_CONFIG["base_url"],
+                api_key=AI_CONFIG["api_key"],
+                timeout=_build_timeout(),
+                max_retries=0,  # 重试由共享限流器统一处理，以便感知限流并调整并发
+                http_client=openai.DefaultHttpxClient(
+                    limits=_build_limits(),
+                    timeout=_build_timeout(),
+                ),
+            )
+        return _client
+
+
+def create_async_llm_client() -> openai.AsyncOpenAI:
+    """创建带连接池配置的异步OpenAI客户端
+
+    异步客户端绑定在创建它的事件循环上，每次运行（asyncio.run）需要新建一个，
+    由调用方在运行结束时关闭。
+
+    Returns:
+        openai.AsyncOpenAI实例
+    """
+    return openai.AsyncOpenAI(
+        base_url=AI_CONFIG["base_url"],
+        api_key=AI_CONFIG["api_key"],
+        timeout=_build_timeout(),
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(
+            limits=_build_limits(),
+            timeout=_build_timeout(),
+        ),
+    )
+
+
+def _request_kwargs(prompt: str, temperature: float, stream: bool) -> dict:
+    """构建对话请求参数"""
+    kwargs = {
+        "model": AI_CONFIG["model"],
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+    }
+    if stream:
+        kwargs.update(
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=_build_stream_timeout(),
+        )
+    return kwargs
+
+
+def _estimate_usage(prompt: str, content: str) -> CompletionUsage:
+    """服务端未返回usage时按文本估算token数"""
+    from text_budget import count_tokens
+
+    logger.warning("LLM响应未包含usage，token数按文本估算")
+    prompt_tokens = count_tokens(prompt)
+    completion_tokens = count_tokens(content)
+    return CompletionUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+def _record_metrics(stage: str, stream: bool, start: float, first_token: float,
+                    end: float, usage, status: str):
+    """计算并记录单次调用的性能指标，记录失败不影响调用结果"""
+    latency = end - start
+    ttft = first_token - start if first_token is not None else None
+    completion_tokens = usage.completion_tokens if usage else 0
+    # 流式请求按首token之后的生成时间计算速度，非流式只能按总耗时计算
+    generation_time = end - first_token if first_token is not None else latency
+    tokens_per_sec = completion_tokens / generation_time if generation_time > 0 else None
+
+    if status == "ok":
+        ttft_text = f"{ttft:.2f}s" if ttft is not None else "-"
+        speed_text = f"{tokens_per_sec:.1f} token/s" if tokens_per_sec is not None else "-"
+        logger.info(f"LLM调用完成 [{stage}] 首token {ttft_text}，总耗时 {latency:.2f}s，{speed_text}")
+    try:
+        get_db().record_llm_call(
+            stage=stage,
+            model=AI_CONFIG["model"],
+            stream=stream,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=completion_tokens,
+            ttft_ms=ttft * 1000 if ttft is not None else None,
+            latency_ms=latency * 1000,
+            tokens_per_sec=tokens_per_sec,
+            status=status,
+        )
+    except Exception as e:
+        logger.warning(f"记录LLM调用指标失败: {str(e)}")
+
+
+def _error_status(error: Exception) -> str:
+    """把异常归类为指标中的状态"""
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    return "error"
+
+
+def _chat_completion_once(prompt: str, temperature: float, stage: str):
+    """发起一次对话请求（不重试），流式接收并记录性能指标"""
+    client = get_llm_client()
+    stream = AI_CONFIG.get("stream", True)
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    try:
+        if stream:
+            parts = []
+            response = client.chat.completions.create(**_request_kwargs(prompt, temperature, True))
+            try:
+                for chunk in response:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        parts.append(chunk.choices[0].delta.content)
+            finally:
+                response.close()
+            content = "".join(parts)
+        else:
+            response = client.chat.completions.create(**_request_kwargs(prompt, temperature, False))
+            usage = response.usage
+            content = response.choices[0].message.content
+    except Exception as e:
+        _record_metrics(stage, stream, start, first_token, time.perf_counter(), usage, _error_status(e))
+        raise
+
+    if usage is None:
+        usage = _estimate_usage(prompt, content)
+    _record_metrics(stage, stream, start, first_token, time.perf_counter(), usage, "ok")
+    return content, usage
+
+
+async def _achat_completion_once(client: openai.AsyncOpenAI, prompt: str, temperature: float, stage: str):
+    """发起一次对话请求（异步版本，不重试）"""
+    stream = AI_CONFIG.get("stream", True)
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    try:
+        if stream:
+            parts = []
+            response = await client.chat.completions.create(**_request_kwargs(prompt, temperature, True))
+            try:
+                async for chunk in response:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        parts.append(chunk.choices[0].delta.content)
+            finally:
+                await response.close()
+            content = "".join(parts)
+        else:
+            response = await client.chat.completions.create(**_request_kwargs(prompt, temperature, False))
+            usage = response.usage
+            content = response.choices[0].message.content
+    except Exception as e:
+        await asyncio.to_thread(_record_metrics, stage, stream, start, first_token,
+                                time.perf_counter(), usage, _error_status(e))
+        raise
+
+    if usage is None:
+        usage = _estimate_usage(prompt, content)
+    await asyncio.to_thread(_record_metrics, stage, stream, start, first_token,
+                            time.perf_counter(), usage, "ok")
+    return content, usage
+
+
+def _estimate_request_tokens(prompt: str) -> int:
+    """估算一次请求会消耗的token数，用于预留TPM配额"""
+    from text_budget import count_tokens
+    return count_tokens(prompt) + ESTIMATED_OUTPUT_TOKENS
+
+
+def chat_completion(prompt: str, temperature: float, stage: str):
+    """发起单轮对话请求，经共享限流器限速，遇到429/5xx/网络错误时退避重试
+
+    流式模式下逐块收集内容，若连续 stream_inactivity_timeout 秒没有收到数据则视为超时，
+    而不是一直挂起。AI_CONFIG["stream"] 为False时退回普通请求（只记录总耗时）。
+
+    Args:
+        prompt: 用户消息
+        temperature: 采样温度
+        stage: 调用阶段（filter/filter_batch/summary/chunk），写入指标表
+
+    Returns:
+        tuple: (回复内容, usage)
+    """
+    with timed_stage(f"llm_{stage}"):
+        return _chat_completion_with_retry(prompt, temperature, stage)
+
+
+def _chat_completion_with_retry(prompt: str, temperature: float, stage: str):
+    """限速、重试的主体逻辑，耗时由 chat_completion 记录"""
+    limiter = get_rate_limiter()
+    estimated = _estimate_request_tokens(prompt)
+    for attempt in range(limiter.max_retries + 1):
+        time.sleep(limiter.reserve(estimated))
+        limiter.concurrency.acquire()
+        usage = None
+        try:
+            content, usage = _chat_completion_once(prompt, temperature, stage)
+            return content, usage
+        except Exception as e:
+            retryable, throttled, retry_after = classify_error(e)
+            if throttled:
+                limiter.concurrency.on_throttle(retry_after)
+            if not retryable or attempt == limiter.max_retries:
+                raise
+            delay = limiter.backoff(attempt, retry_after)
+            logger.warning(f"LLM请求失败 [{stage}]: {str(e)}，{delay:.1f}秒后进行第{attempt + 1}次重试")
+        finally:
+            limiter.concurrency.release(usage is not None)
+            limiter.settle(estimated, usage.total_tokens if usage else 0)
+        time.sleep(delay)
+
+
+async def achat_completion(client: openai.AsyncOpenAI, prompt: str, temperature: float, stage: str):
+    """发起单轮对话请求（异步版本），与同步版本共用限流器，参数和返回值同 chat_completion"""
+    with timed_stage(f"llm_{stage}"):
+        return await _achat_completion_with_retry(client, prompt, temperature, stage)
+
+
+async def _achat_completion_with_retry(client: openai.AsyncOpenAI, prompt: str, temperature: float, stage: str):
+    """异步版本的限速、重试主体逻辑"""
+    limiter = get_rate_limiter()
+    estimated = _estimate_request_tokens(prompt)
+    for attempt in range(limiter.max_retries + 1):
+        await asyncio.sleep(limiter.reserve(estimated))
+        while (wait := limiter.concurrency.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+        usage = None
+        try:
+            content, usage = await _achat_completion_once(client, prompt, temperature, stage)
+            return content, usage
+        except Exception as e:
+            retryable, throttled, retry_after = classify_error(e)
+            if throttled:
+                limiter.concurrency.on_throttle(retry_after)
+            if not retryable or attempt == limiter.max_retries:
+                raise
+            delay = limiter.backoff(attempt, retry_after)
+            logger.warning(f"LLM请求失败 [{stage}]: {str(e)}，{delay:.1f}秒后进行第{attempt + 1}次重试")
+        finally:
+            limiter.concurrency.release(usage is not None)
+            limiter.settle(estimated, usage.total_tokens if usage else 0)
+        await asyncio.sleep(delay)
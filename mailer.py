@@ -0,0 +1,277 @@
+"""
+邮件模块 - 所有邮件经同一个已登录的SMTP会话依次发送，会话断开时自动重连；
+报告先写入数据库中的发件箱，由发送线程按指数退避重试投递
+"""
+import queue
+import smtplib
+import socket
+import threading
+from concurrent.futures import Future
+from email.mime.text import MIMEText
+from typing import Dict
+
+import markdown2
+from loguru import logger
+
+from config import EMAIL_SERVER_CONFIG
+import telemetry
+
+# 唤醒发送线程检查发件箱的标记
+_WAKE = object()
+
+
+def build_message(subject: str, content: str, receiver_email: str) -> MIMEText:
+    """将Markdown内容渲染为HTML邮件"""
+    html_content = markdown2.markdown(content, extras=["tables", "latex", "fenced-code-blocks"])
+    msg = MIMEText(html_content, "html", "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = EMAIL_SERVER_CONFIG["sender"]
+    msg["To"] = receiver_email
+    return msg
+
+
+def split_receivers(receiver_email: str):
+    """拆分逗号分隔的多个收件人"""
+    return [receiver.strip() for receiver in receiver_email.split(",") if receiver.strip()]
+
+
+class MailDispatcher:
+    """邮件发送器：后台线程复用同一个SMTP会话发送邮件
+
+    邮件来源有两个：直接加入内存队列的邮件，以及数据库发件箱中到期的报告。
+    连接在第一封邮件时建立，空闲超过 idle_timeout 秒后主动断开；
+    发送时发现会话已断开（服务端超时踢掉等）会重连后重发一次。
+    发件箱中发送失败的报告按指数退避重试，达到 outbox_max_attempts 次后标记为失败。
+    """
+
+    def __init__(self, idle_timeout: float = 30, max_attempts: int = 8, retry_seconds: float = 60):
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._queue = queue.Queue()
+        self._server = None
+        self._last_error = None
+        self._worker = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+        self._worker.start()
+
+    def _connect(self):
+        """建立并登录SMTP会话；465端口使用SMTP_SSL，其余端口按 use_tls 决定是否STARTTLS"""
+        host = EMAIL_SERVER_CONFIG["smtp_server"]
+        port = EMAIL_SERVER_CONFIG["smtp_port"]
+        timeout = EMAIL_SERVER_CONFIG.get("timeout", 30)
+        logger.info(f"正在连接SMTP服务器 {host}:{port}...")
+        if port == 465:
+            server = smtplib.SMTP_SSL(host, port, timeout=timeout)
+        else:
+            server = smtplib.SMTP(host, port, timeout=timeout)
+            if EMAIL_SERVER_CONFIG.get("use_tls", True):
+                server.starttls()  # 启用TLS加密
+        server.login(EMAIL_SERVER_CONFIG["sender"], EMAIL_SERVER_CONFIG["password"])
+        self._server = server
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception as e:
+            logger.warning(f"关闭SMTP连接时发生错误: {str(e)}")
+        self._server = None
+
+    def _deliver(self, msg: MIMEText, receivers, user_name: str = None) -> bool:
+        """发送一封邮件并记录发送耗时"""
+        with telemetry.stage("smtp_send", ", ".join(receivers), user=user_name) as span:
+            span.bytes = len(msg.as_bytes())
+            sent = self._deliver_once(msg, receivers)
+            if not sent:
+                span.outcome = "failed"
+            return sent
+
+    def _deliver_once(self, msg: MIMEText, receivers) -> bool:
+        """在当前会话上发送一封邮件，会话断开时重连后重试一次"""
+        for attempt in range(2):
+            try:
+                if self._server is None:
+                    self._connect()
+                self._last_error = None
+                self._server.sendmail(EMAIL_SERVER_CONFIG["sender"], receivers, msg.as_string())
+                logger.success(f"邮件发送成功: {', '.join(receivers)}")
+                return True
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # 复用的会话可能已被服务端关闭，丢弃后重连
+                self._server = None
+                self._last_error = str(e)
+                if attempt == 0:
+                    logger.info(f"SMTP会话已断开（{str(e)}），重新连接")
+                    continue
+                logger.error(f"邮件发送失败: {str(e)}")
+            except socket.timeout:
+                self._last_error = "SMTP超时"
+                logger.warning("连接SMTP服务器超时，跳过本次邮件发送")
+                self._disconnect()
+            except smtplib.SMTPException as e:
+                self._last_error = f"{type(e).__name__}: {str(e)}"
+                logger.error(
+                    f"SMTP错误: {e.smtp_error.decode() if hasattr(e, 'smtp_error') else str(e)}"
+                )
+                # 收件人被拒等错误不影响会话，认证失败等错误需要重建会话
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    self._disconnect()
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {str(e)}"
+                logger.error(f"邮件发送失败: {str(e)}")
+                logger.error(f"错误类型: {type(e).__name__}")
+                self._disconnect()
+            return False
+        return False
+
+    def _retry_delay(self, attempts: int) -> float:
+        """第attempts次失败后的重试间隔：指数退避，最长1小时"""
+        return min(3600.0, self.retry_seconds * 2 ** max(0, attempts - 1))
+
+    def _drain_outbox(self) -> int:
+        """发送发件箱中所有已到期的报告
+
+        Returns:
+            本轮尝试发送的邮件数
+        """
+        from database import get_db
+
+        db = get_db()
+        attempted = 0
+        while True:
+            rows = db.get_due_outbox()
+            if not rows:
+                return attempted
+            for row in rows:
+                attempted += 1
+                # 单条报告渲染或发送出错时只让这一条退避重试，不影响发件箱中其他用户的报告
+                try:
+                    msg = build_message(row["subject"], row["content"], row["receiver"])
+                    if self._deliver(msg, split_receivers(row["receiver"]), row["user_name"]):
+                        db.mark_outbox_sent(row["id"])
+                        continue
+                    error = self._last_error or "发送失败"
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"用户 {row['user_name']} 的报告处理失败: {error}")
+                attempts = row["attempts"] + 1
+                delay = self._retry_delay(attempts)
+                if db.mark_outbox_failed(row["id"], error, delay, self.max_attempts):
+                    logger.warning(f"用户 {row['user_name']} 的报告发送失败（第 {attempts} 次），"
+                                   f"{int(delay)} 秒后重试")
+                else:
+                    logger.error(f"用户 {row['user_name']} 的报告发送失败 {attempts} 次，放弃发送，"
+                                 f"可用 --flush-outbox 手动重试")
+
+    def _poll_timeout(self) -> float:
+        """等待新邮件的超时：不超过空闲断开时间，也不错过发件箱中最近一次重试"""
+        from database import get_db
+
+        try:
+            next_attempt = get_db().get_next_outbox_attempt()
+        except Exception as e:
+            logger.warning(f"查询发件箱失败: {str(e)}")
+            next_attempt = None
+        if next_attempt is None:
+            return self.idle_timeout
+        return max(1.0, min(self.idle_timeout, next_attempt))
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._poll_timeout())
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None and item is not _WAKE:
+                    future, msg, receivers = item
+                    try:
+                        future.set_result(self._deliver(msg, receivers))
+                    except BaseException as e:
+                        future.set_exception(e)
+                try:
+                    attempted = self._drain_outbox()
+                except Exception as e:
+                    logger.error(f"处理发件箱失败: {str(e)}")
+                    attempted = 0
+                if attempted:
+                    telemetry.flush()
+                if item is None and not attempted:
+                    # 一段时间没有新邮件，释放连接
+                    self._disconnect()
+            finally:
+                if item is not None:
+                    self._queue.task_done()
+
+    def enqueue(self, subject: str, content: str, receiver_email: str) -> Future:
+        """把邮件加入发送队列，立即返回
+
+        Returns:
+            concurrent.futures.Future，发送完成后结果为是否成功
+        """
+        future = Future()
+        self._queue.put((future, build_message(subject, content, receiver_email),
+                         split_receivers(receiver_email)))
+        return future
+
+    def wake(self):
+        """通知发送线程检查发件箱，立即返回"""
+        self._queue.put(_WAKE)
+
+    def flush(self):
+        """等待队列中的邮件和发件箱中已到期的报告都尝试发送一遍"""
+        self._queue.put(_WAKE)
+        self._queue.join()
+
+
+# 全局发送器实例
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_mail_dispatcher() -> MailDispatcher:
+    """获取进程内共享的邮件发送器（线程安全）"""
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher(
+                idle_timeout=EMAIL_SERVER_CONFIG.get("idle_timeout", 30),
+                max_attempts=EMAIL_SERVER_CONFIG.get("outbox_max_attempts", 8),
+                retry_seconds=EMAIL_SERVER_CONFIG.get("outbox_retry_seconds", 60),
+            )
+        return _dispatcher
+
+
+def queue_report(user_name: str, receiver_email: str, content: str) -> bool:
+    """把用户的每日报告写入发件箱并通知发送线程，不等待SMTP
+
+    Returns:
+        是否加入了待发送队列（当天报告已发送过时返回False）
+    """
+    from database import get_db
+
+    queued = get_db().enqueue_outbox(user_name, receiver_email, f"每日ArXiv论文报告 - {user_name}", content)
+    if queued:
+        get_mail_dispatcher().wake()
+    return queued
+
+
+def flush_outbox(report_date: str = None, user_name: str = None, include_sent: bool = False) -> Dict[str, int]:
+    """立即发送发件箱中的报告（忽略退避时间，已放弃的也重新尝试），等待本轮发送结束
+
+    Args:
+        report_date: 只处理指定日期的报告
+        user_name: 只处理指定用户的报告
+        include_sent: 是否重新投递已经发送过的报告
+
+    Returns:
+        发送结束后发件箱中各状态的邮件数量
+    """
+    from database import get_db
+
+    db = get_db()
+    count = db.reset_outbox(report_date, user_name, include_sent)
+    logger.info(f"发件箱中有 {count} 封邮件待发送")
+    get_mail_dispatcher().flush()
+    return db.get_outbox_counts()
@@ -1,106 +1,85 @@
 import os
-import requests
+import re
+import json
+import argparse
 from datetime import datetime, timedelta
 from arxiv import Client, Search, SortCriterion, SortOrder
-from PyPDF2 import PdfReader
-import openai
 
-from config import AI_CONFIG, EMAIL_SERVER_CONFIG, GENERAL_CONFIG, USERS_CONFIG, DEFAULT_PROMPT_TEMPLATE
-from database import get_db
+from config import AI_CONFIG, GENERAL_CONFIG, USERS_CONFIG, DEFAULT_PROMPT_TEMPLATE
+from database import get_db, prompt_hash
+from paper_cache import get_paper_cache
+from resource_limits import get_limiter
+from llm_client import chat_completion
+from downloader import download_file, get_http_session
+from scheduler import get_fair_executor, KeyedLock
+from mailer import get_mail_dispatcher, queue_report, flush_outbox
+import telemetry
+from prefilter import prefilter_papers
+from pdf_extract import iter_pdf_pages
+from html_extract import iter_html_text
+from text_budget import (read_within_budget, skip_references, fit_text_to_budget, get_text_budget,
+                         get_extract_budget, count_tokens, split_into_chunks)
 
-import smtplib
-import socket
 import asyncio
-from email.mime.text import MIMEText
-import markdown2  # 导入markdown2库
 from loguru import logger
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-import time
-from bs4 import BeautifulSoup
 import subprocess
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# 论文总结的生成温度（同时作为总结缓存键的一部分）
+SUMMARY_TEMPERATURE = 1.5
 
+# map-reduce总结中分块摘要的提示词和温度（分块摘要只做信息提炼，使用较低温度）
+CHUNK_SUMMARY_PROMPT = """以下是一篇学术论文的第{index}/{total}部分（相邻部分之间有少量重叠）。
+请用中文提炼这一部分的要点，包括研究问题、方法细节、实验设置与结果、结论等其中出现的内容，
+保留关键数字和专有名词，不要评价，不要补充原文没有的信息，只输出要点列表。
 
-async def send_email(subject, content, receiver_email):
-    """发送邮件通知（异步版本）"""
-    # 将Markdown内容转换为HTML
-    html_content = markdown2.markdown(content, extras=["tables", "latex", "fenced-code-blocks"])
-    msg = MIMEText(html_content, "html", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = EMAIL_SERVER_CONFIG["sender"]
-    msg["To"] = receiver_email
-
-    server = None
-    try:
-        logger.info(f"正在连接SMTP服务器，发送给 {receiver_email}...")
-        # 将SMTP操作放在线程池中执行，以避免阻塞事件循环
-        return await asyncio.get_event_loop().run_in_executor(
-            None, lambda: _send_email_sync(msg, server, receiver_email)
-        )
-    except Exception as e:
-        logger.error(f"邮件发送失败: {str(e)}")
-        logger.error(f"错误类型: {type(e).__name__}")
-        return False
+{text}"""
+CHUNK_SUMMARY_TEMPERATURE = 0.3
 
 
-def _send_email_sync(msg, server=None, receiver_email=None):
-    """同步发送邮件的内部函数"""
-    try:
-        server = smtplib.SMTP(
-            EMAIL_SERVER_CONFIG["smtp_server"], EMAIL_SERVER_CONFIG["smtp_port"], timeout=10
-        )
-        server.starttls()  # 启用TLS加密
-        server.login(EMAIL_SERVER_CONFIG["sender"], EMAIL_SERVER_CONFIG["password"])
-
-        if receiver_email.count(",") > 0:
-            receivers = receiver_email.split(",")
-            server.sendmail(EMAIL_SERVER_CONFIG["sender"], receivers, msg.as_string())
-        else:
-            server.sendmail(
-                EMAIL_SERVER_CONFIG["sender"], [receiver_email], msg.as_string()
-            )
+async def send_email(subject, content, receiver_email):
+    """发送邮件通知（异步版本），经共享的SMTP会话发送
 
-        logger.success("邮件发送成功")
-        return True
-    except socket.timeout:
-        logger.warning("连接SMTP服务器超时，跳过本次邮件发送")
-        return False
-    except smtplib.SMTPException as e:
-        logger.error(
-            f"SMTP错误: {e.smtp_error.decode() if hasattr(e, 'smtp_error') else str(e)}"
-        )
-        return False
+    Returns:
+        bool: 是否发送成功
+    """
+    try:
+        return await asyncio.wrap_future(get_mail_dispatcher().enqueue(subject, content, receiver_email))
     except Exception as e:
         logger.error(f"邮件发送失败: {str(e)}")
         logger.error(f"错误类型: {type(e).__name__}")
         return False
-    finally:
-        if server:
-            try:
-                server.quit()
-            except Exception as e:
-                logger.warning(f"关闭SMTP连接时发生错误: {str(e)}")
 
 
-def fetch_papers(arxiv_categories):
-    """获取指定分类的论文"""
-    # 构建搜索查询，只包含配置中的主题
-    search_query = " OR ".join([f"cat:{cat}" for cat in arxiv_categories])
-    client = Client(
+def create_arxiv_client():
+    """创建arXiv API客户端
+
+    同一个客户端内部会保证请求间隔，多个分类共用一个客户端即可共享限流节奏。
+    """
+    return Client(
         page_size=50,  # 减小每页大小
         delay_seconds=3,  # 增加请求间隔到3秒，避免被限流
         num_retries=5  # 增加重试次数
     )
-    search = Search(
-        query=search_query,
-        sort_by=SortCriterion.SubmittedDate,
-        sort_order=SortOrder.Descending,
-        max_results=100
-    )
 
-    papers = []
+# 全局arXiv客户端，所有抓取共用同一个请求间隔
+_arxiv_client = None
+_arxiv_client_lock = threading.Lock()
+
+def get_arxiv_client():
+    """获取进程内共享的arXiv客户端（线程安全）"""
+    global _arxiv_client
+
+    with _arxiv_client_lock:
+        if _arxiv_client is None:
+            _arxiv_client = create_arxiv_client()
+        return _arxiv_client
+
+def get_target_date():
+    """计算默认抓取起点：days_lookback 天前的零点，遇到周末则回退到周五"""
     # Get the target date (previous workday)
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     target_date = today - timedelta(days=GENERAL_CONFIG["days_lookback"])
@@ -110,14 +89,47 @@ def fetch_papers(arxiv_categories):
     if weekday >= 5:  # If Saturday or Sunday
         # Go back to Friday (4)
         target_date -= timedelta(days=weekday - 4)
+    return target_date
+
+def strip_arxiv_version(arxiv_id):
+    """去掉arXiv ID的版本号，如 2410.01234v2 -> 2410.01234"""
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+def fetch_papers(arxiv_categories, client=None, since=None):
+    """获取指定分类的论文
+
+    结果按提交时间倒序分页获取，遇到早于起点的论文即停止，不再受固定条数上限截断。
 
-    logger.info(f"Target date set to previous workday: {target_date.strftime('%Y-%m-%d')}")
-    for result in client.results(search):
-        logger.info(f"Processing paper: {result.title} published on {result.published}")
-        # Check if the paper was published on the target date
-        published_dt = result.published.replace(tzinfo=None)
-        if target_date <= published_dt :
+    Args:
+        arxiv_categories: arXiv分类列表
+        client: 可选的共享arXiv客户端，不传则新建
+        since: 可选的抓取起点（不含时区的UTC时间），不传则使用 get_target_date()
+    """
+    # 构建搜索查询，只包含配置中的主题
+    search_query = " OR ".join([f"cat:{cat}" for cat in arxiv_categories])
+    if client is None:
+        client = get_arxiv_client()
+    search = Search(
+        query=search_query,
+        sort_by=SortCriterion.SubmittedDate,
+        sort_order=SortOrder.Descending,
+        max_results=None
+    )
+
+    papers = []
+    target_date = since if since is not None else get_target_date()
+
+    logger.info(f"Fetching papers submitted since {target_date.strftime('%Y-%m-%d %H:%M')}")
+    # arXiv API要求单连接访问，所有抓取串行执行
+    with get_limiter("arxiv"), telemetry.stage("arxiv_fetch", ",".join(arxiv_categories)):
+        for result in client.results(search):
+            published_dt = result.published.replace(tzinfo=None)
+            # 结果按提交时间倒序，越过起点后剩余页面无需再请求
+            if published_dt < target_date:
+                break
+            logger.info(f"Processing paper: {result.title} published on {result.published}")
             papers.append({
+                "arxiv_id": result.get_short_id(),  # 带版本号，如 2410.01234v2
                 "title": result.title,
                 "url": result.entry_id,
                 "pdf_url": result.pdf_url,
@@ -130,78 +142,183 @@ def fetch_papers(arxiv_categories):
     logger.success(f"Found {len(papers)} papers published from {target_date.strftime('%Y-%m-%d')}")
     return papers
 
-def download_pdf(url, filename, max_retries=3):
-    """下载PDF文件，带有重试机制"""
-        # 确保URL是正确的PDF链接
+def fetch_category_incremental(category, client, db):
+    """增量抓取单个分类：从高水位回退一个重叠窗口开始抓取，并剔除已处理过的论文
+
+    arXiv的提交时间和公开时间不一致，论文可能晚于高水位才出现在列表中，
+    因此需要重叠窗口兜底，重复部分由 seen_papers 去重。
+
+    Args:
+        category: arXiv分类
+        client: 共享arXiv客户端
+        db: 数据库实例
+
+    Returns:
+        tuple: (新论文列表, 该分类的抓取进度)，进度在整次运行结束后提交
+    """
+    watermark = db.get_fetch_watermark(category)
+    if watermark is None:
+        since = get_target_date()
+        logger.info(f"分类 {category} 首次抓取，起点为 {since.strftime('%Y-%m-%d')}")
+    else:
+        overlap = timedelta(hours=GENERAL_CONFIG.get("fetch_overlap_hours", 48))
+        since = datetime.fromisoformat(watermark["last_published"]) - overlap
+        logger.info(f"分类 {category} 高水位为 {watermark['last_published']}，从 {since.strftime('%Y-%m-%d %H:%M')} 开始抓取")
+
+    papers = fetch_papers([category], client=client, since=since)
+    seen = db.get_seen_paper_ids(category, [strip_arxiv_version(paper["arxiv_id"]) for paper in papers])
+    new_papers = [paper for paper in papers if strip_arxiv_version(paper["arxiv_id"]) not in seen]
+    if seen:
+        logger.info(f"分类 {category} 跳过 {len(papers) - len(new_papers)} 篇已处理过的论文")
+
+    progress = None
+    if papers:
+        newest = papers[0]  # 结果按提交时间倒序
+        progress = {
+            "papers": [{
+                "arxiv_id": strip_arxiv_version(paper["arxiv_id"]),
+                "published": paper["published"].replace(tzinfo=None).isoformat(),
+            } for paper in new_papers],
+            "last_published": newest["published"].replace(tzinfo=None).isoformat(),
+            "last_arxiv_id": newest["arxiv_id"],
+        }
+    return new_papers, progress
+
+def fetch_paper_index(users_config):
+    """运行级抓取阶段：汇总所有用户关注的分类，每个分类只抓取一次
+
+    Args:
+        users_config: 用户配置列表
+
+    Returns:
+        tuple: (以arXiv ID为键的论文索引, 各分类的抓取进度)
+    """
+    categories = sorted({cat for user in users_config for cat in user["arxiv_categories"]})
+    logger.info(f"本次运行共需抓取 {len(categories)} 个分类: {', '.join(categories)}")
+
+    incremental = GENERAL_CONFIG.get("incremental_fetch", True)
+    client = get_arxiv_client()
+    db = get_db()
+    paper_index = {}
+    fetch_progress = {}
+    for category in categories:
+        try:
+            if incremental:
+                papers, progress = fetch_category_incremental(category, client, db)
+                if progress:
+                    fetch_progress[category] = progress
+            else:
+                papers = fetch_papers([category], client=client)
+            for paper in papers:
+                # 跨分类发布的论文只保留一份
+                paper_index.setdefault(paper["arxiv_id"], paper)
+        except Exception as e:
+            logger.error(f"抓取分类 {category} 失败: {str(e)}")
+
+    logger.success(f"论文索引构建完成，共 {len(paper_index)} 篇论文")
+    return paper_index, fetch_progress
+
+def commit_fetch_progress(fetch_progress, failed_users=()):
+    """运行结束后提交各分类的高水位和已处理论文，中途崩溃的运行下次会重新抓取
+
+    Args:
+        fetch_progress: 各分类的抓取进度
+        failed_users: 处理失败的用户配置列表，这些用户关注的分类不提交进度，重跑时仍能拿到这些论文
+    """
+    skipped = {category for user in failed_users for category in user["arxiv_categories"]}
+    if skipped & set(fetch_progress):
+        logger.warning(f"有用户处理失败，以下分类不提交抓取进度: {', '.join(sorted(skipped & set(fetch_progress)))}")
+    db = get_db()
+    for category, progress in fetch_progress.items():
+        if category in skipped:
+            continue
+        db.commit_fetch_progress(
+            category,
+            progress["papers"],
+            progress["last_published"],
+            progress["last_arxiv_id"],
+            retention_days=GENERAL_CONFIG.get("seen_papers_retention_days", 90),
+        )
+
+def select_user_papers(paper_index, arxiv_categories):
+    """从论文索引中筛选出属于用户关注分类的论文（按发表时间倒序）"""
+    wanted = set(arxiv_categories)
+    papers = [paper for paper in paper_index.values() if wanted & set(paper["categories"])]
+    papers.sort(key=lambda paper: paper["published"], reverse=True)
+    return papers
+
+def normalize_pdf_url(url):
+    """确保URL是正确的PDF链接"""
     if 'arxiv.org' in url and not url.endswith('.pdf'):
         # 从URL提取论文ID
         paper_id = url.split('/')[-1]
         url = f"https://arxiv.org/pdf/{paper_id}.pdf"
-    
+    return url
+
+def build_html_url(paper):
+    """从paper URL生成HTML链接"""
+    url = paper['url']
+    if 'arxiv.org' in url:
+        paper_id = url.split('/')[-1]
+        return f"https://arxiv.org/html/{paper_id}"
+    return url.replace('.pdf', '.html')
+
+def download_pdf(url, filename, max_retries=3):
+    """下载PDF文件，带有重试、断点续传和条件请求"""
+    url = normalize_pdf_url(url)
+
     logger.info(f"尝试下载: {url}")
-    
-    for attempt in range(max_retries):
+
+    with telemetry.stage("pdf_download", url) as span:
+        downloaded = download_file(url, filename, max_retries)
+        if not downloaded:
+            span.outcome = "failed"
+    return downloaded
+
+def extract_text_from_pdf(pdf_path, paper):
+    """从PDF逐页提取文本（生成器），增加错误处理
+
+    页面解析分发到进程池并行执行，调用方停止拉取后剩余页面不再解析。
+    """
+    # 限制同时解析的PDF数量，避免多篇论文争抢进程池
+    with get_limiter("extract"), telemetry.stage("pdf_extract", paper.get('arxiv_id') or pdf_path) as span:
         try:
-            response = requests.get(url, timeout=30)  # 添加超时参数
-            
-            # 检查响应是否成功且内容类型是PDF
-            if response.status_code == 200:
-                content_type = response.headers.get('Content-Type', '')
-                if 'pdf' not in content_type.lower() and len(response.content) < 10000:
-                    logger.warning(f"响应可能不是PDF文件 (Content-Type: {content_type})")
-                
-                with open(filename, 'wb') as f:
-                    f.write(response.content)
-                
-                # 验证文件大小
-                file_size = os.path.getsize(filename)
-                if file_size < 1000:  # 小于1KB可能有问题
-                    logger.warning(f"下载的文件过小 ({file_size} 字节)")
-                    continue
-                
-                return True
-            else:
-                logger.error(f"下载失败: HTTP状态码 {response.status_code}")
+            for page_text in iter_pdf_pages(pdf_path):
+                span.bytes += len(page_text.encode("utf-8"))
+                yield page_text
+        except OSError as e:
+            span.outcome = "error"
+            logger.error(f"无法打开PDF文件: {str(e)}")
         except Exception as e:
-            logger.warning(f"尝试 {attempt+1}/{max_retries} 失败: {str(e)}")
-        
-        # 如果不是最后一次尝试，则等待一段时间再重试
-        if attempt < max_retries - 1:
-            time.sleep(2 * (attempt + 1))  # 指数退避
-    
-    return False
+            span.outcome = "error"
+            logger.error(f"PDF解析失败: {str(e)}")
 
-def extract_text_from_pdf(pdf_path, paper):
-    """从PDF提取文本，增加错误处理"""
-    text = ""
-    try:
-        with open(pdf_path, 'rb') as f:
-            try:
-                reader = PdfReader(f)
-                for page_num, page in enumerate(reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-                    except Exception as e:
-                        logger.warning(f"无法提取第 {page_num+1} 页: {str(e)}")
-            except Exception as e:
-                logger.error(f"PDF解析失败: {str(e)}")
-                # 如果是EOF错误，尝试使用另一种方法
-                if "EOF" in str(e):
-                    # 可以尝试使用其他库如pdfminer或pdfplumber
-                    logger.info("尝试备用PDF解析方法")
-                    # 这里可以添加备用解析代码
-    except Exception as e:
-        logger.error(f"无法打开PDF文件: {str(e)}")
-    
-    return text
+def read_pdf_text(pdf_path, paper):
+    """按提取预算从PDF读取文本，跳过参考文献"""
+    return read_within_budget(skip_references(extract_text_from_pdf(pdf_path, paper)),
+                              get_extract_budget())
 
 def download_pdf_and_extract_text(paper, user_dir):
-    """下载PDF并提取文本，增加错误处理"""
-    pdf_path = f"{user_dir}/{paper['title']}.pdf"
-    if download_pdf(paper['pdf_url'], pdf_path):
-        text = extract_text_from_pdf(pdf_path, paper)
+    """下载PDF并提取文本，增加错误处理
+
+    带arXiv ID的论文使用共享缓存目录中的PDF，已缓存的PDF不再重复下载。
+    """
+    arxiv_id = paper.get('arxiv_id')
+    if arxiv_id:
+        cache = get_paper_cache()
+        pdf_path = cache.pdf_path(arxiv_id)
+        if cache.has_pdf(arxiv_id):
+            logger.info(f"PDF缓存命中: {arxiv_id}")
+            telemetry.record("pdf_download", arxiv_id, outcome="cache_hit")
+            downloaded = True
+        else:
+            downloaded = download_pdf(paper['pdf_url'], pdf_path)
+    else:
+        pdf_path = f"{user_dir}/{paper['title']}.pdf"
+        downloaded = download_pdf(paper['pdf_url'], pdf_path)
+
+    if downloaded:
+        text = read_pdf_text(pdf_path, paper)
         if not text:
             logger.warning(f"警告: 无法从 {paper['title']} 提取文本")
         return text
@@ -209,59 +326,68 @@ def download_pdf_and_extract_text(paper, user_dir):
         logger.error(f"错误: 无法下载 {paper['title']} 的PDF")
         return ""
 
+def extract_text_from_html(html_content, paper, user_dir):
+    """从已下载的HTML内容中逐段提取文本（生成器）
+
+    优先尝试用wkhtmltopdf转为PDF后提取，失败或内容不足时直接解析HTML。
+    """
+    # 创建一个临时HTML文件
+    temp_html_path = f"{user_dir}/{paper['title']}_temp.html"
+    with open(temp_html_path, 'wb') as f:
+        f.write(html_content)
+
+    # 使用wkhtmltopdf将HTML转换为PDF (需要安装wkhtmltopdf)
+    pdf_path = f"{user_dir}/{paper['title']}_from_html.pdf"
+    try:
+        subprocess.run(['wkhtmltopdf', temp_html_path, pdf_path],
+                      check=True, timeout=60)
+        logger.info(f"已将HTML转换为PDF: {pdf_path}")
+
+        # 尝试从生成的PDF提取文本，先取够1000字符判断提取是否有效
+        pages = extract_text_from_pdf(pdf_path, paper)
+        head = []
+        head_len = 0
+        for page_text in pages:
+            head.append(page_text)
+            head_len += len(page_text)
+            if head_len > 1000:
+                break
+        if head_len > 1000:
+            yield from head
+            yield from pages
+            return
+        pages.close()
+    except Exception as pdf_err:
+        logger.error(f"HTML转PDF失败: {str(pdf_err)}")
+
+    # 如果PDF转换失败或提取文本不足，则直接从HTML提取
+    yield from iter_html_text(html_content, GENERAL_CONFIG.get("html_parser", "html.parser"))
+
+def read_html_text(html_content, paper, user_dir):
+    """按提取预算从HTML读取文本，跳过参考文献"""
+    with telemetry.stage("html_extract", paper.get('arxiv_id') or paper['title']) as span:
+        text = read_within_budget(skip_references(extract_text_from_html(html_content, paper, user_dir)),
+                                  get_extract_budget())
+        span.bytes = len(text.encode("utf-8"))
+    logger.info(f"从HTML提取了 {len(text)} 字符的文本")
+    return text
+
 def download_html_and_extract_text(paper, user_dir):
     """从arxiv下载HTML版本，保存为PDF，然后提取文本"""
     try:
-        # 从paper URL生成HTML链接
-        url = paper['url']
-        if 'arxiv.org' in url:
-            paper_id = url.split('/')[-1]
-            html_url = f"https://arxiv.org/html/{paper_id}"
-        else:
-            html_url = url.replace('.pdf', '.html')
+        html_url = build_html_url(paper)
 
         logger.info(f"尝试下载HTML: {html_url}")
 
         # 下载HTML内容
-        response = requests.get(html_url, timeout=30)
+        with get_limiter("download"), telemetry.stage("html_download", html_url) as span:
+            response = get_http_session().get(html_url, timeout=30)
+            span.bytes = len(response.content)
+            if response.status_code != 200:
+                span.outcome = "failed"
 
         if response.status_code == 200:
-            # 创建一个临时HTML文件
-            temp_html_path = f"{user_dir}/{paper['title']}_temp.html"
-            with open(temp_html_path, 'wb') as f:
-                f.write(response.content)
-
-            # 使用wkhtmltopdf将HTML转换为PDF (需要安装wkhtmltopdf)
-            pdf_path = f"{user_dir}/{paper['title']}_from_html.pdf"
-            try:
-                subprocess.run(['wkhtmltopdf', temp_html_path, pdf_path],
-                              check=True, timeout=60)
-                logger.info(f"已将HTML转换为PDF: {pdf_path}")
-                
-                # 尝试从生成的PDF提取文本
-                pdf_text = extract_text_from_pdf(pdf_path, paper)
-                if pdf_text and len(pdf_text) > 1000:
-                    return pdf_text
-            except Exception as pdf_err:
-                logger.error(f"HTML转PDF失败: {str(pdf_err)}")
-            
-            # 如果PDF转换失败或提取文本不足，则直接从HTML提取
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 移除脚本和样式元素
-            for script in soup(["script", "style"]):
-                script.extract()
-                
-            # 获取文本
-            text = soup.get_text(separator="\n", strip=True)
-            
-            # 处理空白字符
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            
-            logger.info(f"从HTML提取了 {len(text)} 字符的文本")
-            return text
+            return read_html_text(response.content, paper, user_dir)
         else:
             logger.error(f"HTML下载失败: HTTP状态码 {response.status_code}")
             return ""
@@ -269,125 +395,324 @@ def download_html_and_extract_text(paper, user_dir):
         logger.error(f"HTML处理错误: {str(e)}")
         return ""
 
-def get_paper_text(paper, user_dir):
-    """尝试多种方式获取论文文本内容"""
-    # 首先尝试PDF方式
-    text = download_pdf_and_extract_text(paper, user_dir)
-
-    # 如果PDF方式失败，尝试HTML方式
-    if not text or len(text) < 1000:  # 内容太少可能是提取失败
-        logger.info(f"PDF提取失败或内容太少，尝试HTML方式")
-        text = download_html_and_extract_text(paper, user_dir)
-
-    # 如果text长于129024 则截断
-    if len(text) > 129024:
-        logger.warning(f"文本内容过长，截断到前129024字符")
-        text = text[:129024]
+def get_cached_paper_text(paper):
+    """查询共享文本缓存，命中则返回文本，否则返回None"""
+    arxiv_id = paper.get('arxiv_id')
+    if arxiv_id:
+        cached_text = get_paper_cache().get_text(arxiv_id, get_extract_budget())
+        if cached_text:
+            logger.info(f"文本缓存命中: {arxiv_id}")
+            return cached_text
+    return None
+
+def finalize_paper_text(paper, text):
+    """写入文本缓存，所有方法都失败时回退到摘要
+
+    缓存的是按提取预算读取的文本，总结时再按提示词和章节优先级压缩到正文预算内。
+
+    Returns:
+        tuple: (文本, 是否回退到了摘要)
+    """
+    if text and paper.get('arxiv_id'):
+        get_paper_cache().put_text(paper['arxiv_id'], text, get_extract_budget())
     if not text:
-        text = paper['abstract']  # 如果所有方法都失败，使用摘要作为最后的fallback
+        logger.warning(f"无法获取 {paper['title']} 的正文，使用摘要总结，结果不写入总结缓存")
+        return paper['abstract'], True  # 如果所有方法都失败，使用摘要作为最后的fallback
 
-    return text
+    return text, False
+
+# 按arXiv ID加锁：多个用户同时需要同一篇论文时只下载、解析一次，其余用户等待后命中文本缓存
+_text_locks = KeyedLock()
+
+def get_paper_text(paper, user_dir):
+    """尝试多种方式获取论文文本内容
+
+    Returns:
+        tuple: (文本, 是否回退到了摘要)
+    """
+    with _text_locks.hold(paper.get('arxiv_id')):
+        # 先查共享文本缓存，命中则跳过下载和解析
+        cached_text = get_cached_paper_text(paper)
+        if cached_text:
+            return cached_text, False
+
+        # 首先尝试PDF方式
+        text = download_pdf_and_extract_text(paper, user_dir)
+
+        # 如果PDF方式失败，尝试HTML方式
+        if not text or len(text) < 1000:  # 内容太少可能是提取失败
+            logger.info(f"PDF提取失败或内容太少，尝试HTML方式")
+            text = download_html_and_extract_text(paper, user_dir)
+
+        return finalize_paper_text(paper, text)
+
+def token_stats_from_usage(usage):
+    """将API返回的usage转换为token使用统计字典"""
+    token_stats = {
+        'prompt_tokens': usage.prompt_tokens,
+        'completion_tokens': usage.completion_tokens,
+        'total_tokens': usage.total_tokens
+    }
+    logger.info(f"Token使用 - 输入: {usage.prompt_tokens}, 输出: {usage.completion_tokens}, 总计: {usage.total_tokens}")
+    return token_stats
+
+def parse_interest_answer(answer):
+    """根据AI回复判断是否感兴趣
+
+    Args:
+        answer: 已转为小写的AI回复
+
+    Returns:
+        bool: 是否感兴趣，无法明确判断时默认为感兴趣
+    """
+    # 判断AI回复是否表示感兴趣
+    # 支持多种可能的回答形式
+    interested = any(keyword in answer for keyword in ['是', 'yes', '感兴趣', '有兴趣', 'interested'])
+    not_interested = any(keyword in answer for keyword in ['否', 'no', '不感兴趣', '无兴趣', 'not interested'])
+
+    if interested and not not_interested:
+        return True
+    elif not_interested and not interested:
+        return False
+    else:
+        # 如果无法明确判断，默认为感兴趣（保守策略）
+        logger.warning(f"无法明确判断兴趣，默认为感兴趣。AI回复: {answer}")
+        return True
+
+# 按兴趣过滤缓存键加锁：提示词相同的用户同时过滤同一篇论文时只调用一次LLM
+_filter_locks = KeyedLock()
+
+def interest_cache_key(paper, interest_filter_prompt):
+    """构建兴趣过滤缓存键 (提示词哈希, arXiv ID, 模型)，论文没有arXiv ID时返回None"""
+    arxiv_id = paper.get('arxiv_id')
+    if not arxiv_id:
+        return None
+    return prompt_hash(interest_filter_prompt), arxiv_id, AI_CONFIG["model"]
+
+def lookup_interest_verdict(cache_key):
+    """查询兴趣过滤缓存
 
-def gpt_check_interest(abstract, interest_filter_prompt):
+    Returns:
+        tuple: 命中时返回 (bool, dict)，token统计中实际消耗为0，并记录节省的token数；未命中返回None
+    """
+    if cache_key is None:
+        return None
+    try:
+        cached = get_db().get_filter_verdict(*cache_key)
+    except Exception as e:
+        logger.warning(f"查询兴趣过滤缓存失败: {str(e)}")
+        return None
+    if cached is None:
+        return None
+
+    logger.info(f"兴趣过滤缓存命中: {cache_key[1]}，结果: {cached['answer']}")
+    return cached['is_interested'], cache_hit_token_stats(cached['prompt_tokens'], cached['completion_tokens'])
+
+def gpt_check_interest(abstract, interest_filter_prompt, cache_key=None):
     """使用GPT判断用户是否对论文感兴趣
 
     Args:
         abstract: 论文摘要
         interest_filter_prompt: 兴趣过滤提示词，需包含{abstract}占位符
+        cache_key: 可选的缓存键（见interest_cache_key），传入时将判断结果写入缓存
 
     Returns:
         tuple: (bool, dict) 第一个元素表示是否感兴趣，第二个元素为token使用统计
     """
     prompt = interest_filter_prompt.format(abstract=abstract)
 
-    client = openai.OpenAI(
-        base_url=AI_CONFIG["base_url"],
-        api_key=AI_CONFIG["api_key"]
-    )
-
     logger.info(f"检查论文兴趣度...")
     try:
-        response = client.chat.completions.create(
-            model=AI_CONFIG["model"],
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }],
-            temperature=0.3,  # 降低温度以获得更一致的判断
-        )
+        # 降低温度以获得更一致的判断
+        content, usage = chat_completion(prompt, 0.3, "filter")
 
         # 记录token使用情况
-        usage = response.usage
-        token_stats = {
-            'prompt_tokens': usage.prompt_tokens,
-            'completion_tokens': usage.completion_tokens,
-            'total_tokens': usage.total_tokens
-        }
-        logger.info(f"Token使用 - 输入: {usage.prompt_tokens}, 输出: {usage.completion_tokens}, 总计: {usage.total_tokens}")
+        token_stats = token_stats_from_usage(usage)
 
-        answer = response.choices[0].message.content.strip().lower()
+        answer = content.strip().lower()
         logger.info(f"兴趣判断结果: {answer}")
-
-        # 判断AI回复是否表示感兴趣
-        # 支持多种可能的回答形式
-        interested = any(keyword in answer for keyword in ['是', 'yes', '感兴趣', '有兴趣', 'interested'])
-        not_interested = any(keyword in answer for keyword in ['否', 'no', '不感兴趣', '无兴趣', 'not interested'])
-
-        if interested and not not_interested:
-            return True, token_stats
-        elif not_interested and not interested:
-            return False, token_stats
-        else:
-            # 如果无法明确判断，默认为感兴趣（保守策略）
-            logger.warning(f"无法明确判断兴趣，默认为感兴趣。AI回复: {answer}")
-            return True, token_stats
+        is_interested = parse_interest_answer(answer)
+        if cache_key is not None:
+            get_db().save_filter_verdict(*cache_key, is_interested, answer,
+                                         token_stats['prompt_tokens'], token_stats['completion_tokens'])
+        return is_interested, token_stats
 
     except Exception as e:
         logger.error(f"兴趣判断失败: {str(e)}，默认为感兴趣")
         return True, {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}  # 出错时默认为感兴趣
 
-def gpt_summarize(text, custom_prompt=None):
-    """使用GPT对论文进行总结，支持自定义提示词
+# 批量过滤时追加在用户兴趣过滤提示词之后的输出格式要求
+BATCH_FILTER_INSTRUCTION = """
+
+注意：上面的"论文摘要"部分包含多篇论文，每篇以 [编号] 开头。请忽略只回答一个词的要求，\
+对每一篇论文分别判断，并且只输出一个JSON对象，键为论文编号，值为"是"或"否"，例如：{"1": "是", "2": "否"}"""
+
+def build_batch_filter_prompt(papers, interest_filter_prompt):
+    """将多篇论文的摘要按编号拼接后填入兴趣过滤提示词"""
+    abstracts = "\n\n".join(
+        f"[{i}] {paper['title']}\n{paper['abstract']}" for i, paper in enumerate(papers, 1)
+    )
+    return interest_filter_prompt.format(abstract=abstracts) + BATCH_FILTER_INSTRUCTION
+
+def parse_batch_filter_answer(content, count):
+    """解析批量过滤的JSON回复
+
+    Args:
+        content: AI原始回复
+        count: 本批论文数量
 
     Returns:
-        tuple: (str, dict) 第一个元素为总结内容，第二个元素为token使用统计
+        list: 按论文顺序排列，每项为 (bool, answer)，缺失或无法解析的编号为None
+    """
+    verdicts = [None] * count
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        logger.warning(f"批量过滤回复中没有找到JSON: {content[:200]}")
+        return verdicts
+    try:
+        answers = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning(f"批量过滤回复JSON解析失败: {str(e)}")
+        return verdicts
+
+    for key, value in answers.items():
+        try:
+            index = int(str(key).strip("[] ")) - 1
+        except ValueError:
+            continue
+        if not 0 <= index < count:
+            continue
+        if isinstance(value, bool):
+            verdicts[index] = (value, str(value).lower())
+        elif isinstance(value, str):
+            answer = value.strip().lower()
+            verdicts[index] = (parse_interest_answer(answer), answer)
+    return verdicts
+
+def split_token_stats(token_stats, count):
+    """将一次批量请求的token消耗平均分摊到每篇论文（余数计入第一篇）"""
+    shares = []
+    for i in range(count):
+        share = {}
+        for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            share[key] = token_stats[key] // count + (token_stats[key] % count if i == 0 else 0)
+        shares.append(share)
+    return shares
+
+def gpt_check_interest_batch(papers, interest_filter_prompt, cache_keys=None):
+    """在一次请求中判断用户是否对多篇论文感兴趣
+
+    Args:
+        papers: 论文列表
+        interest_filter_prompt: 兴趣过滤提示词，需包含{abstract}占位符
+        cache_keys: 可选的缓存键列表，与papers一一对应，解析成功的结果会写入缓存
+
+    Returns:
+        list: 按论文顺序排列，每项为 (verdict, token_stats)。verdict为是否感兴趣，
+        缺失或无法解析时为None（调用方应逐篇重试）；token_stats为该论文分摊的token消耗
+    """
+    prompt = build_batch_filter_prompt(papers, interest_filter_prompt)
+
+    logger.info(f"批量检查 {len(papers)} 篇论文的兴趣度...")
+    try:
+        content, usage = chat_completion(prompt, 0.3, "filter_batch")
+        token_stats = token_stats_from_usage(usage)
+    except Exception as e:
+        logger.error(f"批量兴趣判断失败: {str(e)}，改为逐篇判断")
+        empty_stats = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        return [(None, dict(empty_stats)) for _ in papers]
+
+    verdicts = parse_batch_filter_answer(content, len(papers))
+    shares = split_token_stats(token_stats, len(papers))
+    results = []
+    for i, (verdict, share) in enumerate(zip(verdicts, shares)):
+        if verdict is None:
+            results.append((None, share))
+            continue
+        is_interested, answer = verdict
+        if cache_keys and cache_keys[i] is not None:
+            get_db().save_filter_verdict(*cache_keys[i], is_interested, answer,
+                                         share['prompt_tokens'], share['completion_tokens'])
+        results.append((is_interested, share))
+
+    missing = sum(1 for verdict in verdicts if verdict is None)
+    if missing:
+        logger.warning(f"批量过滤有 {missing}/{len(papers)} 篇论文的结果缺失或无法解析，将逐篇重试")
+    return results
+
+def add_token_stats(token_stats, extra):
+    """把额外的token消耗累加到token统计上（返回新字典）"""
+    merged = dict(token_stats)
+    for key in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        merged[key] = merged.get(key, 0) + extra.get(key, 0)
+    return merged
+
+# 按总结缓存键（含分块缓存键）加锁：提示词相同的用户同时总结同一篇论文时只调用一次LLM
+_summary_locks = KeyedLock()
+
+def summary_cache_key(paper, custom_prompt=None):
+    """构建总结缓存键 (提示词模板哈希, arXiv ID, 模型, 温度)，论文没有arXiv ID时返回None"""
+    arxiv_id = paper.get('arxiv_id')
+    if not arxiv_id:
+        return None
+    return prompt_hash(custom_prompt or DEFAULT_PROMPT_TEMPLATE), arxiv_id, AI_CONFIG["model"], SUMMARY_TEMPERATURE
+
+def lookup_summary(cache_key):
+    """查询论文总结缓存
+
+    Returns:
+        tuple: 命中时返回 (str, dict)，token统计中实际消耗为0；未命中返回None
+    """
+    if cache_key is None:
+        return None
+    try:
+        cached = get_db().get_cached_summary(
+            *cache_key, ttl_days=GENERAL_CONFIG.get("summary_cache_ttl_days", 30)
+        )
+    except Exception as e:
+        logger.warning(f"查询总结缓存失败: {str(e)}")
+        return None
+    if cached is None:
+        return None
+
+    logger.info(f"总结缓存命中: {cache_key[1]}")
+    return cached['summary'], cache_hit_token_stats(cached['prompt_tokens'], cached['completion_tokens'])
+
+def build_summary_prompt(text, custom_prompt=None):
+    """按提示词模板和模型上下文把论文文本压缩到预算内，再填入模板
+
+    Returns:
+        tuple: (完整提示词, 压缩后的论文文本)
     """
     # 如果没有自定义提示词，使用默认模板
-    if custom_prompt:
-        prompt = custom_prompt.format(text=text)
-    else:
-        prompt = DEFAULT_PROMPT_TEMPLATE.format(text=text)
+    template = custom_prompt or DEFAULT_PROMPT_TEMPLATE
+    text = fit_text_to_budget(text, get_text_budget(template))
+    return template.format(text=text), text
 
-    client = openai.OpenAI(
-        base_url=AI_CONFIG["base_url"],
-        api_key=AI_CONFIG["api_key"]
-    )
+def gpt_summarize(text, custom_prompt=None, cache_key=None):
+    """使用GPT对论文进行总结，支持自定义提示词
+
+    Args:
+        text: 论文文本
+        custom_prompt: 自定义提示词，需包含{text}占位符
+        cache_key: 可选的缓存键（见summary_cache_key），传入时将总结结果写入缓存
+
+    Returns:
+        tuple: (str, dict) 第一个元素为总结内容，第二个元素为token使用统计
+    """
+    prompt, text = build_summary_prompt(text, custom_prompt)
 
     logger.info(f"Requesting GPT to summarize: {text[:100]}...")
     logger.info(f"Request length: {len(text)}")
-    response = client.chat.completions.create(
-        model=AI_CONFIG["model"],
-        messages=[{
-            "role": "user",
-            "content": prompt
-        }],
-        temperature=1.5,
-    )
+    content, usage = chat_completion(prompt, SUMMARY_TEMPERATURE, "summary")
 
     # 记录token使用情况
-    usage = response.usage
-    token_stats = {
-        'prompt_tokens': usage.prompt_tokens,
-        'completion_tokens': usage.completion_tokens,
-        'total_tokens': usage.total_tokens
-    }
-    logger.info(f"Token使用 - 输入: {usage.prompt_tokens}, 输出: {usage.completion_tokens}, 总计: {usage.total_tokens}")
+    token_stats = token_stats_from_usage(usage)
 
-    logger.info(f"Response: {response.choices[0].message.content[:100]}...")
-    logger.info(f"Response length: {len(response.choices[0].message.content)}")
+    logger.info(f"Response: {content[:100]}...")
+    logger.info(f"Response length: {len(content)}")
 
     # Remove any code blocks from the response
-    content = response.choices[0].message.content
     cleaned_content = ""
     in_code_block = False
     for line in content.split('\n'):
@@ -396,7 +721,101 @@ def gpt_summarize(text, custom_prompt=None):
             continue
         if not in_code_block:
             cleaned_content += line + '\n'
-    return response.choices[0].message.content, token_stats
+    if cache_key is not None:
+        get_db().save_summary(*cache_key, content, token_stats['prompt_tokens'], token_stats['completion_tokens'])
+    return content, token_stats
+
+def use_map_reduce(text, custom_prompt=None):
+    """根据 summary_mode 配置判断是否使用map-reduce总结
+
+    single：单次请求（超出预算时按章节取舍）；map_reduce：始终分块；auto：超出正文预算时分块
+    """
+    mode = GENERAL_CONFIG.get("summary_mode", "single")
+    if mode == "map_reduce":
+        return True
+    if mode == "auto":
+        return count_tokens(text) > get_text_budget(custom_prompt or DEFAULT_PROMPT_TEMPLATE)
+    return False
+
+def split_paper_chunks(text):
+    """按配置把论文文本切成带重叠的块"""
+    return split_into_chunks(
+        text,
+        GENERAL_CONFIG.get("chunk_tokens", 8000),
+        GENERAL_CONFIG.get("chunk_overlap_tokens", 400),
+    )
+
+def build_chunk_prompts(paper, chunks):
+    """构建各分块的摘要提示词及缓存键（缓存键基于完整提示词，分块内容不变即可复用）"""
+    prompts = [CHUNK_SUMMARY_PROMPT.format(index=i, total=len(chunks), text=chunk)
+               for i, chunk in enumerate(chunks, 1)]
+    arxiv_id = paper.get('arxiv_id')
+    cache_keys = [
+        (prompt_hash(prompt), arxiv_id, AI_CONFIG["model"], CHUNK_SUMMARY_TEMPERATURE) if arxiv_id else None
+        for prompt in prompts
+    ]
+    return prompts, cache_keys
+
+def build_reduce_text(chunk_summaries):
+    """把各分块摘要拼接为reduce阶段的输入文本"""
+    return "\n\n".join(
+        f"【第{i}部分要点】\n{summary.strip()}" for i, summary in enumerate(chunk_summaries, 1)
+    )
+
+def gpt_summarize_chunk(prompt, cache_key=None):
+    """map阶段：总结单个分块，命中分块缓存时直接返回
+
+    Returns:
+        tuple: (str, dict) 分块摘要和token使用统计
+    """
+    # 分块提示词与用户提示词无关，不同提示词的用户总结同一篇论文时也会用到相同的分块
+    with _summary_locks.hold(cache_key):
+        cached = lookup_summary(cache_key)
+        if cached is not None:
+            return cached
+
+        content, usage = chat_completion(prompt, CHUNK_SUMMARY_TEMPERATURE, "chunk")
+        token_stats = token_stats_from_usage(usage)
+        if cache_key is not None:
+            get_db().save_summary(*cache_key, content, token_stats['prompt_tokens'], token_stats['completion_tokens'])
+        return content, token_stats
+
+def gpt_summarize_map_reduce(paper, text, custom_prompt=None, cache_key=None):
+    """map-reduce总结：文本切成带重叠的块并发总结，再用用户提示词对各块摘要做最终总结
+
+    单次请求的大小与论文长度无关；分块摘要单独缓存，重跑时只需重新执行reduce。
+
+    Args:
+        paper: 论文信息（用于分块缓存键）
+        text: 论文文本
+        custom_prompt: 自定义提示词，需包含{text}占位符，仅在reduce阶段使用
+        cache_key: 可选的最终总结缓存键
+
+    Returns:
+        tuple: (str, dict) 总结内容和map、reduce两阶段合计的token使用统计
+    """
+    chunks = split_paper_chunks(text)
+    prompts, chunk_keys = build_chunk_prompts(paper, chunks)
+    if cache_key is None:
+        # 最终总结不缓存（如回退到了摘要）时分块摘要也不缓存
+        chunk_keys = [None] * len(chunks)
+    logger.info(f"使用map-reduce总结: {paper['title']}，共 {len(chunks)} 块")
+
+    # 所有论文共享同一个分块线程池，按用户轮转调度；不能复用总结线程池，
+    # 否则总结线程都在等待分块结果时分块任务无线程可用
+    executor = get_fair_executor("map", GENERAL_CONFIG.get("map_workers", 4))
+    owner = telemetry.current_user() or paper.get('arxiv_id') or paper['title']
+    futures = [executor.submit(owner, gpt_summarize_chunk, prompt, chunk_key)
+               for prompt, chunk_key in zip(prompts, chunk_keys)]
+    results = [future.result() for future in futures]
+
+    map_stats = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    for _, chunk_stats in results:
+        map_stats = add_token_stats(map_stats, chunk_stats)
+
+    summary, reduce_stats = gpt_summarize(build_reduce_text([content for content, _ in results]),
+                                          custom_prompt, cache_key)
+    return summary, add_token_stats(reduce_stats, map_stats)
 
 def _log_token_cost(user_name, filter_input_tokens, filter_output_tokens,
                     generate_input_tokens, generate_output_tokens):
@@ -479,8 +898,167 @@ def build_filtered_papers_appendix(filtered_out_papers):
 
     return ''.join(appendix)
 
-def process_user(user_config):
-    """处理单个用户的论文获取和报告生成"""
+def build_full_report(report, filtered_out_papers):
+    """拼接各篇论文的报告，如果有被过滤掉的论文，在末尾添加附录"""
+    full_report = '\n'.join(report)
+    if filtered_out_papers:
+        full_report += "\n\n" + build_filtered_papers_appendix(filtered_out_papers)
+    return full_report
+
+def save_user_report(user_dir, full_report):
+    """保存报告到用户专属文件
+
+    Returns:
+        str: 报告文件路径
+    """
+    report_file = f"{user_dir}/report.md"
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write(full_report)
+    return report_file
+
+def new_cache_stats():
+    """创建缓存命中统计"""
+    return {'lookups': 0, 'hits': 0, 'saved_input_tokens': 0, 'saved_output_tokens': 0}
+
+def accumulate_cache_stats(cache_stats, token_stats):
+    """将单次调用的缓存命中情况累计到统计中（lookups 为查询缓存的论文数，即命中数加LLM调用数）"""
+    cache_stats['lookups'] += 1
+    if token_stats.get('cache_hit'):
+        cache_stats['hits'] += 1
+        cache_stats['saved_input_tokens'] += token_stats['saved_prompt_tokens']
+        cache_stats['saved_output_tokens'] += token_stats['saved_completion_tokens']
+
+def cache_hit_token_stats(saved_prompt_tokens, saved_completion_tokens):
+    """构建缓存命中时的token统计：实际消耗为0，并记录节省的token数"""
+    return {
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'total_tokens': 0,
+        'cache_hit': True,
+        'saved_prompt_tokens': saved_prompt_tokens,
+        'saved_completion_tokens': saved_completion_tokens,
+    }
+
+def record_user_usage(user_config, filter_input_tokens, filter_output_tokens,
+                      generate_input_tokens, generate_output_tokens,
+                      papers_fetched, papers_filtered, papers_processed,
+                      filter_cache_stats=None, generate_cache_stats=None):
+    """输出用户的token使用统计和成本，并记录到数据库"""
+    user_name = user_config["name"]
+    if filter_cache_stats is None:
+        filter_cache_stats = new_cache_stats()
+    if generate_cache_stats is None:
+        generate_cache_stats = new_cache_stats()
+    _log_token_cost(user_name, filter_input_tokens, filter_output_tokens,
+                    generate_input_tokens, generate_output_tokens)
+    for stage_name, cache_stats in (("兴趣过滤", filter_cache_stats), ("论文总结", generate_cache_stats)):
+        if cache_stats['hits']:
+            logger.info(f"【{user_name}】{stage_name}缓存命中 {cache_stats['hits']} 次，"
+                        f"节省输入Token {cache_stats['saved_input_tokens']:,}，"
+                        f"输出Token {cache_stats['saved_output_tokens']:,}")
+
+    # 计算成本
+    filter_input_cost = (filter_input_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_input_tokens", 0)
+    filter_output_cost = (filter_output_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_output_tokens", 0)
+    filter_cost = filter_input_cost + filter_output_cost
+
+    generate_input_cost = (generate_input_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_input_tokens", 0)
+    generate_output_cost = (generate_output_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_output_tokens", 0)
+    generate_cost = generate_input_cost + generate_output_cost
+
+    # 记录到数据库
+    try:
+        db = get_db()
+        db.record_usage(
+            user_name=user_name,
+            user_email=user_config["email"],
+            arxiv_categories=user_config["arxiv_categories"],
+            filter_input_tokens=filter_input_tokens,
+            filter_output_tokens=filter_output_tokens,
+            generate_input_tokens=generate_input_tokens,
+            generate_output_tokens=generate_output_tokens,
+            filter_cost=filter_cost,
+            generate_cost=generate_cost,
+            papers_fetched=papers_fetched,
+            papers_filtered=papers_filtered,
+            papers_processed=papers_processed,
+            filter_cache_lookups=filter_cache_stats['lookups'],
+            filter_cache_hits=filter_cache_stats['hits'],
+            filter_cache_saved_input_tokens=filter_cache_stats['saved_input_tokens'],
+            filter_cache_saved_output_tokens=filter_cache_stats['saved_output_tokens'],
+            generate_cache_hits=generate_cache_stats['hits'],
+            generate_cache_saved_input_tokens=generate_cache_stats['saved_input_tokens'],
+            generate_cache_saved_output_tokens=generate_cache_stats['saved_output_tokens']
+        )
+    except Exception as e:
+        logger.error(f"记录数据库失败: {str(e)}")
+
+def build_paper_report(paper, summary):
+    """构建单篇论文的报告内容"""
+    return f"""
+## 📄论文标题
+
+{paper['title']}
+
+## 📊 论文信息
+* **作者**: {', '.join(paper['authors'])}
+* **发表日期**: {paper['published'].strftime('%Y-%m-%d')}
+* **链接**: [{paper['url']}]({paper['url']})
+* **主要分类**: {paper["primary_category"] if "primary_category" in paper else "未知分类"}
+* **所属分类**: {paper["categories"] if "categories" in paper else "未知分类"}
+* **摘要原文**:
+
+{paper['abstract']}
+
+
+## 📝 论文总结
+{summary}
+
+{'─' * 80}
+"""
+
+def summarize_single_paper(paper, user_dir, custom_prompt=None):
+    """下载、解析并总结单篇论文
+
+    Returns:
+        tuple: (summary, token_stats, error)，失败时summary和token_stats为None，error为错误信息
+    """
+    with telemetry.stage("paper", paper.get('arxiv_id') or paper['title']) as span:
+        try:
+            # 相同提示词模板的总结可以直接复用，命中时连下载和解析都可以跳过；
+            # 其他用户正在总结同一篇论文时先等待，之后重新查缓存
+            cache_key = summary_cache_key(paper, custom_prompt)
+            with _summary_locks.hold(cache_key):
+                cached = lookup_summary(cache_key)
+                if cached is not None:
+                    span.outcome = "cache_hit"
+                    summary, token_stats = cached
+                    return summary, token_stats, None
+
+                # 下载并处理PDF；回退到摘要时不写总结缓存，
+                # 避免一次下载或解析故障让所有用户在缓存有效期内都拿到只基于摘要的总结
+                text, from_abstract = get_paper_text(paper, user_dir)
+                if from_abstract:
+                    cache_key = None
+
+                # GPT总结（使用用户自定义提示词），长文按配置走map-reduce
+                if use_map_reduce(text, custom_prompt):
+                    summary, token_stats = gpt_summarize_map_reduce(paper, text, custom_prompt, cache_key)
+                else:
+                    summary, token_stats = gpt_summarize(text, custom_prompt, cache_key)
+                return summary, token_stats, None
+        except Exception as e:
+            span.outcome = "error"
+            logger.error(f"处理论文失败: {paper['title']}，错误: {str(e)}")
+            return None, None, str(e)
+
+def process_user(user_config, paper_index=None):
+    """处理单个用户的论文获取和报告生成
+
+    Args:
+        user_config: 用户配置
+        paper_index: 运行级共享的论文索引，不传则单独为该用户抓取
+    """
     user_name = user_config["name"]
     user_email = user_config["email"]
     arxiv_categories = user_config["arxiv_categories"]
@@ -488,6 +1066,8 @@ def process_user(user_config):
     interest_filter_prompt = user_config.get("interest_filter_prompt", None)
 
     logger.info(f"开始处理用户: {user_name}")
+    # 该用户的下载、解析、LLM调用耗时都归属到该用户
+    telemetry.set_user(user_name)
 
     # 初始化token统计 - 分阶段统计
     filter_input_tokens = 0
@@ -495,6 +1075,10 @@ def process_user(user_config):
     generate_input_tokens = 0
     generate_output_tokens = 0
 
+    # 缓存命中统计
+    filter_cache_stats = new_cache_stats()
+    generate_cache_stats = new_cache_stats()
+
     # 初始化论文数量统计
     papers_fetched = 0
     papers_filtered_count = 0
@@ -505,214 +1089,238 @@ def process_user(user_config):
     os.makedirs(user_dir, exist_ok=True)
 
     # 获取该用户关注的论文
-    papers = fetch_papers(arxiv_categories)
+    if paper_index is None:
+        papers = fetch_papers(arxiv_categories)
+    else:
+        papers = select_user_papers(paper_index, arxiv_categories)
     papers_fetched = len(papers)
 
     if not papers:
         logger.info(f"用户 {user_name} 没有找到新论文")
         return
 
-    # 第一步：如果配置了兴趣过滤提示词，先根据摘要过滤论文
     filtered_out_papers = []  # 存储被过滤掉的论文
-    if interest_filter_prompt:
+
+    # 第一步：如果配置了本地预过滤，先用向量相似度剔除明显不相关的论文，减少LLM调用
+    prefilter_profile = user_config.get("prefilter", None)
+    if prefilter_profile:
+        papers, prefiltered_out_papers = prefilter_papers(papers, prefilter_profile)
+        filtered_out_papers.extend(prefiltered_out_papers)
+
+    # 第二步：如果配置了兴趣过滤提示词，再根据摘要过滤论文
+    if interest_filter_prompt and papers:
         logger.info(f"开始使用兴趣过滤（并发模式），共 {len(papers)} 篇论文待过滤")
         filtered_papers = []
 
-        # 定义单个论文过滤任务
-        def filter_single_paper(paper_with_index):
-            i, paper = paper_with_index
+        def verdict_result(paper, is_interested, token_stats):
+            if is_interested:
+                logger.info(f"✓ 用户可能对此论文感兴趣: {paper['title']}")
+                return ('interested', paper, token_stats)
+            else:
+                logger.info(f"✗ 用户可能对此论文不感兴趣，跳过: {paper['title']}")
+                return ('not_interested', paper, token_stats)
+
+        # 调用LLM判断单篇论文（调用方已持有该论文的过滤锁且缓存未命中）
+        def check_single_paper(i, paper, cache_key):
             logger.info(f"过滤论文 {i+1}/{len(papers)}: {paper['title']}")
             try:
-                is_interested, token_stats = gpt_check_interest(paper['abstract'], interest_filter_prompt)
-                if is_interested:
-                    logger.info(f"✓ 用户可能对此论文感兴趣")
-                    return ('interested', paper, token_stats)
-                else:
-                    logger.info(f"✗ 用户可能对此论文不感兴趣，跳过")
-                    return ('not_interested', paper, token_stats)
+                verdict = gpt_check_interest(paper['abstract'], interest_filter_prompt, cache_key)
+                return verdict_result(paper, *verdict)
             except Exception as e:
                 logger.error(f"过滤论文时出错: {str(e)}，保留该论文")
                 return ('error', paper, None)
 
-        # 使用线程池进行并发过滤（降低并发数避免API限流）
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # 提交所有任务
-            future_to_paper = {executor.submit(filter_single_paper, (i, paper)): paper
-                              for i, paper in enumerate(papers)}
-
-            # 收集结果
-            for future in as_completed(future_to_paper):
-                try:
-                    result_type, paper, token_stats = future.result()
+        # 定义单个论文过滤任务
+        def filter_single_paper(paper_with_index):
+            i, paper = paper_with_index
+            # 先查跨用户共享的过滤结果缓存；其他用户正在判断同一篇论文时先等待，之后重新查缓存
+            cache_key = interest_cache_key(paper, interest_filter_prompt)
+            with _filter_locks.hold(cache_key):
+                verdict = lookup_interest_verdict(cache_key)
+                if verdict is not None:
+                    return verdict_result(paper, *verdict)
+                return check_single_paper(i, paper, cache_key)
+
+        # 定义批量过滤任务：缓存未命中的论文合并为一次请求，缺失的结果逐篇重试
+        def filter_paper_batch(batch):
+            logger.info(f"批量过滤论文 {batch[0][0]+1}-{batch[-1][0]+1}/{len(papers)}")
+            results = {}
+            pending = []
+            claimed = []
+            deferred = []
+            # 只对能立即拿到过滤锁的论文发请求，同时持有多把锁时不等待，避免批次之间互相等待
+            for i, paper in batch:
+                cache_key = interest_cache_key(paper, interest_filter_prompt)
+                if not _filter_locks.acquire(cache_key, blocking=False):
+                    deferred.append((i, paper))
+                    continue
+                claimed.append(cache_key)
+                verdict = lookup_interest_verdict(cache_key)
+                if verdict is not None:
+                    results[i] = verdict_result(paper, *verdict)
+                else:
+                    pending.append((i, paper, cache_key))
 
-                    # 累计token使用
-                    if token_stats:
-                        filter_input_tokens += token_stats['prompt_tokens']
-                        filter_output_tokens += token_stats['completion_tokens']
+            try:
+                if len(pending) == 1:
+                    results[pending[0][0]] = check_single_paper(*pending[0])
+                elif pending:
+                    batch_verdicts = gpt_check_interest_batch(
+                        [paper for _, paper, _ in pending], interest_filter_prompt,
+                        [cache_key for _, _, cache_key in pending]
+                    )
+                    for (i, paper, cache_key), (is_interested, share) in zip(pending, batch_verdicts):
+                        if is_interested is not None:
+                            results[i] = verdict_result(paper, is_interested, share)
+                            continue
+                        # 批量结果缺失，逐篇重试，并计入批量请求中分摊的token
+                        result_type, paper, token_stats = check_single_paper(i, paper, cache_key)
+                        results[i] = (result_type, paper, add_token_stats(token_stats or {}, share))
+            finally:
+                for cache_key in claimed:
+                    _filter_locks.release(cache_key)
+
+            # 其他用户正在判断的论文，等其完成后命中缓存
+            for item in deferred:
+                results[item[0]] = filter_single_paper(item)
+            return [results[i] for i, _ in batch]
+
+        # 提交到所有用户共享的过滤线程池，按用户轮转调度；实际并发由共享LLM限流器自适应调整
+        batch_size = max(1, int(user_config.get("filter_batch_size", 1)))
+        indexed_papers = list(enumerate(papers))
+        executor = get_fair_executor("filter", AI_CONFIG.get("max_concurrency", 16))
+        # 提交所有任务，按提交顺序收集结果，保证过滤后的论文顺序稳定
+        if batch_size > 1:
+            logger.info(f"使用批量过滤，每批 {batch_size} 篇论文")
+            futures = [executor.submit(user_name, filter_paper_batch, indexed_papers[start:start + batch_size])
+                       for start in range(0, len(indexed_papers), batch_size)]
+            filter_results = [result for future in futures for result in future.result()]
+        else:
+            futures = [executor.submit(user_name, filter_single_paper, item) for item in indexed_papers]
+            filter_results = [future.result() for future in futures]
 
-                    if result_type == 'interested' or result_type == 'error':
-                        filtered_papers.append(paper)
-                    else:  # not_interested
-                        filtered_out_papers.append(paper)
+        for result_type, paper, token_stats in filter_results:
+            # 累计token使用
+            if token_stats:
+                filter_input_tokens += token_stats['prompt_tokens']
+                filter_output_tokens += token_stats['completion_tokens']
+            accumulate_cache_stats(filter_cache_stats, token_stats or {})
 
-                except Exception as e:
-                    logger.error(f"处理过滤结果时出错: {str(e)}")
+            if result_type == 'interested' or result_type == 'error':
+                filtered_papers.append(paper)
+            else:  # not_interested
+                filtered_out_papers.append(paper)
 
         papers = filtered_papers
-        papers_filtered_count = len(papers)
         logger.info(f"兴趣过滤完成，剩余 {len(papers)} 篇论文，过滤掉 {len(filtered_out_papers)} 篇论文")
 
-        if not papers:
-            logger.info(f"用户 {user_name} 经过兴趣过滤后没有感兴趣的论文")
-            # 计算成本
-            filter_input_cost = (filter_input_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_input_tokens", 0)
-            filter_output_cost = (filter_output_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_output_tokens", 0)
-            filter_cost = filter_input_cost + filter_output_cost
+    # 没有配置任何过滤时，所有论文都通过
+    papers_filtered_count = len(papers)
 
-            # 记录到数据库
-            try:
-                db = get_db()
-                db.record_usage(
-                    user_name=user_name,
-                    user_email=user_email,
-                    arxiv_categories=arxiv_categories,
-                    filter_input_tokens=filter_input_tokens,
-                    filter_output_tokens=filter_output_tokens,
-                    generate_input_tokens=0,
-                    generate_output_tokens=0,
-                    filter_cost=filter_cost,
-                    generate_cost=0.0,
-                    papers_fetched=papers_fetched,
-                    papers_filtered=0,
-                    papers_processed=0
-                )
-            except Exception as e:
-                logger.error(f"记录数据库失败: {str(e)}")
-
-            # 输出成本统计
-            _log_token_cost(user_name, filter_input_tokens, filter_output_tokens,
-                           generate_input_tokens, generate_output_tokens)
-            # 即使没有感兴趣的论文，如果有被过滤的论文，也发送附录
-            if filtered_out_papers:
-                filtered_appendix = build_filtered_papers_appendix(filtered_out_papers)
-                asyncio.run(send_email(f"每日ArXiv论文报告 - {user_name}", filtered_appendix, user_email))
-            return
-    else:
-        # 没有配置兴趣过滤，所有论文都通过
-        papers_filtered_count = len(papers)
+    if not papers:
+        logger.info(f"用户 {user_name} 经过兴趣过滤后没有感兴趣的论文")
+        record_user_usage(user_config, filter_input_tokens, filter_output_tokens, 0, 0,
+                          papers_fetched, 0, 0, filter_cache_stats)
+        # 即使没有感兴趣的论文，如果有被过滤的论文，也发送附录
+        if filtered_out_papers:
+            filtered_appendix = build_filtered_papers_appendix(filtered_out_papers)
+            queue_report(user_name, user_email, filtered_appendix)
+        return
 
-    # 第二步：根据配置限制处理的论文数量（硬截断）
+    # 第三步：根据配置限制处理的论文数量（硬截断）
     max_papers = GENERAL_CONFIG.get("max_papers_per_user", None)
     if max_papers is not None and max_papers > 0:
         papers = papers[:max_papers]
         logger.info(f"应用硬截断，用户 {user_name} 最多处理 {max_papers} 篇论文")
 
+    # 第四步：并发下载、解析和总结论文（各类资源的并发由全局限制器控制）
+    # 所有用户共享总结线程池，按用户轮转调度，论文多的用户不会挤占其他用户
+    executor = get_fair_executor("summary", GENERAL_CONFIG.get("summary_workers", 8))
+    logger.info(f"开始并发总结论文，共 {len(papers)} 篇")
+    futures = [executor.submit(user_name, summarize_single_paper, paper, user_dir, custom_prompt)
+               for paper in papers]
+    results = [future.result() for future in futures]
+
+    # 按论文原始顺序组装报告，保证输出稳定
     report = []
     papers_processed_count = 0
-    for paper in papers:
-        try:
-            # 下载并处理PDF
-            text = get_paper_text(paper, user_dir)
-
-            # GPT总结（使用用户自定义提示词）
-            summary, token_stats = gpt_summarize(text, custom_prompt)
-            # 累计生成阶段token使用
-            generate_input_tokens += token_stats['prompt_tokens']
-            generate_output_tokens += token_stats['completion_tokens']
-            papers_processed_count += 1
-
-            # 构建报告
-            report.append(f"""
-## 📄论文标题
-
-{paper['title']}
-
-## 📊 论文信息
-* **作者**: {', '.join(paper['authors'])}
-* **发表日期**: {paper['published'].strftime('%Y-%m-%d')}
-* **链接**: [{paper['url']}]({paper['url']})
-* **主要分类**: {paper["primary_category"] if "primary_category" in paper else "未知分类"}
-* **所属分类**: {paper["categories"] if "categories" in paper else "未知分类"}
-* **摘要原文**:
-
-{paper['abstract']}
-
-
-## 📝 论文总结
-{summary}
-
-{'─' * 80}
-""")
-        except Exception as e:
-            logger.error(f"处理论文失败: {paper['title']}，错误: {str(e)}")
-            report.append(f"处理论文失败: {paper['title']}，错误: {str(e)}")
-
-    # 输出用户的token使用统计和成本
-    _log_token_cost(user_name, filter_input_tokens, filter_output_tokens,
-                   generate_input_tokens, generate_output_tokens)
-
-    # 计算成本
-    filter_input_cost = (filter_input_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_input_tokens", 0)
-    filter_output_cost = (filter_output_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_output_tokens", 0)
-    filter_cost = filter_input_cost + filter_output_cost
-
-    generate_input_cost = (generate_input_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_input_tokens", 0)
-    generate_output_cost = (generate_output_tokens / 1_000_000) * AI_CONFIG.get("price_per_million_output_tokens", 0)
-    generate_cost = generate_input_cost + generate_output_cost
-
-    # 记录到数据库
-    try:
-        db = get_db()
-        db.record_usage(
-            user_name=user_name,
-            user_email=user_email,
-            arxiv_categories=arxiv_categories,
-            filter_input_tokens=filter_input_tokens,
-            filter_output_tokens=filter_output_tokens,
-            generate_input_tokens=generate_input_tokens,
-            generate_output_tokens=generate_output_tokens,
-            filter_cost=filter_cost,
-            generate_cost=generate_cost,
-            papers_fetched=papers_fetched,
-            papers_filtered=papers_filtered_count,
-            papers_processed=papers_processed_count
-        )
-    except Exception as e:
-        logger.error(f"记录数据库失败: {str(e)}")
+    for paper, (summary, token_stats, error) in zip(papers, results):
+        if error is not None:
+            report.append(f"处理论文失败: {paper['title']}，错误: {error}")
+            continue
+        # 累计生成阶段token使用
+        generate_input_tokens += token_stats['prompt_tokens']
+        generate_output_tokens += token_stats['completion_tokens']
+        accumulate_cache_stats(generate_cache_stats, token_stats)
+        papers_processed_count += 1
+        report.append(build_paper_report(paper, summary))
+
+    # 输出用户的token使用统计和成本，并记录到数据库
+    record_user_usage(user_config, filter_input_tokens, filter_output_tokens,
+                      generate_input_tokens, generate_output_tokens,
+                      papers_fetched, papers_filtered_count, papers_processed_count,
+                      filter_cache_stats, generate_cache_stats)
 
     if report:
         # 构建完整报告，包括被过滤论文的附录
-        full_report = '\n'.join(report)
-
-        # 如果有被过滤掉的论文，添加附录
-        if filtered_out_papers:
-            full_report += "\n\n" + build_filtered_papers_appendix(filtered_out_papers)
+        full_report = build_full_report(report, filtered_out_papers)
 
-        # 发送给该用户
-        asyncio.run(send_email(f"每日ArXiv论文报告 - {user_name}", full_report, user_email))
+        # 写入发件箱，由发送线程投递并在失败时重试，不在此等待SMTP
+        queue_report(user_name, user_email, full_report)
 
         # 保存报告到用户专属文件
-        report_file = f"{user_dir}/report.md"
-        with open(report_file, 'w', encoding='utf-8') as f:
-            f.write(full_report)
-        logger.success(f"用户 {user_name} 的报告已发送并保存到 {report_file}")
+        report_file = save_user_report(user_dir, full_report)
+        logger.success(f"用户 {user_name} 的报告已写入发件箱并保存到 {report_file}")
+
+def evict_caches():
+    """淘汰过期或超出容量的论文缓存和总结缓存"""
+    try:
+        get_paper_cache().evict()
+    except Exception as e:
+        logger.warning(f"论文缓存淘汰失败: {str(e)}")
+    get_db().evict_summary_cache(
+        ttl_days=GENERAL_CONFIG.get("summary_cache_ttl_days", 30),
+        max_size_mb=GENERAL_CONFIG.get("summary_cache_max_mb", 200),
+    )
 
 def daily_job():
-    """每日任务：为所有配置的用户处理论文"""
+    """每日任务：为所有配置的用户处理论文，记录各阶段耗时并导出本次运行的时间线"""
+    telemetry.start_run()
+    try:
+        if GENERAL_CONFIG.get("async_mode", False):
+            # 异步模式：整个任务在同一个事件循环中完成
+            from async_pipeline import daily_job_async
+            asyncio.run(daily_job_async())
+        else:
+            daily_job_sync()
+    finally:
+        telemetry.finish_run()
+
+def daily_job_sync():
+    """每日任务（线程池版本）"""
     os.makedirs('temp', exist_ok=True)
 
+    evict_caches()
+
     logger.info(f"开始每日任务，共有 {len(USERS_CONFIG)} 个用户")
 
-    for i, user_config in enumerate(USERS_CONFIG):
-        try:
-            process_user(user_config)
-            # 在处理用户之间添加延迟，避免ArXiv API限流
-            if i < len(USERS_CONFIG) - 1:
-                logger.info(f"等待60秒后处理下一个用户，避免API限流...")
-                time.sleep(60)
-        except Exception as e:
-            logger.error(f"处理用户 {user_config['name']} 时发生错误: {str(e)}")
+    # 所有用户共享一次抓取，避免重复请求ArXiv API
+    paper_index, fetch_progress = fetch_paper_index(USERS_CONFIG)
+
+    # 多个用户并行处理，共享的下载/解析/LLM/SMTP限制器和公平调度线程池控制全局资源
+    max_parallel_users = max(1, GENERAL_CONFIG.get("max_parallel_users", 4))
+    with ThreadPoolExecutor(max_workers=max_parallel_users, thread_name_prefix="user") as executor:
+        future_to_user = {executor.submit(process_user, user_config, paper_index): user_config
+                          for user_config in USERS_CONFIG}
+        failed_users = []
+        for future in as_completed(future_to_user):
+            try:
+                future.result()
+            except Exception as e:
+                failed_users.append(future_to_user[future])
+                logger.error(f"处理用户 {future_to_user[future]['name']} 时发生错误: {str(e)}")
 
+    commit_fetch_progress(fetch_progress, failed_users)
     logger.success("所有用户处理完成")
 
 def run_scheduler():
@@ -723,13 +1331,34 @@ def run_scheduler():
         id='daily_arxiv_job',
         name='Daily ArXiv paper collection and summary'
     )
-    
+
+    # 启动发送线程，继续投递上次运行时未发送成功的报告
+    get_mail_dispatcher().wake()
+
     logger.info("定时任务已设置，每天下午4:00运行")
     try:
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         logger.info("定时任务调度器已停止")
 
+def log_outbox_counts(counts):
+    """输出发件箱状态，提示仍未发出的报告"""
+    logger.info(f"发件箱状态: 已发送 {counts.get('sent', 0)}，待重试 {counts.get('pending', 0)}，"
+                f"已放弃 {counts.get('failed', 0)}")
+    if counts.get('pending') or counts.get('failed'):
+        logger.warning("仍有报告未发送，可稍后运行 python main.py --flush-outbox 重新发送")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ArXiv论文每日推送")
+    parser.add_argument("--run-now", action="store_true",
+                        help="立即执行一次每日任务，等待邮件发送后退出（不启动定时任务）")
+    parser.add_argument("--flush-outbox", action="store_true",
+                        help="立即发送发件箱中所有未发出的报告（包括已放弃重试的）后退出")
+    parser.add_argument("--redeliver", metavar="DATE",
+                        help="重新发送指定日期（YYYY-MM-DD）已生成的报告后退出，不重新调用LLM")
+    parser.add_argument("--user", type=str, help="配合 --flush-outbox / --redeliver，只处理指定用户")
+    return parser.parse_args()
+
 if __name__ == "__main__":
     # 配置loguru
     logger.add(
@@ -738,8 +1367,17 @@ if __name__ == "__main__":
         level="INFO",
         encoding="utf-8"
     )
-    # 如果需要立即运行一次，取消下面的注释
-    # daily_job()
-    
-    # 启动定时任务
-    run_scheduler()
\ No newline at end of file
+    args = parse_args()
+
+    if args.redeliver:
+        log_outbox_counts(flush_outbox(args.redeliver, args.user, include_sent=True))
+    elif args.flush_outbox:
+        log_outbox_counts(flush_outbox(user_name=args.user))
+    elif args.run_now:
+        daily_job()
+        # 进程即将退出，等待发件箱中的报告尝试发送一遍
+        get_mail_dispatcher().flush()
+        log_outbox_counts(get_db().get_outbox_counts())
+    else:
+        # 启动定时任务
+        run_scheduler()
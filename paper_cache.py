@@ -0,0 +1,166 @@
+"""
+论文缓存模块 - 按arXiv ID(含版本号)缓存PDF原文和提取出的文本，在用户之间和多次运行之间共享
+"""
+import os
+import tempfile
+import threading
+import time
+from loguru import logger
+from typing import Optional
+
+
+class PaperCache:
+    """基于磁盘的论文内容缓存
+
+    缓存键为带版本号的arXiv ID（如 2410.01234v2），同一版本的论文内容不会变化，
+    因此无需校验即可直接复用。提取出的文本按提取预算分别缓存，文件名中记录产生该文本的预算。每次命中都会刷新文件的修改时间，淘汰时按修改时间做LRU。
+    """
+
+    PDF_SUFFIX = ".pdf"
+    TEXT_SUFFIX = ".txt"
+
+    def __init__(self, cache_dir: str = "cache/papers", max_size_mb: float = 2048,
+                 max_age_days: float = 30):
+        """初始化缓存目录
+
+        Args:
+            cache_dir: 缓存目录
+            max_size_mb: 缓存总大小上限（MB）
+            max_age_days: 缓存文件最长保留天数（按最近访问时间计算）
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, arxiv_id: str, suffix: str) -> str:
+        """生成缓存文件路径（旧式ID如 hep-th/9901001v1 中的斜杠需要替换）"""
+        return os.path.join(self.cache_dir, arxiv_id.replace("/", "_") + suffix)
+
+    @staticmethod
+    def _touch(path: str):
+        """刷新访问时间，用于LRU淘汰"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def pdf_path(self, arxiv_id: str) -> str:
+        """返回PDF缓存文件路径（文件不一定存在）"""
+        return self._path(arxiv_id, self.PDF_SUFFIX)
+
+    def has_pdf(self, arxiv_id: str) -> bool:
+        """检查PDF是否已缓存，命中时刷新访问时间"""
+        path = self.pdf_path(arxiv_id)
+        if os.path.exists(path):
+            self._touch(path)
+            return True
+        return False
+
+    def _text_path(self, arxiv_id: str, budget: int) -> str:
+        return self._path(arxiv_id, f"-{budget}{self.TEXT_SUFFIX}")
+
+    def get_text(self, arxiv_id: str, budget: int) -> Optional[str]:
+        """读取按指定提取预算缓存的论文文本
+
+        Args:
+            budget: 提取阶段的token预算，只返回用相同预算提取的文本
+
+        Returns:
+            缓存的文本，未命中时返回None
+        """
+        path = self._text_path(arxiv_id, budget)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取文本缓存失败 {arxiv_id}: {str(e)}")
+            return None
+        self._touch(path)
+        return text
+
+    def put_text(self, arxiv_id: str, text: str, budget: int):
+        """写入论文文本缓存
+
+        Args:
+            budget: 提取该文本时使用的token预算
+        """
+        try:
+            atomic_write(self._text_path(arxiv_id, budget), text.encode("utf-8"))
+        except Exception as e:
+            logger.warning(f"写入文本缓存失败 {arxiv_id}: {str(e)}")
+
+    def evict(self):
+        """淘汰过期文件，并在超出容量时按最近访问时间淘汰最旧的文件"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            entries.sort()  # 最久未访问的排在前面
+            total_size = sum(size for _, size, _ in entries)
+            removed = 0
+            for mtime, size, path in entries:
+                expired = now - mtime > self.max_age_seconds
+                if not expired and total_size <= self.max_size_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"删除缓存文件失败 {path}: {str(e)}")
+
+            if removed:
+                logger.info(f"论文缓存淘汰了 {removed} 个文件，当前占用 {total_size / 1024 / 1024:.1f} MB")
+
+
+def atomic_write(path: str, data: bytes):
+    """原子写入文件：先写入同目录下的临时文件，再重命名覆盖目标文件"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# 全局缓存实例
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+def get_paper_cache() -> PaperCache:
+    """获取全局论文缓存实例（线程安全）
+
+    Returns:
+        PaperCache实例
+    """
+    global _cache_instance
+
+    with _cache_lock:
+        if _cache_instance is None:
+            from config import GENERAL_CONFIG
+            _cache_instance = PaperCache(
+                cache_dir=GENERAL_CONFIG.get("paper_cache_dir", "cache/papers"),
+                max_size_mb=GENERAL_CONFIG.get("paper_cache_max_mb", 2048),
+                max_age_days=GENERAL_CONFIG.get("paper_cache_max_age_days", 30),
+            )
+        return _cache_instance
@@ -0,0 +1,390 @@
+"""
+PDF文本提取模块 - 按页区间把PDF解析分发到进程池，绕开GIL，按页序惰性产出文本
+
+支持多个解析后端（PyMuPDF、pypdfium2、pypdf、PyPDF2、pdfminer.six），按配置顺序尝试：
+打不开、超时或每页字符数过少（扫描版、字体编码异常）时换下一个后端，减少回退到HTML的次数。
+"""
+import os
+import time
+import itertools
+import threading
+import multiprocessing
+import importlib.util
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+
+def _open_pymupdf(pdf_path: str):
+    import fitz
+
+    document = fitz.open(pdf_path)
+    return len(document), lambda index: document[index].get_text(), document.close
+
+
+def _open_pypdfium2(pdf_path: str):
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(pdf_path)
+
+    def page_text(index):
+        page = document[index]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range().replace("\r\n", "\n")
+        finally:
+            textpage.close()
+            page.close()
+
+    return len(document), page_text, document.close
+
+
+def _open_pypdf(pdf_path: str):
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    return len(reader.pages), lambda index: reader.pages[index].extract_text(), None
+
+
+def _open_pypdf2(pdf_path: str):
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(pdf_path)
+    return len(reader.pages), lambda index: reader.pages[index].extract_text(), None
+
+
+def _open_pdfminer(pdf_path: str):
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LAParams, LTTextContainer
+
+    f = open(pdf_path, 'rb')
+    try:
+        pages = list(PDFPage.create_pages(PDFDocument(PDFParser(f))))
+    except Exception:
+        f.close()
+        raise
+    manager = PDFResourceManager()
+    device = PDFPageAggregator(manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(manager, device)
+
+    def page_text(index):
+        interpreter.process_page(pages[index])
+        return "".join(element.get_text() for element in device.get_result()
+                       if isinstance(element, LTTextContainer))
+
+    return len(pages), page_text, f.close
+
+
+# 后端名称 -> (需要安装的模块, 打开函数)；打开函数返回 (页数, 按页序号取文本的函数, 关闭函数)
+PDF_BACKENDS = {
+    "pymupdf": ("fitz", _open_pymupdf),
+    "pypdfium2": ("pypdfium2", _open_pypdfium2),
+    "pypdf": ("pypdf", _open_pypdf),
+    "pypdf2": ("PyPDF2", _open_pypdf2),
+    "pdfminer": ("pdfminer", _open_pdfminer),
+}
+# 默认顺序：C实现的后端最快，其次是纯Python的pypdf/PyPDF2，pdfminer最慢但对异常字体和布局最稳
+DEFAULT_PDF_BACKENDS = ["pymupdf", "pypdfium2", "pypdf", "pypdf2", "pdfminer"]
+
+
+@contextmanager
+def open_pdf(backend: str, pdf_path: str):
+    """用指定后端打开PDF
+
+    Yields:
+        tuple: (页数, 按页序号取文本的函数)
+    """
+    page_count, page_text, close = PDF_BACKENDS[backend][1](pdf_path)
+    try:
+        yield page_count, page_text
+    finally:
+        if close is not None:
+            close()
+
+
+# 子进程中：任务ID -> 开始运行的时间，由主进程通过Manager共享，主进程据此从任务真正开始时计算超时
+_task_starts = None
+
+def _init_worker(task_starts):
+    global _task_starts
+    _task_starts = task_starts
+
+
+def _extract_page_range(backend: str, pdf_path: str, start: int, end: int,
+                        timeout: Optional[float] = None,
+                        task_id: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+    """在子进程中解析 [start, end) 区间的页面
+
+    子进程中不写日志，警告信息随结果带回主进程输出。个别页面失败只记警告，
+    区间内所有页面都失败时抛出异常，由调用方换下一个后端。
+
+    Args:
+        timeout: 本区间的解析时间上限（秒），从任务开始运行时计时，在进程池中排队的时间不计入；
+            每解析完一页检查一次，超过后抛出TimeoutError
+        task_id: 进程池任务ID，传入时把开始时间告知主进程
+
+    Returns:
+        tuple: (各页文本列表, 警告信息列表, PDF总页数)
+    """
+    started = time.time()
+    if task_id is not None and _task_starts is not None:
+        _task_starts[task_id] = started
+    deadline = started + timeout if timeout else None
+    texts = []
+    warnings = []
+    last_error = None
+    with open_pdf(backend, pdf_path) as (page_count, page_text):
+        pages = range(start, min(end, page_count))
+        for page_num in pages:
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"解析超时（第 {page_num+1} 页）")
+            try:
+                text = page_text(page_num)
+                if text:
+                    texts.append(text)
+            except Exception as e:
+                last_error = e
+                warnings.append(f"无法提取第 {page_num+1} 页: {str(e)}")
+    if pages and len(warnings) == len(pages):
+        raise RuntimeError(f"第 {start+1}-{pages[-1]+1} 页均无法提取: {str(last_error)}")
+    return texts, warnings, page_count
+
+
+# 全局进程池实例
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_task_ids = itertools.count()
+
+def get_extract_pool():
+    """获取进程内共享的PDF解析进程池（线程安全），workers 配置为0时返回None表示在当前进程解析"""
+    global _pool, _pool_workers, _task_starts
+
+    from config import GENERAL_CONFIG
+
+    with _pool_lock:
+        if _pool is None:
+            workers = GENERAL_CONFIG.get("pdf_extract_workers", min(4, os.cpu_count() or 1))
+            if workers <= 0:
+                return None
+            # 主进程中有下载/LLM线程在运行，用spawn避免fork时继承到被占用的锁
+            context = multiprocessing.get_context("spawn")
+            # 任务提交到进程池后会先进入调用队列，Future变为running时未必已经开始执行，
+            # 开始时间由子进程写入共享字典
+            _task_starts = context.Manager().dict()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(_task_starts,),
+            )
+            _pool_workers = workers
+            logger.info(f"PDF解析进程池已创建，进程数: {workers}")
+        return _pool
+
+
+# 已安装的解析后端（按配置顺序）
+_backend_chain = None
+_backend_chain_lock = threading.Lock()
+
+def get_backend_chain() -> List[str]:
+    """按 pdf_backends 配置顺序返回已安装的解析后端（线程安全，首次调用时确定）"""
+    global _backend_chain
+
+    from config import GENERAL_CONFIG
+
+    with _backend_chain_lock:
+        if _backend_chain is None:
+            chain = []
+            for name in GENERAL_CONFIG.get("pdf_backends", DEFAULT_PDF_BACKENDS):
+                key = name.lower()
+                if key not in PDF_BACKENDS:
+                    logger.warning(f"未知的PDF解析后端: {name}，可选: {', '.join(PDF_BACKENDS)}")
+                elif importlib.util.find_spec(PDF_BACKENDS[key][0]) is not None and key not in chain:
+                    chain.append(key)
+            if not chain:
+                logger.warning("配置的PDF解析后端均未安装，使用PyPDF2")
+                chain = ["pypdf2"]
+            logger.info(f"PDF解析后端: {' -> '.join(chain)}")
+            _backend_chain = chain
+        return _backend_chain
+
+
+def _run_range(pool, backend: str, pdf_path: str, start: int, end: int, timeout: float):
+    """解析一个页区间：有进程池时提交到进程池并等待，否则在当前进程解析"""
+    if pool is None:
+        return _extract_page_range(backend, pdf_path, start, end, timeout)
+    return _wait(_submit(pool, backend, pdf_path, start, end, timeout), timeout)
+
+
+def _submit(pool, backend: str, pdf_path: str, start: int, end: int, timeout: float):
+    """把页区间提交到进程池
+
+    Returns:
+        tuple: (Future, 任务ID)
+    """
+    task_id = next(_task_ids)
+    return pool.submit(_extract_page_range, backend, pdf_path, start, end, timeout, task_id), task_id
+
+
+def _forget(task):
+    """清除任务在共享字典中的开始时间"""
+    try:
+        _task_starts.pop(task[1], None)
+    except Exception:
+        pass
+
+
+def _wait(task, timeout: float):
+    """等待进程池任务，子进程开始执行后超过 timeout 秒则放弃（子进程会在下一页开始前自行停止）
+
+    排在其他论文的区间后面等待进程的时间不计入超时：开始时间由子进程写入共享字典，
+    写入之前只轮询等待。
+    """
+    future, task_id = task
+    try:
+        if not timeout:
+            return future.result()
+        started = None
+        while True:
+            if started is None:
+                started = _task_starts.get(task_id)
+            remaining = 0.05 if started is None else started + timeout - time.time()
+            try:
+                return future.result(timeout=max(0.0, remaining))
+            except FuturesTimeoutError:
+                if started is not None:
+                    future.cancel()
+                    raise TimeoutError("解析超时")
+    finally:
+        _forget(task)
+
+
+def _select_backend(pdf_path: str, chain: List[str], pages_per_task: int):
+    """依次用各后端解析第一个区间，选出第一个每页字符数达标的后端
+
+    页数由解析第一个区间的子进程一并返回，主进程不单独打开PDF计数
+    （pdfminer等后端打开时要扫描整个文件）。都不达标时选字符数最多的后端
+    （之后由调用方决定是否改用HTML）。
+
+    Returns:
+        tuple: (后端在链中的序号, 页数, 进程池, 第一个区间的结果)
+    """
+    from config import GENERAL_CONFIG
+
+    timeout = GENERAL_CONFIG.get("pdf_backend_timeout", 60)
+    min_chars = GENERAL_CONFIG.get("pdf_min_chars_per_page", 200)
+    pool = get_extract_pool()
+    best = None
+    best_chars = -1.0
+    last_error = None
+    for position, backend in enumerate(chain):
+        try:
+            texts, warnings, page_count = _run_range(pool, backend, pdf_path, 0, pages_per_task, timeout)
+        except Exception as e:
+            last_error = e
+            logger.warning(f"PDF解析后端 {backend} 失败: {type(e).__name__}: {str(e)}")
+            continue
+
+        first = (texts, warnings)
+        chars = sum(len(text.strip()) for text in texts) / max(1, min(pages_per_task, page_count))
+        if page_count == 0 or chars >= min_chars:
+            return position, page_count, pool, first
+        logger.info(f"PDF解析后端 {backend} 提取的文本过少（每页 {chars:.0f} 字符）")
+        if chars > best_chars:
+            best, best_chars = (position, page_count, pool, first), chars
+
+    if best is None:
+        raise last_error or RuntimeError("没有可用的PDF解析后端")
+    return best
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[str]:
+    """按页序惰性产出PDF各页文本
+
+    先按后端链选出提取质量达标的后端，之后页面按固定大小切成区间，按顺序提交给进程池，
+    同时在途的区间数不超过进程数。某个区间解析失败或超时时，从该区间起改用链中的下一个后端。
+    调用方停止迭代（关闭生成器）后，剩余区间不再提交，尚未开始的任务被取消。
+
+    Args:
+        pdf_path: PDF文件路径
+
+    Yields:
+        每页的文本（以换行结尾），空白页跳过
+    """
+    from config import GENERAL_CONFIG
+
+    chain = get_backend_chain()
+    pages_per_task = max(1, GENERAL_CONFIG.get("pdf_pages_per_task", 8))
+    position, page_count, pool, first = _select_backend(pdf_path, chain, pages_per_task)
+    ranges = [(start, min(start + pages_per_task, page_count))
+              for start in range(pages_per_task, page_count, pages_per_task)]
+
+    results = _ranged_results(pool, pdf_path, ranges, chain, position)
+    try:
+        for texts, warnings in _prepend(first, results):
+            for warning in warnings:
+                logger.warning(warning)
+            for text in texts:
+                yield text + "\n"
+    finally:
+        results.close()
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _ranged_results(pool, pdf_path, ranges, chain, position):
+    """按页序产出各区间的结果，保持在途任务数不超过进程数；生成器关闭时取消未开始的任务
+
+    区间失败时取消在途任务，从失败的区间起换下一个后端重新提交，所有后端都失败时抛出最后的错误。
+    """
+    from config import GENERAL_CONFIG
+
+    timeout = GENERAL_CONFIG.get("pdf_backend_timeout", 60)
+    window = _pool_workers if pool is not None else 1
+    pending = []
+    next_index = 0
+    try:
+        while next_index < len(ranges) or pending:
+            while next_index < len(ranges) and len(pending) < window:
+                start, end = ranges[next_index]
+                if pool is None:
+                    pending.append((next_index, None))
+                else:
+                    pending.append((next_index, _submit(pool, chain[position], pdf_path, start, end, timeout)))
+                next_index += 1
+            index, task = pending.pop(0)
+            start, end = ranges[index]
+            try:
+                if task is None:
+                    texts, warnings, _ = _extract_page_range(chain[position], pdf_path, start, end, timeout)
+                else:
+                    texts, warnings, _ = _wait(task, timeout)
+            except Exception as e:
+                if position + 1 >= len(chain):
+                    raise
+                logger.warning(f"PDF解析后端 {chain[position]} 在第 {start+1}-{end} 页失败: "
+                               f"{type(e).__name__}: {str(e)}，改用 {chain[position + 1]}")
+                for _, other in pending:
+                    if other is not None:
+                        other[0].cancel()
+                        _forget(other)
+                pending = []
+                next_index = index
+                position += 1
+                continue
+            yield texts, warnings
+    finally:
+        for _, task in pending:
+            if task is not None:
+                task[0].cancel()
+                _forget(task)
@@ -0,0 +1,166 @@
+"""
+本地预过滤模块 - 在调用LLM判断兴趣之前，用向量相似度剔除明显不相关的论文
+
+默认使用基于哈希的TF-IDF向量（纯NumPy，离线、CPU即可运行）；
+如果配置了 embedding_model 且安装了 sentence-transformers，则改用本地嵌入模型。
+"""
+import re
+import zlib
+import threading
+from loguru import logger
+from typing import Dict, List, Tuple
+
+# 英文常见停用词，避免"the""of"之类的词主导相似度
+_STOPWORDS = frozenset("""
+a an and are as at be by can for from has have in into is it its of on or our that the their this
+to we which with via using based paper propose proposed show results method methods approach new
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """切分文本：英文取单词和相邻词二元组，中文取相邻字二元组"""
+    text = text.lower()
+    words = [w for w in _WORD_RE.findall(text) if w not in _STOPWORDS and len(w) > 1]
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return tokens
+
+
+def hashing_tfidf(texts: List[str], n_features: int):
+    """将文本批量转换为L2归一化的哈希TF-IDF矩阵
+
+    Args:
+        texts: 文本列表
+        n_features: 哈希空间维度
+
+    Returns:
+        numpy.ndarray: 形状为 (len(texts), n_features) 的float32矩阵
+    """
+    import numpy as np
+
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices = [zlib.crc32(token.encode("utf-8")) % n_features for token in tokenize(text)]
+        if indices:
+            np.add.at(matrix[row], indices, 1.0)
+
+    # 次线性词频 + 平滑IDF（以当前批次为语料）
+    np.log1p(matrix, out=matrix)
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    matrix *= idf.astype(np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+# 嵌入模型加载较慢，按模型名缓存
+_embedding_models = {}
+_embedding_lock = threading.Lock()
+
+def _embed(texts: List[str], model_name: str):
+    """使用本地sentence-transformers模型计算归一化嵌入向量"""
+    from sentence_transformers import SentenceTransformer
+
+    with _embedding_lock:
+        if model_name not in _embedding_models:
+            logger.info(f"加载本地嵌入模型: {model_name}")
+            _embedding_models[model_name] = SentenceTransformer(model_name, device="cpu")
+        model = _embedding_models[model_name]
+    return model.encode(texts, normalize_embeddings=True, convert_to_numpy=True, batch_size=64)
+
+
+def _profile_documents(profile: Dict) -> List[str]:
+    """把兴趣画像拆成若干参考文档：描述+关键词为一篇，每篇种子论文各为一篇"""
+    documents = []
+    description = " ".join(
+        [profile.get("description", "")] + list(profile.get("keywords", []))
+    ).strip()
+    if description:
+        documents.append(description)
+    documents.extend(seed for seed in profile.get("seed_papers", []) if seed.strip())
+    return documents
+
+
+def score_papers(papers: List[Dict], profile: Dict):
+    """计算每篇论文与兴趣画像的相似度
+
+    每篇论文的得分为它与各参考文档余弦相似度的最大值，整批一次矩阵乘法完成。
+
+    Args:
+        papers: 论文列表
+        profile: 兴趣画像配置
+
+    Returns:
+        numpy.ndarray: 与papers一一对应的相似度
+    """
+    documents = _profile_documents(profile)
+    paper_texts = [f"{paper['title']}\n{paper['abstract']}" for paper in papers]
+
+    model_name = profile.get("embedding_model")
+    vectors = None
+    if model_name:
+        try:
+            vectors = _embed(documents + paper_texts, model_name)
+        except ImportError:
+            logger.warning("未安装 sentence-transformers，预过滤改用哈希TF-IDF")
+        except Exception as e:
+            logger.warning(f"嵌入模型计算失败: {str(e)}，预过滤改用哈希TF-IDF")
+    if vectors is None:
+        vectors = hashing_tfidf(documents + paper_texts, int(profile.get("n_features", 2 ** 14)))
+
+    profile_vectors = vectors[:len(documents)]
+    paper_vectors = vectors[len(documents):]
+    return (paper_vectors @ profile_vectors.T).max(axis=1)
+
+
+def prefilter_papers(papers: List[Dict], profile: Dict) -> Tuple[List[Dict], List[Dict]]:
+    """按相似度阈值和/或Top-K预过滤论文，保持原有顺序
+
+    Args:
+        papers: 论文列表
+        profile: 兴趣画像配置，支持的键：
+            description: 研究兴趣描述
+            keywords: 关键词列表
+            seed_papers: 种子论文（标题+摘要）列表
+            threshold: 相似度阈值，低于该值的论文被剔除（默认0.05）
+            top_k: 最多保留的论文数（可选）
+            embedding_model: 本地嵌入模型名称（可选，需安装sentence-transformers）
+
+    Returns:
+        tuple: (保留的论文列表, 被剔除的论文列表)
+    """
+    if not papers:
+        return papers, []
+    if not _profile_documents(profile):
+        logger.warning("预过滤未配置 description/keywords/seed_papers，跳过")
+        return papers, []
+
+    try:
+        import numpy as np
+    except ImportError:
+        # numpy 是项目依赖，只有环境损坏时才会走到这里
+        logger.error("无法导入 numpy，跳过本地预过滤，请重新执行 uv sync")
+        return papers, []
+
+    scores = score_papers(papers, profile)
+    keep = scores >= float(profile.get("threshold", 0.05))
+
+    top_k = profile.get("top_k")
+    if top_k is not None and keep.sum() > top_k:
+        # 稳定排序，得分相同时保留靠前（更新）的论文
+        ranked = np.argsort(-scores, kind="stable")[:top_k]
+        keep = np.zeros(len(papers), dtype=bool)
+        keep[ranked] = True
+
+    kept = [paper for paper, flag in zip(papers, keep) if flag]
+    dropped = [paper for paper, flag in zip(papers, keep) if not flag]
+    logger.info(f"本地预过滤完成，保留 {len(kept)} 篇，剔除 {len(dropped)} 篇"
+                f"（得分范围 {scores.min():.3f} ~ {scores.max():.3f}）")
+    return kept, dropped
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
 Token使用情况查询工具
-用于查询和统计用户的token消耗情况
+用于查询和统计用户的token消耗情况，以及各阶段的耗时分布和吞吐量
 """
 
 import argparse
+from collections import defaultdict
 from datetime import datetime, timedelta
 from database import get_db
 from loguru import logger
@@ -15,6 +16,24 @@ from rich import box
 
 console = Console()
 
+# 性能报告中各阶段的展示顺序和名称，未列出的阶段排在最后
+PERF_STAGES = {
+    "arxiv_fetch": "arXiv抓取",
+    "pdf_download": "PDF下载",
+    "pdf_extract": "PDF解析",
+    "html_download": "HTML下载",
+    "html_extract": "HTML解析",
+    "llm_filter": "LLM过滤",
+    "llm_filter_batch": "LLM批量过滤",
+    "llm_chunk": "LLM分块总结",
+    "llm_summary": "LLM总结",
+    "paper": "单篇论文",
+    "smtp_send": "邮件发送",
+}
+
+# 趋势对比中p95相对前一天变化超过该比例时标色
+REGRESSION_THRESHOLD = 0.2
+
 
 def format_usage_record(record):
     """格式化单条使用记录（使用 rich 表格输出）"""
@@ -42,6 +61,12 @@ def format_usage_record(record):
     table.add_row("输出Token", f"{record['filter_output_tokens']:,}")
     table.add_row("总计Token", f"{record['filter_total_tokens']:,}")
     table.add_row("成本", f"¥{record['filter_cost']:.4f}")
+    if record.get("filter_cache_hits"):
+        table.add_row("缓存命中", f"{record['filter_cache_hits']}")
+        table.add_row(
+            "缓存节省Token",
+            f"{record['filter_cache_saved_input_tokens'] + record['filter_cache_saved_output_tokens']:,}",
+        )
 
     # 生成阶段
     table.add_section()
@@ -50,6 +75,12 @@ def format_usage_record(record):
     table.add_row("输出Token", f"{record['generate_output_tokens']:,}")
     table.add_row("总计Token", f"{record['generate_total_tokens']:,}")
     table.add_row("成本", f"¥{record['generate_cost']:.4f}")
+    if record.get("generate_cache_hits"):
+        table.add_row("缓存命中", f"{record['generate_cache_hits']}")
+        table.add_row(
+            "缓存节省Token",
+            f"{record['generate_cache_saved_input_tokens'] + record['generate_cache_saved_output_tokens']:,}",
+        )
 
     # 总计
     table.add_section()
@@ -238,6 +269,291 @@ def query_all_users_summary(days=None):
         console.print("[yellow]未找到任何记录[/yellow]")
 
 
+def get_date_range(days):
+    """最近N天（含今天）的起止日期"""
+    end_date = datetime.now().strftime("%Y-%m-%d")
+    start_date = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return start_date, end_date
+
+
+def percentile(values, q):
+    """计算百分位数（线性插值），values为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def format_duration(ms):
+    """格式化耗时"""
+    if ms is None:
+        return "-"
+    if ms >= 60000:
+        return f"{ms / 60000:.1f}min"
+    if ms >= 1000:
+        return f"{ms / 1000:.2f}s"
+    return f"{ms:.0f}ms"
+
+
+def format_bytes(count):
+    """格式化字节数"""
+    if not count:
+        return "-"
+    if count >= 1024 * 1024:
+        return f"{count / 1024 / 1024:.1f} MB"
+    return f"{count / 1024:.1f} KB"
+
+
+def format_rate(hits, total):
+    """格式化命中率"""
+    if not total:
+        return "-"
+    return f"{hits / total:.0%}"
+
+
+def stage_sort_key(stage):
+    order = list(PERF_STAGES)
+    return (order.index(stage) if stage in order else len(order), stage)
+
+
+def summarize_stages(rows):
+    """按阶段汇总耗时记录
+
+    缓存命中的记录没有实际耗时，只计入命中次数，不参与百分位数计算。
+
+    Returns:
+        阶段名到统计字典（count/errors/cache_hits/p50/p95/p99/bytes）的映射
+    """
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row["stage"]].append(row)
+
+    stats = {}
+    for stage, stage_rows in grouped.items():
+        durations = [row["duration_ms"] for row in stage_rows if row["outcome"] != "cache_hit"]
+        stats[stage] = {
+            "count": len(stage_rows),
+            "errors": sum(1 for row in stage_rows if row["outcome"] in ("error", "failed")),
+            "cache_hits": sum(1 for row in stage_rows if row["outcome"] == "cache_hit"),
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "p99": percentile(durations, 99),
+            "bytes": sum(row["bytes"] or 0 for row in stage_rows),
+        }
+    return stats
+
+
+def papers_per_minute(rows):
+    """论文吞吐量：处理的论文数除以各次运行中从第一篇开始到最后一篇结束的时间之和"""
+    windows = {}
+    count = 0
+    for row in rows:
+        if row["stage"] != "paper" or row["outcome"] == "error":
+            continue
+        count += 1
+        end = row["started_at"] + row["duration_ms"] / 1000
+        first, last = windows.get(row["run_id"], (row["started_at"], end))
+        windows[row["run_id"]] = (min(first, row["started_at"]), max(last, end))
+    minutes = sum(last - first for first, last in windows.values()) / 60
+    return count / minutes if minutes > 0 else None
+
+
+def load_usage_records(start_date, end_date, user_name=None):
+    """读取日期范围内的token使用记录（用于兴趣过滤缓存命中统计）"""
+    db = get_db()
+    if user_name:
+        return db.get_user_usage_range(user_name, start_date, end_date)
+    records = []
+    day = datetime.strptime(start_date, "%Y-%m-%d")
+    while day.strftime("%Y-%m-%d") <= end_date:
+        records.extend(db.get_all_users_usage_by_date(day.strftime("%Y-%m-%d")))
+        day += timedelta(days=1)
+    return records
+
+
+def print_stage_table(rows, title):
+    """输出各阶段的调用次数、耗时百分位数、失败次数、缓存命中和传输量"""
+    stats = summarize_stages(rows)
+    table = Table(box=box.SIMPLE_HEAVY, title=title)
+    table.add_column("阶段", style="bold cyan", no_wrap=True)
+    table.add_column("次数", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("p99", justify="right")
+    table.add_column("失败", justify="right")
+    table.add_column("缓存命中", justify="right")
+    table.add_column("传输量", justify="right")
+    for stage in sorted(stats, key=stage_sort_key):
+        stage_stats = stats[stage]
+        table.add_row(
+            PERF_STAGES.get(stage, stage),
+            f"{stage_stats['count']}",
+            format_duration(stage_stats["p50"]),
+            format_duration(stage_stats["p95"]),
+            format_duration(stage_stats["p99"]),
+            f"[red]{stage_stats['errors']}[/red]" if stage_stats["errors"] else "0",
+            format_rate(stage_stats["cache_hits"], stage_stats["count"]),
+            format_bytes(stage_stats["bytes"]),
+        )
+    console.print(table)
+
+
+def print_user_throughput(rows, usage_records):
+    """按用户输出论文数、吞吐量、各类缓存命中率和下载量"""
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row["user_name"] or "-"].append(row)
+    # 命中率的分母是实际送入兴趣过滤的论文数（命中数加LLM调用数），不含被预过滤/未配置过滤的论文
+    filter_hits = defaultdict(int)
+    filter_lookups = defaultdict(int)
+    for record in usage_records:
+        filter_hits[record["user_name"]] += record.get("filter_cache_hits") or 0
+        filter_lookups[record["user_name"]] += record.get("filter_cache_lookups") or 0
+
+    table = Table(box=box.SIMPLE_HEAVY, title="按用户统计")
+    table.add_column("用户名", style="bold cyan", no_wrap=True)
+    table.add_column("论文数", justify="right")
+    table.add_column("论文/分钟", justify="right")
+    table.add_column("总结缓存命中", justify="right")
+    table.add_column("PDF缓存命中", justify="right")
+    table.add_column("过滤缓存命中", justify="right")
+    table.add_column("下载量", justify="right")
+    for user_name in sorted(by_user):
+        stats = summarize_stages(by_user[user_name])
+        paper = stats.get("paper", {})
+        pdf = stats.get("pdf_download", {})
+        throughput = papers_per_minute(by_user[user_name])
+        downloaded = sum(stats.get(stage, {}).get("bytes", 0) for stage in ("pdf_download", "html_download"))
+        table.add_row(
+            user_name,
+            f"{paper.get('count', 0)}",
+            f"{throughput:.1f}" if throughput else "-",
+            format_rate(paper.get("cache_hits", 0), paper.get("count", 0)),
+            format_rate(pdf.get("cache_hits", 0), pdf.get("count", 0)),
+            format_rate(filter_hits[user_name], filter_lookups[user_name]),
+            format_bytes(downloaded),
+        )
+    console.print(table)
+
+
+def print_llm_table(metrics):
+    """按调用阶段输出LLM首token时间、总耗时和输出速度"""
+    grouped = defaultdict(list)
+    for metric in metrics:
+        grouped[metric["stage"]].append(metric)
+
+    table = Table(box=box.SIMPLE_HEAVY, title="LLM调用")
+    table.add_column("阶段", style="bold cyan", no_wrap=True)
+    table.add_column("次数", justify="right")
+    table.add_column("首token p50", justify="right")
+    table.add_column("首token p95", justify="right")
+    table.add_column("耗时 p50", justify="right")
+    table.add_column("耗时 p95", justify="right")
+    table.add_column("输出速度 p50", justify="right")
+    table.add_column("超时/失败", justify="right")
+    for stage in sorted(grouped, key=lambda name: stage_sort_key(f"llm_{name}")):
+        stage_metrics = grouped[stage]
+        ttft = [m["ttft_ms"] for m in stage_metrics if m["ttft_ms"] is not None]
+        latency = [m["latency_ms"] for m in stage_metrics if m["status"] == "ok"]
+        speed = percentile([m["tokens_per_sec"] for m in stage_metrics if m["tokens_per_sec"]], 50)
+        timeouts = sum(1 for m in stage_metrics if m["status"] == "timeout")
+        errors = sum(1 for m in stage_metrics if m["status"] == "error")
+        table.add_row(
+            stage,
+            f"{len(stage_metrics)}",
+            format_duration(percentile(ttft, 50)),
+            format_duration(percentile(ttft, 95)),
+            format_duration(percentile(latency, 50)),
+            format_duration(percentile(latency, 95)),
+            f"{speed:.1f} token/s" if speed else "-",
+            f"{timeouts}/{errors}",
+        )
+    console.print(table)
+
+
+def query_perf(days=None, user_name=None):
+    """查询各阶段的耗时百分位数、吞吐量和缓存命中率"""
+    start_date, end_date = get_date_range(days or 1)
+    rows = get_db().get_stage_timings(start_date, end_date, user_name)
+    if not rows:
+        console.print(f"[yellow]未找到 {start_date} 到 {end_date} 的耗时记录[/yellow]")
+        return
+
+    scope = f"【{user_name}】" if user_name else "所有用户"
+    console.print(Panel.fit(f"{scope}从 {start_date} 到 {end_date} 的性能统计", style="bold green"))
+    console.print()
+    print_stage_table(rows, "各阶段耗时")
+    print_user_throughput(rows, load_usage_records(start_date, end_date, user_name))
+    if not user_name:
+        # LLM调用指标不区分用户
+        metrics = get_db().get_llm_call_metrics(start_date, end_date)
+        if metrics:
+            print_llm_table(metrics)
+
+
+def format_trend(current, previous):
+    """格式化p95及相对前一天的变化，变慢超过阈值标红，变快超过阈值标绿"""
+    text = format_duration(current)
+    if current is None or not previous:
+        return text
+    change = (current - previous) / previous
+    if change > REGRESSION_THRESHOLD:
+        return f"{text} [red]↑{change:.0%}[/red]"
+    if change < -REGRESSION_THRESHOLD:
+        return f"{text} [green]↓{-change:.0%}[/green]"
+    return f"{text} [dim]{change:+.0%}[/dim]"
+
+
+def query_perf_trend(days=None, user_name=None):
+    """按天对比关键阶段的p95耗时、吞吐量和缓存命中率，用于发现性能退化"""
+    days = days or 7
+    start_date, end_date = get_date_range(days)
+    rows = get_db().get_stage_timings(start_date, end_date, user_name)
+    if not rows:
+        console.print(f"[yellow]未找到 {start_date} 到 {end_date} 的耗时记录[/yellow]")
+        return
+
+    by_date = defaultdict(list)
+    for row in rows:
+        by_date[row["date"]].append(row)
+
+    trend_stages = ["arxiv_fetch", "pdf_download", "pdf_extract", "llm_filter", "llm_summary"]
+    scope = f"【{user_name}】" if user_name else "所有用户"
+    table = Table(box=box.SIMPLE_HEAVY, title=f"{scope}最近 {days} 天的性能趋势（p95，对比前一天）")
+    table.add_column("日期", style="bold cyan", no_wrap=True)
+    table.add_column("论文数", justify="right")
+    table.add_column("论文/分钟", justify="right")
+    for stage in trend_stages:
+        table.add_column(PERF_STAGES[stage], justify="right")
+    table.add_column("总结缓存命中", justify="right")
+    table.add_column("下载量", justify="right")
+
+    previous = {}
+    for date in sorted(by_date):
+        stats = summarize_stages(by_date[date])
+        paper = stats.get("paper", {})
+        throughput = papers_per_minute(by_date[date])
+        downloaded = sum(stats.get(stage, {}).get("bytes", 0) for stage in ("pdf_download", "html_download"))
+        cells = []
+        for stage in trend_stages:
+            current = stats.get(stage, {}).get("p95")
+            cells.append(format_trend(current, previous.get(stage)))
+            if current is not None:
+                previous[stage] = current
+        table.add_row(
+            date,
+            f"{paper.get('count', 0)}",
+            f"{throughput:.1f}" if throughput else "-",
+            *cells,
+            format_rate(paper.get("cache_hits", 0), paper.get("count", 0)),
+            format_bytes(downloaded),
+        )
+    console.print(table)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Token使用情况查询工具",
@@ -258,6 +574,15 @@ def main():
 
   # 查询所有用户最近30天的汇总
   python query_usage.py --summary --days 30
+
+  # 查询今天各阶段的耗时百分位数、吞吐量和缓存命中率
+  python query_usage.py --perf
+
+  # 查询指定用户最近7天的性能统计
+  python query_usage.py --perf --user "金融经济研究组" --days 7
+
+  # 按天对比最近14天的性能趋势
+  python query_usage.py --trend --days 14
         """,
     )
 
@@ -270,6 +595,14 @@ def main():
     parser.add_argument(
         "--summary", action="store_true", help="查询所有用户的汇总统计"
     )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="查询各阶段耗时百分位数、吞吐量和缓存命中率（默认今天，可配合 --user、--days）",
+    )
+    parser.add_argument(
+        "--trend", action="store_true",
+        help="按天对比各阶段的p95耗时和吞吐量（默认最近7天，可配合 --user、--days）",
+    )
 
     args = parser.parse_args()
 
@@ -277,7 +610,11 @@ def main():
     logger.remove()
 
     try:
-        if args.user:
+        if args.perf:
+            query_perf(args.days, args.user)
+        elif args.trend:
+            query_perf_trend(args.days, args.user)
+        elif args.user:
             if args.today:
                 query_user_today(args.user)
             elif args.days:
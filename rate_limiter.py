@@ -0,0 +1,200 @@
+"""
+LLM限流模块 - 按每分钟请求数/token数限速，按AIMD自适应调整并发，并对429和5xx错误自动重试
+"""
+import time
+import email.utils
+import random
+import threading
+from typing import Optional
+
+import httpx
+import openai
+from loguru import logger
+
+
+class TokenBucket:
+    """令牌桶（线程安全），容量为一分钟的配额，按秒匀速补充
+
+    允许透支：取令牌时立即扣除并返回需要等待的秒数，使并发的请求按到达顺序排队。
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预留令牌，返回需要等待的秒数"""
+        # 单次请求超过桶容量时按容量计，避免永远无法满足
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, delta: float):
+        """按实际消耗修正预留量：delta为正表示多扣，为负表示退还"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrency:
+    """AIMD自适应并发上限（线程安全）
+
+    每次成功调用后并发上限增加 1/当前上限（约每轮增加1），遇到限流时减半；
+    服务端返回 Retry-After 时，在该时间之前暂停发出新请求。
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def try_acquire(self) -> float:
+        """尝试占用一个并发名额
+
+        Returns:
+            0表示占用成功，否则为建议的等待秒数
+        """
+        with self.condition:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                return pause
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return 0.0
+            return 0.05
+
+    def acquire(self):
+        """阻塞直到占用一个并发名额"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            with self.condition:
+                self.condition.wait(timeout=wait)
+
+    def release(self, success: bool):
+        """释放名额；成功时加性增大并发上限"""
+        with self.condition:
+            self.in_flight -= 1
+            if success and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def on_throttle(self, retry_after: Optional[float]):
+        """遇到限流：并发上限减半（短时间内多次限流只减一次），并按 Retry-After 暂停"""
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease > 1.0:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+                logger.warning(f"LLM请求被限流，并发上限降为 {int(self.limit)}")
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+
+class LLMRateLimiter:
+    """LLM请求的共享限流器：RPM/TPM令牌桶 + AIMD并发 + 重试退避"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None,
+                 initial_concurrency=4, max_concurrency=16, max_retries=5):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, max_concurrency)
+        self.max_retries = max_retries
+
+    def reserve(self, estimated_tokens: int) -> float:
+        """从RPM和TPM令牌桶中预留配额，返回需要等待的秒数"""
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """请求完成后按实际token数修正TPM令牌桶"""
+        if self.token_bucket:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """计算第attempt次重试前的等待秒数：优先使用 Retry-After，否则指数退避加随机抖动"""
+        if retry_after:
+            return retry_after
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """解析响应头中的 retry-after-ms / Retry-After（秒数或HTTP日期）"""
+    if headers is None:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value:
+            return float(value) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def classify_error(error: Exception):
+    """判断异常是否可重试
+
+    Returns:
+        tuple: (是否可重试, 是否为限流, Retry-After秒数)
+    """
+    if isinstance(error, openai.RateLimitError):
+        return True, True, parse_retry_after(error.response.headers)
+    if isinstance(error, openai.APIStatusError):
+        retryable = error.status_code >= 500 or error.status_code in (408, 409)
+        return retryable, False, parse_retry_after(error.response.headers)
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        # 包括连接失败、超时和流式读取中断
+        return True, False, None
+    return False, False, None
+
+
+# 全局限流器实例
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> LLMRateLimiter:
+    """获取进程内共享的LLM限流器（线程安全），配置读取自 AI_CONFIG"""
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            from config import AI_CONFIG
+            from resource_limits import get_limit
+
+            max_concurrency = AI_CONFIG.get("max_concurrency", 16)
+            _limiter = LLMRateLimiter(
+                requests_per_minute=AI_CONFIG.get("requests_per_minute"),
+                tokens_per_minute=AI_CONFIG.get("tokens_per_minute"),
+                initial_concurrency=min(get_limit("llm"), max_concurrency),
+                max_concurrency=max_concurrency,
+                max_retries=AI_CONFIG.get("max_retries", 5),
+            )
+        return _limiter
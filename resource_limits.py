@@ -0,0 +1,41 @@
+"""
+资源并发限制模块 - 为论文下载、PDF解析、LLM调用和arXiv API分别提供进程内共享的并发上限
+"""
+import threading
+
+# 各类资源的默认并发上限，可通过 GENERAL_CONFIG["concurrency_limits"] 覆盖
+DEFAULT_LIMITS = {
+    "download": 4,  # PDF/HTML下载
+    "extract": 2,  # PDF文本解析（CPU密集，线程内受GIL限制，并发过高无益）
+    "llm": 4,  # LLM请求的初始并发，运行中由 rate_limiter 按限流情况自适应调整
+    "arxiv": 1,  # arXiv API请求（官方要求单连接、请求间隔3秒）
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limit(resource: str) -> int:
+    """读取指定资源的并发上限"""
+    from config import GENERAL_CONFIG
+    limits = GENERAL_CONFIG.get("concurrency_limits", {})
+    return max(1, int(limits.get(resource, DEFAULT_LIMITS[resource])))
+
+
+def get_limiter(resource: str) -> threading.BoundedSemaphore:
+    """获取指定资源的全局信号量（线程安全）
+
+    用法：
+        with get_limiter("download"):
+            ...
+
+    Args:
+        resource: 资源名称，取值见 DEFAULT_LIMITS
+
+    Returns:
+        该资源共享的信号量
+    """
+    with _limiters_lock:
+        if resource not in _limiters:
+            _limiters[resource] = threading.BoundedSemaphore(get_limit(resource))
+        return _limiters[resource]
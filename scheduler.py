@@ -0,0 +1,157 @@
+"""
+调度模块 - 多个用户并行处理时，按用户轮转分配工作线程，保证公平；
+并按缓存键合并多个用户对同一篇论文的重复工作
+"""
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from loguru import logger
+
+
+class FairShareExecutor:
+    """按提交者轮转调度的线程池
+
+    每个提交者（用户）有独立的任务队列，空闲的工作线程依次从各队列头部取任务，
+    论文多的用户不会占满所有线程而让其他用户一直排队。同一用户的任务按提交顺序执行。
+    """
+
+    def __init__(self, max_workers: int, name: str = "fair"):
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, owner: str, fn, *args, **kwargs) -> Future:
+        """提交任务
+
+        Args:
+            owner: 任务所属的用户，用于轮转调度
+            fn: 要执行的函数
+
+        Returns:
+            concurrent.futures.Future
+        """
+        future = Future()
+        # 任务在提交者的上下文中执行，保留当前用户等上下文变量
+        context = contextvars.copy_context()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError(f"调度器 {self.name} 已关闭")
+            self._queues.setdefault(owner, deque()).append((future, context, fn, args, kwargs))
+            # 没有空闲线程时按需增加工作线程
+            if self._idle == 0 and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{len(self._threads)}",
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify()
+        return future
+
+    def _next_task(self):
+        """轮转取出下一个任务：取最久未被服务的用户的队首任务，然后把该用户移到末尾"""
+        for owner in list(self._queues):
+            queue = self._queues[owner]
+            if not queue:
+                del self._queues[owner]
+                continue
+            task = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            return task
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                    task = self._next_task()
+
+            future, context, fn, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(context.run(fn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        """停止接收新任务，已排队的任务执行完后工作线程退出"""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+
+
+# 全局调度器实例，按阶段区分
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_fair_executor(stage: str, max_workers: int) -> FairShareExecutor:
+    """获取指定阶段的共享公平调度线程池（线程安全），首次创建时确定线程数"""
+    with _executors_lock:
+        if stage not in _executors:
+            _executors[stage] = FairShareExecutor(max_workers, name=stage)
+            logger.info(f"创建共享调度线程池 {stage}，线程数: {max_workers}")
+        return _executors[stage]
+
+
+class KeyedLock:
+    """按键加锁：同一键的调用方依次执行，不同键互不影响
+
+    用于合并多个用户对同一篇论文的重复工作：第一个调用方持锁完成工作并写入缓存，
+    其他调用方等锁释放后重新查缓存即可直接命中。没有调用方持有或等待的键会被移除。
+    键为None时不加锁。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # 键 -> [锁, 持有和等待的调用方数]
+
+    def acquire(self, key, blocking: bool = True) -> bool:
+        """获取键对应的锁，blocking为False时锁被占用立即返回False"""
+        if key is None:
+            return True
+        with self._lock:
+            entry = self._entries.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        if entry[0].acquire(blocking):
+            return True
+        self._unref(key, entry)
+        return False
+
+    def release(self, key):
+        """释放键对应的锁"""
+        if key is None:
+            return
+        with self._lock:
+            entry = self._entries[key]
+        entry[0].release()
+        self._unref(key, entry)
+
+    def _unref(self, key, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entries[key]
+
+    @contextmanager
+    def hold(self, key):
+        """在with块内持有键对应的锁"""
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
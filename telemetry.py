@@ -0,0 +1,221 @@
+"""
+性能追踪模块 - 记录各阶段（arXiv抓取、下载、解析、LLM、SMTP）每次调用的耗时、字节数和结果，
+写入 stage_timings 表，并为每次运行导出 Chrome Trace 格式的时间线（chrome://tracing 或 Perfetto 打开）
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+
+# 当前正在处理的用户，线程池/协程中的调用据此归属到用户
+_current_user = contextvars.ContextVar("telemetry_user", default=None)
+# 当前所在的阶段，下载等底层函数据此累加字节数
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+# 待写入数据库的记录和当前运行的时间线
+_pending = []
+_run = None
+_lock = threading.Lock()
+
+
+class Span:
+    """一次阶段调用的记录"""
+
+    def __init__(self, stage: str, item: Optional[str], user: Optional[str]):
+        self.stage = stage
+        self.item = item
+        self.user = user
+        self.start = time.time()
+        self.duration = 0.0
+        self.bytes = 0
+        self.outcome = "ok"
+        self.thread = _thread_label()
+
+
+def _thread_label() -> str:
+    """时间线中的泳道名称：协程中用任务名，否则用线程名"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return task.get_name()
+    return threading.current_thread().name
+
+
+def set_user(user_name: Optional[str]):
+    """设置当前上下文所属的用户（线程池任务和子协程会继承）"""
+    _current_user.set(user_name)
+
+
+def current_user() -> Optional[str]:
+    """当前上下文所属的用户"""
+    return _current_user.get()
+
+
+def add_bytes(count: int):
+    """为当前阶段累加传输的字节数，不在任何阶段中时忽略"""
+    span = _current_span.get()
+    if span is not None:
+        span.bytes += count
+
+
+@contextmanager
+def stage(name: str, item: Optional[str] = None, user: Optional[str] = None):
+    """记录一次阶段调用
+
+    用法::
+
+        with stage("pdf_download", url) as span:
+            ...
+            span.outcome = "failed"
+
+    代码块抛出异常时结果记为 error；生成器被提前关闭（GeneratorExit）不算失败。
+
+    Args:
+        name: 阶段名称
+        item: 调用对象（论文ID、URL等）
+        user: 所属用户，默认取当前上下文的用户
+    """
+    span = Span(name, item, user or _current_user.get())
+    token = _current_span.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except Exception:
+        span.outcome = "error"
+        raise
+    finally:
+        span.duration = time.perf_counter() - started
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # 生成器在其他上下文中被关闭时无法还原，直接清空
+            _current_span.set(None)
+        _record(span)
+
+
+def record(name: str, item: Optional[str] = None, outcome: str = "ok", user: Optional[str] = None):
+    """记录一次没有耗时的事件（如缓存命中）"""
+    span = Span(name, item, user or _current_user.get())
+    span.outcome = outcome
+    _record(span)
+
+
+def _record(span: Span):
+    with _lock:
+        run_id = _run["id"] if _run else None
+        _pending.append((
+            run_id, datetime.fromtimestamp(span.start).strftime("%Y-%m-%d"), span.stage, span.user,
+            span.item, span.start, span.duration * 1000, span.bytes, span.outcome, span.thread,
+        ))
+        if _run is not None:
+            _run["spans"].append(span)
+
+
+def flush():
+    """把缓存的阶段记录写入数据库，写入失败不影响主流程"""
+    from database import get_db
+
+    with _lock:
+        rows = list(_pending)
+        _pending.clear()
+    if not rows:
+        return
+    try:
+        get_db().record_stage_timings(rows)
+    except Exception as e:
+        logger.warning(f"写入阶段耗时记录失败: {str(e)}")
+
+
+def start_run() -> str:
+    """开始一次运行，之后记录的阶段会归入本次运行的时间线
+
+    Returns:
+        运行ID
+    """
+    global _run
+
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    with _lock:
+        _run = {"id": run_id, "start": time.time(), "spans": []}
+    return run_id
+
+
+def finish_run() -> Optional[str]:
+    """结束当前运行：写入阶段记录，导出时间线并输出各阶段耗时汇总
+
+    Returns:
+        时间线文件路径，未开始运行或导出失败时返回None
+    """
+    global _run
+    from config import GENERAL_CONFIG
+
+    with _lock:
+        run, _run = _run, None
+    flush()
+    if run is None:
+        return None
+
+    log_stage_summary(run["spans"])
+    trace_dir = GENERAL_CONFIG.get("trace_dir", "traces")
+    if not trace_dir:
+        return None
+    path = os.path.join(trace_dir, f"run-{run['id']}.json")
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(build_chrome_trace(run["spans"], run["start"], time.time()), f, ensure_ascii=False)
+        logger.info(f"本次运行的时间线已导出到 {path}")
+        return path
+    except OSError as e:
+        logger.warning(f"导出时间线失败: {str(e)}")
+        return None
+
+
+def build_chrome_trace(spans, run_start: float, run_end: float) -> dict:
+    """把阶段记录转换为 Chrome Trace Event 格式
+
+    每个线程/协程一条泳道，阶段为完整事件（ph=X），时间单位为微秒。
+    """
+    lanes = {"run": 0}
+    events = [{
+        "name": "daily_job", "cat": "run", "ph": "X", "pid": 1, "tid": 0,
+        "ts": 0, "dur": (run_end - run_start) * 1e6,
+    }]
+    for span in spans:
+        tid = lanes.setdefault(span.thread, len(lanes))
+        args = {"outcome": span.outcome}
+        if span.item:
+            args["item"] = span.item
+        if span.user:
+            args["user"] = span.user
+        if span.bytes:
+            args["bytes"] = span.bytes
+        events.append({
+            "name": span.stage, "cat": span.stage, "ph": "X", "pid": 1, "tid": tid,
+            "ts": (span.start - run_start) * 1e6, "dur": span.duration * 1e6, "args": args,
+        })
+    for lane, tid in lanes.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def log_stage_summary(spans):
+    """按阶段输出调用次数、累计耗时和字节数"""
+    totals = {}
+    for span in spans:
+        entry = totals.setdefault(span.stage, [0, 0.0, 0, 0])
+        entry[0] += 1
+        entry[1] += span.duration
+        entry[2] += span.bytes
+        entry[3] += span.outcome not in ("ok", "cache_hit")
+    for name, (count, seconds, byte_count, failures) in sorted(totals.items(), key=lambda x: -x[1][1]):
+        logger.info(f"阶段 {name}: {count} 次，累计 {seconds:.1f}s，{byte_count / 1024 / 1024:.1f} MB，失败 {failures} 次")
@@ -0,0 +1,375 @@
+"""
+文本预算模块 - 以模型token计量论文正文长度，从文本流中按预算取用，够用即停止解析；
+按章节识别论文结构，预算不足时优先保留信息量大的章节
+"""
+import re
+import threading
+from typing import Iterator, List, Tuple
+
+from loguru import logger
+
+# 默认预算约等于原先的129024字符上限（英文约4字符/token）
+DEFAULT_TEXT_BUDGET_TOKENS = 32000
+# map_reduce/auto 模式下提取阶段的默认预算，足以容纳绝大多数论文全文
+DEFAULT_MAP_REDUCE_EXTRACT_TOKENS = 200000
+
+_CJK_RE = re.compile(r"[一-鿿]")
+
+# tiktoken编码器加载较慢，全局只加载一次
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """获取tiktoken编码器，未安装tiktoken时返回None（使用估算）"""
+    global _encoder, _encoder_loaded
+
+    with _encoder_lock:
+        if not _encoder_loaded:
+            _encoder_loaded = True
+            try:
+                import tiktoken
+                from config import AI_CONFIG
+                try:
+                    _encoder = tiktoken.encoding_for_model(AI_CONFIG["model"])
+                except KeyError:
+                    # 非OpenAI模型没有对应编码，用通用编码近似
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+            except ImportError:
+                # tiktoken 是项目依赖，只有环境损坏时才会走到这里
+                logger.warning("无法导入 tiktoken，按字符数保守估算token，请重新执行 uv sync")
+            except Exception as e:
+                logger.warning(f"加载tiktoken编码失败: {str(e)}，按字符数估算token")
+        return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数：优先用tiktoken
+
+    tiktoken不可用（如离线时无法下载编码文件）时保守估算，宁可多算也不让请求超长：
+    中文1字1token，其余非ASCII字符（公式符号、希腊字母等）2字符1token，ASCII字符3字符1token。
+    """
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    other = len(text) - cjk - ascii_chars
+    return cjk + (other + 1) // 2 + (ascii_chars + 2) // 3
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截取文本开头不超过 max_tokens 个token的部分"""
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder()
+    if encoder is not None:
+        tokens = encoder.encode(text, disallowed_special=())
+        return encoder.decode(tokens[:max_tokens])
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    return text[:len(text) * max_tokens // total]
+
+
+def get_text_budget(prompt_template: str = None) -> int:
+    """计算正文token预算
+
+    取 GENERAL_CONFIG 中的 text_budget_tokens；如果 AI_CONFIG 配置了 context_window，
+    还要扣除提示词模板本身和预留的输出token，保证请求不超出模型上下文。
+
+    Args:
+        prompt_template: 可选的提示词模板（含{text}占位符）
+    """
+    from config import AI_CONFIG, GENERAL_CONFIG
+
+    budget = int(GENERAL_CONFIG.get("text_budget_tokens", DEFAULT_TEXT_BUDGET_TOKENS))
+    context_window = AI_CONFIG.get("context_window")
+    if context_window:
+        reserved = AI_CONFIG.get("max_output_tokens", 4096)
+        if prompt_template:
+            reserved += count_tokens(prompt_template.replace("{text}", ""))
+        budget = min(budget, int(context_window) - reserved)
+    return max(budget, 0)
+
+
+def get_extract_budget() -> int:
+    """提取阶段的token预算：正文预算乘以超额系数，为按章节取舍留出余量
+
+    map_reduce/auto 模式下长文会分块总结，改用 map_reduce_extract_tokens（不小于前者），
+    超出模型上下文的论文不会在分块之前就被截断。
+    """
+    from config import GENERAL_CONFIG
+    factor = GENERAL_CONFIG.get("text_overfetch_factor", 2)
+    budget = int(get_text_budget() * max(1, factor))
+    if GENERAL_CONFIG.get("summary_mode", "single") in ("map_reduce", "auto"):
+        budget = max(budget, int(GENERAL_CONFIG.get("map_reduce_extract_tokens",
+                                                    DEFAULT_MAP_REDUCE_EXTRACT_TOKENS)))
+    return budget
+
+
+def read_within_budget(chunks: Iterator[str], budget: int = None) -> str:
+    """从文本流中按顺序取用文本，达到token预算后停止拉取并关闭文本流
+
+    关闭生成器会触发其清理逻辑（如取消尚未开始的解析任务），剩余页面不再解析。
+
+    Args:
+        chunks: 文本片段的迭代器（通常是生成器）
+        budget: token预算，不传则使用 get_text_budget()
+
+    Returns:
+        拼接后的文本，token数不超过预算
+    """
+    if budget is None:
+        budget = get_text_budget()
+
+    parts = []
+    used = 0
+    try:
+        for chunk in chunks:
+            tokens = count_tokens(chunk)
+            if used + tokens > budget:
+                parts.append(truncate_to_tokens(chunk, budget - used))
+                used = budget
+                logger.info(f"文本达到 {budget} token预算，停止解析剩余内容")
+                break
+            parts.append(chunk)
+            used += tokens
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return "".join(parts)
+
+
+# 章节类型及标题关键词（英文标题不区分大小写）
+_SECTION_KEYWORDS = [
+    ("abstract", r"abstract|摘\s*要"),
+    ("introduction", r"introduction|引\s*言|绪\s*论"),
+    ("related", r"related\s+works?|background|preliminar(?:y|ies)|相关工作"),
+    ("method", r"methods?|methodology|approach|proposed\s+method|our\s+method|方\s*法"),
+    ("experiments", r"experiments?|experimental\s+(?:setup|results)|evaluation|results|实\s*验"),
+    ("discussion", r"discussion|limitations?|讨\s*论"),
+    ("conclusion", r"conclusions?|concluding\s+remarks|结\s*论|总\s*结"),
+    ("references", r"references|bibliography|参考文献"),
+    ("appendix", r"appendi(?:x|ces)|supplementary\s+materials?|附\s*录"),
+]
+
+# 预算不足时的章节保留顺序，未列出的章节（如参考文献）不保留；front 为第一个标题之前的标题/作者/摘要部分
+DEFAULT_SECTION_PRIORITY = [
+    "front", "abstract", "conclusion", "introduction", "method",
+    "experiments", "discussion", "related", "appendix",
+]
+
+# 标题行：可选的章节编号（1 / 1. / IV. / A.）加标题文字，子章节（3.1）不作为分界
+_HEADING_RE = re.compile(
+    r"^\s*(?:(?P<num>\d+|[IVX]+|[A-H])\.?\s+)?(?P<title>[^\d\s][^\n]{0,60}?)\s*$"
+)
+_KEYWORD_RES = [
+    (kind, re.compile(rf"(?:{pattern})\b", re.IGNORECASE)) for kind, pattern in _SECTION_KEYWORDS
+]
+# 带字母编号的附录标题，如 "Appendix A: Proofs"、"APPENDIX B"
+_LETTERED_APPENDIX_RE = re.compile(r"appendix\s+[A-Z]\b[.:：]?(?:\s+\S.*)?$", re.IGNORECASE)
+
+
+def classify_heading(line: str):
+    """判断一行是否为章节标题
+
+    带编号的行只要求标题以关键词开头（如 "5 Conclusion and Future Work"），
+    不带编号的行要求整行就是关键词（如 "References"），以免误判正文。
+
+    Returns:
+        章节类型，不是标题时返回None
+    """
+    if len(line) > 80:
+        return None
+    match = _HEADING_RE.match(line)
+    if not match:
+        return None
+    title = match.group("title").strip().rstrip(":：")
+    # 正文中被断行的句子通常以小写开头（如 "A method for ..."）
+    if not title or title[0].islower():
+        return None
+    if _LETTERED_APPENDIX_RE.match(title) and not title.endswith((".", ",")):
+        return "appendix"
+    for kind, keyword_re in _KEYWORD_RES:
+        keyword_match = keyword_re.match(title)
+        if keyword_match is None:
+            continue
+        if match.group("num") or keyword_match.end() == len(title):
+            return kind
+    return None
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """按章节标题切分论文文本
+
+    Returns:
+        按原文顺序排列的 (章节类型, 章节文本) 列表，第一个标题之前的内容类型为 front
+    """
+    sections = []
+    kind = "front"
+    lines = []
+    for line in text.splitlines(keepends=True):
+        heading = classify_heading(line)
+        if heading is not None:
+            if lines:
+                sections.append((kind, "".join(lines)))
+            kind = heading
+            lines = []
+        lines.append(line)
+    if lines:
+        sections.append((kind, "".join(lines)))
+    return sections
+
+
+# 参考文献之后附录的开头：附录标题常带字母编号（"Appendix A: Proofs"），不一定能被 classify_heading 识别
+_APPENDIX_START_RE = re.compile(r"^\s*(?:appendi(?:x|ces)|supplementary\s+materials?|附\s*录)\b", re.IGNORECASE)
+
+
+def _ends_references(line: str) -> bool:
+    """参考文献章节中遇到其他章节（通常是附录）的标题时，参考文献结束"""
+    if len(line) > 80:
+        return False
+    heading = classify_heading(line)
+    if heading is not None:
+        return heading != "references"
+    return _APPENDIX_START_RE.match(line) is not None
+
+
+def skip_references(chunks: Iterator[str], min_chars: int = 2000) -> Iterator[str]:
+    """从文本流中去掉参考文献章节，其后的附录照常产出
+
+    参考文献不计入提取预算；附录由 read_within_budget 按预算取用，超出正文预算时再按章节优先级取舍。
+    已产出的文本不足 min_chars 时不识别参考文献，避免把目录中的 "References" 当成正文结尾。
+    """
+    produced = 0
+    in_references = False
+    try:
+        for chunk in chunks:
+            if produced < min_chars and not in_references:
+                produced += len(chunk)
+                yield chunk
+                continue
+            kept = []
+            for line in chunk.splitlines(keepends=True):
+                if in_references:
+                    if not _ends_references(line):
+                        continue
+                    in_references = False
+                    logger.info("参考文献章节结束，继续读取附录")
+                elif classify_heading(line) == "references":
+                    in_references = True
+                    logger.info("遇到参考文献章节，跳过参考文献")
+                    continue
+                kept.append(line)
+            if kept:
+                text = "".join(kept)
+                produced += len(text)
+                yield text
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def fit_text_to_budget(text: str, budget: int) -> str:
+    """按章节优先级把文本压缩到token预算内
+
+    识别到的章节标题少于两个时退化为截取开头；否则按 section_priority 顺序依次分配预算，
+    最后一个分到预算的章节截取开头，输出仍保持原文顺序，被省略的位置用 [...] 标记。
+
+    Args:
+        text: 论文文本
+        budget: token预算
+
+    Returns:
+        不超过预算的文本
+    """
+    from config import GENERAL_CONFIG
+
+    if count_tokens(text) <= budget:
+        return text
+
+    sections = split_sections(text)
+    if len(sections) < 3:
+        logger.info("未识别到足够的章节结构，按顺序截取开头")
+        return truncate_to_tokens(text, budget)
+
+    priority = GENERAL_CONFIG.get("section_priority", DEFAULT_SECTION_PRIORITY)
+    sizes = [count_tokens(section_text) for _, section_text in sections]
+    allocated = [0] * len(sections)
+    # 为省略标记预留少量token
+    remaining = budget - 2 * len(sections)
+    for wanted in priority:
+        for index, (kind, _) in enumerate(sections):
+            if kind != wanted or remaining <= 0:
+                continue
+            allocated[index] = min(sizes[index], remaining)
+            remaining -= allocated[index]
+
+    parts = []
+    for (kind, section_text), size, tokens in zip(sections, sizes, allocated):
+        if tokens == size:
+            parts.append(section_text)
+        elif tokens > 0:
+            parts.append(truncate_to_tokens(section_text, tokens) + "\n[...]\n")
+        elif not parts or not parts[-1].endswith("[...]\n"):
+            parts.append("[...]\n")
+
+    kept = [kind for (kind, _), tokens in zip(sections, allocated) if tokens]
+    logger.info(f"正文超出 {budget} token预算，按章节优先级保留: {', '.join(dict.fromkeys(kept))}")
+    return "".join(parts)
+
+
+def split_into_chunks(text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """按行把文本切成带重叠的块，每块不超过 chunk_tokens 个token
+
+    相邻两块之间重复前一块末尾约 overlap_tokens 个token的行，避免跨块的段落被拆散后丢失上下文；
+    超过块大小的单行会被硬切。
+
+    Args:
+        text: 论文文本
+        chunk_tokens: 每块的token上限
+        overlap_tokens: 相邻块的重叠token数
+
+    Returns:
+        文本块列表
+    """
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    lines = []
+    for line in text.splitlines(keepends=True):
+        while count_tokens(line) > chunk_tokens:
+            head = truncate_to_tokens(line, chunk_tokens)
+            if not head:
+                break
+            lines.append(head)
+            line = line[len(head):]
+        if line:
+            lines.append(line)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for line in lines:
+        tokens = count_tokens(line)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append("".join(line_text for line_text, _ in current))
+            # 从当前块末尾回溯出重叠部分，作为下一块的开头；重叠部分计入下一块的上限，
+            # 并给即将放入的这一行留出空间
+            carry_limit = min(overlap_tokens, chunk_tokens - tokens)
+            carried = []
+            carried_tokens = 0
+            for line_text, line_tokens in reversed(current):
+                if carried_tokens + line_tokens > carry_limit:
+                    break
+                carried.insert(0, (line_text, line_tokens))
+                carried_tokens += line_tokens
+            current = carried
+            current_tokens = carried_tokens
+        current.append((line, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(line_text for line_text, _ in current))
+    return chunks